@@ -2,31 +2,73 @@
 This module includes the path finding algorithm and the textual visualization of paths. Entry point is `find_word_path`.
 """
 
-from typing import Any, Dict, Iterable, List, Union
+from collections import OrderedDict, deque
+import heapq
+import itertools
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple, Union
 import logging
 
-from utils import ConceptNet, normalize_input
+import numpy as np
+
+from utils import (
+    ConceptNet, CSRAdjacency, graph_fingerprint, neighbour_weights, normalize_input, ranked_by_weight,
+    unit_weights
+)
 from renderer import render_path_brief
 
 
 def search_shortest_path(
     start_idx: int,
     end_idx: int,
-    adjacency_lists: Dict[int, Iterable[int]],
-    max_path_len,
-) -> list:
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    max_path_len: int =3,
+    bidirectional: bool =False,
+    max_expansions: int =None,
+    max_neighbours: int =None,
+    return_truncated: bool =False,
+    budget: "ExpansionBudget" =None,
+) -> Union[list, Tuple[list, bool]]:
     """the actual implementation of a BFS. This function is completely agnostic about ConceptNet, 
-    it just works with adjacency lists of integers."""
+    it just works with adjacency lists of integers (a dict of iterables or a `CSRAdjacency`).
+
+    If `bidirectional` is set, the search is delegated to `search_shortest_path_bidirectional`, 
+    which returns a path of the same length (but possibly a different one if there are several 
+    shortest paths).
+
+    To bound the latency of searches through hubs, `max_expansions` limits the number of nodes 
+    whose neighbours are visited and `max_neighbours` limits the number of neighbours visited per 
+    node. Neighbours are taken in the order of `adjacency_lists`, use 
+    `utils.rank_neighbours_by_weight` to visit the highest-weight neighbours first. If 
+    `return_truncated` is set, a tuple (path, truncated) is returned, where truncated tells whether 
+    one of the limits was hit (and the result might not be the shortest path or a path was missed).
+    Instead of the limits, an `ExpansionBudget` can be passed as `budget`, e.g. to share one budget 
+    and deadline between several searches.
+    """
 
-    queue = [
+    if budget is None:
+        budget = ExpansionBudget(max_expansions, max_neighbours)
+
+    if bidirectional:
+        path = _search_bidirectional(start_idx, end_idx, adjacency_lists, max_path_len, budget)
+        return (path, budget.truncated) if return_truncated else path
+
+    queue = deque([
         (start_idx, 0)
-    ]  # nodes to be processed (tuple of node and path length to start node)
+    ])  # nodes to be processed (tuple of node and path length to start node)
     predecessor_idx = {
         start_idx: -1
     }  # visited nodes, mapping each node to the idx of its predecessor
 
+    path = []
+
     while queue:
-        node, path_len = queue.pop(0)
+        node, path_len = queue.popleft()
 
         #logging.debug(f"Processing {node} (path len {path_len})")
 
@@ -34,18 +76,17 @@ def search_shortest_path(
 
             #logging.debug("  Final node, building path")
 
-            # build path in reverse
-            path = [node]
+            path = _build_path(predecessor_idx, node)
+            break
 
-            pred = predecessor_idx[node]
-            while pred != -1:
-                #logging.debug(f"    {pred}")
-                path.insert(0, pred)
-                pred = predecessor_idx[pred]
+        if path_len + 1 >= max_path_len:
+            # neighbours would not be queued anyway
+            continue
 
-            return path
+        if budget.exhausted():
+            break
 
-        for neighbour in adjacency_lists[node]:
+        for neighbour in budget.neighbours(adjacency_lists, node):
             if neighbour in predecessor_idx:
                 continue
 
@@ -53,18 +94,640 @@ def search_shortest_path(
 
             predecessor_idx[neighbour] = node
 
-            if path_len + 1 < max_path_len:
-                #logging.debug("   Adding node to queue")
-                queue.append((neighbour, path_len + 1))
+            #logging.debug("   Adding node to queue")
+            queue.append((neighbour, path_len + 1))
+
+    return (path, budget.truncated) if return_truncated else path
+
+
+def search_shortest_path_bidirectional(
+    start_idx: int,
+    end_idx: int,
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    max_path_len: int =3,
+) -> list:
+    """Bidirectional BFS with the same semantics as `search_shortest_path` (`max_path_len` is the 
+    maximal number of nodes in the path). Both sides are expanded level by level, always the side 
+    with the smaller frontier first, so hubs close to one of the terms are expanded only if 
+    necessary. Assumes an undirected graph, as ConceptNet is represented in `adjacency_lists`."""
+
+    return _search_bidirectional(
+        start_idx, end_idx, adjacency_lists, max_path_len, ExpansionBudget()
+    )
+
+
+def _search_bidirectional(
+    start_idx: int, end_idx: int, adjacency_lists, max_path_len: int, budget: "ExpansionBudget"
+) -> list:
+
+    if start_idx == end_idx:
+        return [start_idx]
+
+    max_edges = max_path_len - 1
+
+    forward_pred = {start_idx: -1}
+    backward_pred = {end_idx: -1}
+    forward_frontier = [start_idx]
+    backward_frontier = [end_idx]
+    forward_depth = backward_depth = 0
+
+    while forward_frontier and backward_frontier and forward_depth + backward_depth < max_edges:
+
+        if budget.exhausted():
+            break
+
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meeting = _expand_level(
+                forward_frontier, adjacency_lists, forward_pred, backward_pred, budget
+            )
+            forward_depth += 1
+        else:
+            backward_frontier, meeting = _expand_level(
+                backward_frontier, adjacency_lists, backward_pred, forward_pred, budget
+            )
+            backward_depth += 1
+
+        if meeting != -1:
+            path = _build_path(forward_pred, meeting)
+
+            node = backward_pred[meeting]
+            while node != -1:
+                path.append(node)
+                node = backward_pred[node]
+
+            return path
 
     return []
 
 
+class ExpansionBudget:
+    """Bookkeeping for the optional limits of `search_shortest_path` and `search_top_k_paths`: 
+    number of node expansions, neighbours per node and a deadline (a `time.monotonic()` timestamp). 
+    One budget can be passed to several searches, they then share the expansions and the deadline.
+
+    Attributes
+    ----------
+    truncated:
+        whether one of the limits was hit
+    """
+
+    def __init__(self, max_expansions: int =None, max_neighbours: int =None, deadline: float =None):
+        self.remaining = math.inf if max_expansions is None else max_expansions
+        self.max_neighbours = max_neighbours
+        self.deadline = deadline
+        self.truncated = False
+
+    def exhausted(self) -> bool:
+        """whether the search has to stop, checked before every expansion."""
+
+        if self.remaining <= 0 or (self.deadline is not None and time.monotonic() >= self.deadline):
+            self.truncated = True
+            return True
+        return False
+
+    def neighbours(self, adjacency_lists, node: int) -> Iterable[int]:
+        """neighbours of `node`, capped at `max_neighbours`. Counts as one expansion."""
+
+        self.remaining -= 1
+
+        if self.max_neighbours is None:
+            return adjacency_lists[node]
+
+        if isinstance(adjacency_lists, CSRAdjacency):
+            neighbours = adjacency_lists.neighbours(node)
+        else:
+            neighbours = list(itertools.islice(adjacency_lists[node], self.max_neighbours + 1))
+
+        if len(neighbours) > self.max_neighbours:
+            self.truncated = True
+            neighbours = neighbours[:self.max_neighbours]
+
+        return neighbours.tolist() if isinstance(neighbours, np.ndarray) else neighbours
+
+
+def search_shortest_paths(
+    start_indices: Iterable[int],
+    end_indices: Iterable[int],
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    max_path_len: int =3,
+) -> Dict[Tuple[int, int], List[int]]:
+    """Find shortest paths between all pairs of start and end nodes. Instead of one search per pair,
+    one BFS is run from every node of the smaller side, and it stops as soon as all nodes of the 
+    other side are reached (or `max_path_len` is exceeded). Assumes an undirected graph.
+
+    Returns
+    -------
+    dict[tuple[int, int], list[int]]
+        maps (start_idx, end_idx) to the path between them, pairs without path are missing
+    """
+
+    start_indices = list(dict.fromkeys(start_indices))
+    end_indices = list(dict.fromkeys(end_indices))
+
+    # search from the smaller side, paths are reversed afterwards if necessary
+    swapped = len(end_indices) < len(start_indices)
+    if swapped:
+        start_indices, end_indices = end_indices, start_indices
+
+    paths = {}
+
+    for source in start_indices:
+        targets = set(end_indices)
+        predecessor_idx = _search_targets(source, targets, adjacency_lists, max_path_len)
+
+        for target in end_indices:
+            if target not in predecessor_idx:
+                continue
+
+            path = _build_path(predecessor_idx, target)
+
+            if swapped:
+                path.reverse()
+                paths[(target, source)] = path
+            else:
+                paths[(source, target)] = path
+
+    return paths
+
+
+def _search_targets(
+    source: int, targets: Set[int], adjacency_lists, max_path_len: int
+) -> Dict[int, int]:
+    """BFS from `source` that stops once all `targets` are visited. Returns the predecessor map."""
+
+    predecessor_idx = {source: -1}
+    remaining = targets - {source}
+    frontier = [source]
+    depth = 0
+
+    while frontier and remaining and depth < max_path_len - 1:
+        next_frontier = []
+
+        for node in frontier:
+            for neighbour in adjacency_lists[node]:
+                if neighbour in predecessor_idx:
+                    continue
+
+                predecessor_idx[neighbour] = node
+                next_frontier.append(neighbour)
+                remaining.discard(neighbour)
+
+            if not remaining:
+                break
+
+        frontier = next_frontier
+        depth += 1
+
+    return predecessor_idx
+
+
+def search_best_path(
+    start_idx: int,
+    end_idx: int,
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    edge_weights: Callable[[int], Sequence[float]],
+    max_path_len: int =3,
+    max_expansions: int =None,
+    max_neighbours: int =None,
+    return_truncated: bool =False,
+    budget: ExpansionBudget =None,
+) -> Union[list, Tuple[list, bool]]:
+    """Find the best path between two nodes under the ranking used by `get_knowledge_for_example`:
+    fewest nodes first, then the highest product of edge weights.
+
+    Parameters
+    ----------
+    edge_weights : Callable[[int], Sequence[float]]
+        maps a node to the weights of the edges to its neighbours, in the order of 
+        `adjacency_lists[node]` (see `utils.neighbour_weights`)
+
+    The remaining parameters (including the limits `max_expansions` and `max_neighbours` or a 
+    shared `budget`) and the result are the same as for `search_shortest_path`. If a limit is hit, 
+    the returned path is the best one among the visited nodes.
+    """
+
+    if budget is None:
+        budget = ExpansionBudget(max_expansions, max_neighbours)
+    predecessor_idx = _search_best_targets(
+        start_idx, {end_idx}, adjacency_lists, edge_weights, max_path_len, budget
+    )
+    path = _build_path(predecessor_idx, end_idx) if end_idx in predecessor_idx else []
+
+    return (path, budget.truncated) if return_truncated else path
+
+
+def search_best_paths(
+    start_indices: Iterable[int],
+    end_indices: Iterable[int],
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    edge_weights: Callable[[int], Sequence[float]],
+    max_path_len: int =3,
+    reverse_edge_weights: Callable[[int], Sequence[float]] =None,
+) -> Dict[Tuple[int, int], List[int]]:
+    """Weighted counterpart of `search_shortest_paths`: find the best path (see `search_best_path`)
+    for all pairs of start and end nodes with one search per node of the smaller side.
+
+    The search is a Dijkstra on the lexicographic cost (number of edges, -sum(log(weight))), which
+    directly yields the path with the fewest hops and, among those, the maximal weight product. Nodes
+    at depth `max_path_len - 1` are not expanded. Edges without a positive weight are ranked last.
+
+    Parameters
+    ----------
+    reverse_edge_weights : Callable[[int], Sequence[float]], optional
+        weights of the edges from the neighbours to a node. Used if the search runs from the end 
+        nodes, by default `edge_weights` (i.e. edge weights are symmetric)
+    """
+
+    start_indices = list(dict.fromkeys(start_indices))
+    end_indices = list(dict.fromkeys(end_indices))
+
+    # search from the smaller side; weights must still describe the edges in path direction
+    swapped = len(end_indices) < len(start_indices)
+    if swapped:
+        start_indices, end_indices = end_indices, start_indices
+        if reverse_edge_weights is not None:
+            edge_weights = reverse_edge_weights
+
+    paths = {}
+
+    for source in start_indices:
+        predecessor_idx = _search_best_targets(
+            source, set(end_indices), adjacency_lists, edge_weights, max_path_len
+        )
+
+        for target in end_indices:
+            if target not in predecessor_idx:
+                continue
+
+            path = _build_path(predecessor_idx, target)
+
+            if swapped:
+                path.reverse()
+                paths[(target, source)] = path
+            else:
+                paths[(source, target)] = path
+
+    return paths
+
+
+def search_top_k_paths(
+    start_idx: int,
+    end_idx: int,
+    adjacency_lists: Union[Mapping[int, Iterable[int]], CSRAdjacency],
+    edge_weights: Callable[[int], Sequence[float]],
+    k: int,
+    max_path_len: int =3,
+    max_expansions: int =None,
+    return_truncated: bool =False,
+    budget: ExpansionBudget =None,
+) -> Union[List[List[int]], Tuple[List[List[int]], bool]]:
+    """Enumerate up to `k` loop-free paths between two nodes in rank order (fewest nodes first, 
+    then highest product of edge weights, as in `search_best_path`).
+
+    A BFS from `end_idx` first computes the distance to the end node of all nodes within 
+    `max_path_len - 2` edges, and whether `start_idx` is within reach at all. 
+    Paths are then enumerated by a DFS from `start_idx`, one path length at a time, that only 
+    follows edges which can still reach the end node within the remaining length. The enumeration 
+    stops after the first path length that completes the `k` paths.
+
+    Parameters
+    ----------
+    edge_weights : Callable[[int], Sequence[float]]
+        maps a node to the weights of the edges to its neighbours (see `utils.neighbour_weights`)
+    k : int
+        maximal number of paths to return
+    max_expansions : int, optional
+        maximal number of node expansions (BFS and DFS combined). If the budget is exhausted, the 
+        paths found so far are returned. By default unlimited.
+    return_truncated : bool, optional
+        return a tuple (paths, truncated), where truncated tells whether the budget was exhausted 
+        before the search was complete, by default False
+    budget : ExpansionBudget, optional
+        budget (e.g. with a deadline) to use instead of `max_expansions`, possibly shared with other 
+        searches. Its neighbour limit is ignored.
+
+    Returns
+    -------
+    list[list[int]]
+        up to `k` paths, best first
+    """
+
+    max_edges = max_path_len - 1
+    if budget is None:
+        budget = ExpansionBudget(max_expansions)
+
+    # hop distance to the end node for every node within `max_edges - 1` hops, the DFS never needs 
+    # more. The last level is not expanded (it may be a hub's neighbourhood)
+    dist_to_end = {end_idx: 0}
+    frontier = [end_idx]
+    depth = 0
+    truncated = False
+    while frontier and depth < max_edges - 1 and not truncated:
+        next_frontier = []
+        for node in frontier:
+            if budget.exhausted():
+                truncated = True
+                break
+            budget.remaining -= 1
+            for neighbour in adjacency_lists[node]:
+                if neighbour not in dist_to_end:
+                    dist_to_end[neighbour] = depth + 1
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+        depth += 1
+
+    # the start node is at distance `max_edges` if one of its neighbours is in the last level
+    if start_idx not in dist_to_end and frontier and depth == max_edges - 1 and not truncated:
+        if budget.exhausted():
+            truncated = True
+        else:
+            budget.remaining -= 1
+            last_level = set(frontier)
+            if any(neighbour in last_level for neighbour in adjacency_lists[start_idx]):
+                dist_to_end[start_idx] = max_edges
+
+    if k <= 0 or start_idx not in dist_to_end:
+        return ([], truncated) if return_truncated else []
+
+    found = []
+
+    for num_edges in range(dist_to_end[start_idx], max_edges + 1):
+        candidates = []
+        stack = [(start_idx, [start_idx], 0.0)]
+
+        while stack and not budget.exhausted():
+            node, path, cost = stack.pop()
+            remaining = num_edges - (len(path) - 1)
+
+            if remaining == 0:
+                if node == end_idx:
+                    candidates.append((cost, path))
+                continue
+
+            budget.remaining -= 1
+
+            for neighbour, weight in zip(adjacency_lists[node], edge_weights(node)):
+                if dist_to_end.get(neighbour, math.inf) > remaining - 1 or neighbour in path:
+                    continue
+                stack.append((neighbour, path + [neighbour], cost + _edge_cost(weight)))
+
+        truncated = truncated or bool(stack)
+
+        candidates.sort(key=lambda x: x[0])
+        found.extend(path for _, path in candidates[:k - len(found)])
+
+        if len(found) >= k or budget.exhausted():
+            break
+
+    return (found, truncated) if return_truncated else found
+
+
+def _edge_cost(weight: float) -> float:
+    return -math.log(weight) if weight > 0 else math.inf
+
+
+def _search_best_targets(
+    source: int, targets: Set[int], adjacency_lists, edge_weights, max_path_len: int,
+    budget: ExpansionBudget =None
+) -> Dict[int, int]:
+    """Dijkstra from `source` on (hops, -log weight) that stops once all `targets` are settled or 
+    the budget runs out. Returns the predecessor map of all settled nodes."""
+
+    max_edges = max_path_len - 1
+    if budget is None:
+        budget = ExpansionBudget()
+
+    best = {source: (0, 0.0)}
+    tentative_pred = {source: -1}
+    predecessor_idx = {}
+    remaining = set(targets)
+
+    heap = [(0, 0.0, source)]
+
+    while heap and remaining:
+        hops, cost, node = heapq.heappop(heap)
+
+        if node in predecessor_idx:
+            continue
+
+        predecessor_idx[node] = tentative_pred[node]
+        remaining.discard(node)
+
+        if hops >= max_edges:
+            continue
+
+        if budget.exhausted():
+            break
+
+        # capped neighbours are a prefix of the adjacency list, zip drops the surplus weights
+        for neighbour, weight in zip(budget.neighbours(adjacency_lists, node), edge_weights(node)):
+            if neighbour in predecessor_idx:
+                continue
+
+            key = (hops + 1, cost + _edge_cost(weight))
+
+            if neighbour not in best or key < best[neighbour]:
+                best[neighbour] = key
+                tentative_pred[neighbour] = node
+                heapq.heappush(heap, (*key, neighbour))
+
+    return predecessor_idx
+
+
+def _expand_level(
+    frontier: List[int], adjacency_lists, own_pred: dict, other_pred: dict,
+    budget: ExpansionBudget
+):
+    """expand all nodes of one BFS level. Returns the next frontier and the first node that was 
+    reached from both sides (or -1). Since every node is checked against the other side when it is 
+    first visited, all meeting nodes of a level result in paths of the same (minimal) length. If 
+    the budget runs out, the expansion stops early."""
+
+    next_frontier = []
+
+    for node in frontier:
+        if budget.exhausted():
+            break
+
+        for neighbour in budget.neighbours(adjacency_lists, node):
+            if neighbour in own_pred:
+                continue
+
+            own_pred[neighbour] = node
+
+            if neighbour in other_pred:
+                return next_frontier, neighbour
+
+            next_frontier.append(neighbour)
+
+    return next_frontier, -1
+
+
+def _build_path(predecessor_idx: dict, node: int) -> List[int]:
+    """follow the predecessors from `node` back to the start node and return the path from the 
+    start node to `node`."""
+
+    path = []
+
+    while node != -1:
+        path.append(node)
+        node = predecessor_idx[node]
+
+    path.reverse()
+
+    return path
+
+
+class PathCache:
+    """Bounded LRU cache for raw search results of `find_word_path`/`find_word_paths`, keyed by 
+    (normalized start term, normalized end term, max_path_len, graph fingerprint, search variant). 
+    Negative results (no path) are cached as well.
+
+    If `db_path` is given, the cache is loaded from this SQLite file on creation and written back 
+    by `save`, so results survive between runs. Entries of other graphs (fingerprints) are kept in 
+    the file but never returned.
+
+    The cache can be shared by several threads (e.g. of `knowledge_server`).
+
+    Attributes
+    ----------
+    hits:
+        number of successful lookups
+    misses:
+        number of failed lookups
+    """
+
+    def __init__(self, capacity: int =100_000, db_path: str =None):
+        self.capacity = capacity
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._journal = None
+        self._lock = threading.Lock()
+
+        if db_path is not None and os.path.exists(db_path):
+            self.load()
+
+    @staticmethod
+    def key(
+        start_term: str, end_term: str, max_path_len: int, graph: ConceptNet, variant: str
+    ) -> tuple:
+        """cache key, `start_term` and `end_term` must already be normalized."""
+        return (start_term, end_term, max_path_len, graph_fingerprint(graph), variant)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[List[int]]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, path: List[int]):
+        with self._lock:
+            self._entries[key] = tuple(path)
+            self._entries.move_to_end(key)
+
+            if self._journal is not None:
+                self._journal.append((key, tuple(path)))
+
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def start_journal(self):
+        """record the entries stored from now on, e.g. to send the entries of a worker process's 
+        copy back to the parent (see `pop_journal`)."""
+        self._journal = []
+
+    def pop_journal(self) -> List[Tuple[tuple, tuple]]:
+        """(key, path) of the entries stored since `start_journal` or the last `pop_journal`."""
+        with self._lock:
+            journal = self._journal or []
+            if self._journal is not None:
+                self._journal = []
+            return journal
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS paths (
+                start_term TEXT, end_term TEXT, max_path_len INTEGER, fingerprint TEXT,
+                variant TEXT, path TEXT, last_used INTEGER,
+                PRIMARY KEY (start_term, end_term, max_path_len, fingerprint, variant)
+            )"""
+        )
+        return con
+
+    def load(self):
+        """(re)load the most recently used entries from `db_path`."""
+
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT start_term, end_term, max_path_len, fingerprint, variant, path "
+                "FROM paths ORDER BY last_used DESC LIMIT ?",
+                (self.capacity,),
+            ).fetchall()
+        con.close()
+
+        with self._lock:
+            self._entries.clear()
+            for *key, path in reversed(rows):
+                self._entries[tuple(key)] = tuple(json.loads(path))
+
+    def save(self):
+        """write all entries to `db_path`, keeping at most `capacity` entries in the file."""
+
+        if self.db_path is None:
+            raise ValueError("PathCache has no db_path to save to")
+
+        with self._lock:
+            entries = list(self._entries.items())
+
+        with self._connect() as con:
+            (offset,) = con.execute("SELECT COALESCE(MAX(last_used), 0) FROM paths").fetchone()
+            con.executemany(
+                "INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (*key, json.dumps(path), offset + i + 1)
+                    for i, (key, path) in enumerate(entries)
+                ),
+            )
+            con.execute(
+                "DELETE FROM paths WHERE last_used <= "
+                "(SELECT COALESCE(MAX(last_used), 0) FROM paths) - ?",
+                (self.capacity,),
+            )
+        con.close()
+
+
 def find_word_path(
         start_term: str, end_term: str, 
         graph: ConceptNet, 
         max_path_len: int =3,
-        renderer=render_path_brief) -> Union[str, List[int]]:
+        renderer=render_path_brief,
+        bidirectional: bool =True,
+        weighted: bool =False,
+        max_expansions: int =None,
+        max_neighbours: int =None,
+        cache: PathCache =None) -> Union[str, List[int]]:
     """Find the shortest path between `start_term` and `end_term` and return its textual 
     representation. 
 
@@ -80,6 +743,19 @@ def find_word_path(
         maximal number of nodes in a path, by default 3
     renderer, optional
         function to visualize paths, by default render_path_brief. If None, the raw path (a list of int's) is returned.
+    bidirectional : bool, optional
+        use the bidirectional BFS, by default True
+    weighted : bool, optional
+        among the shortest paths, find the one with the highest product of edge weights (see 
+        `search_best_path`), by default False
+    max_expansions : int, optional
+        limit on the number of expanded nodes (see `search_shortest_path`), by default unlimited
+    max_neighbours : int, optional
+        limit on the neighbours visited per node (see `search_shortest_path`), by default 
+        unlimited. The neighbours with the highest edge weights are visited (see 
+        `utils.ranked_by_weight`).
+    cache : PathCache, optional
+        cache for raw search results, by default None
 
     Returns
     -------
@@ -106,9 +782,31 @@ def find_word_path(
         #logging.warning(f"end {end_term} not in graph, skipping")
         return []
 
-    path = search_shortest_path(
-        start_idx, end_idx, graph.adjacency_lists, max_path_len=max_path_len
-    )
+    if cache is not None:
+        variant = _search_variant(weighted, max_expansions, max_neighbours)
+        key = PathCache.key(start_term, end_term, max_path_len, graph, variant)
+        path = cache.get(key)
+    else:
+        path = None
+
+    if path is None and max_neighbours is not None:
+        # the neighbour limit keeps the strongest edges of hubs
+        graph = ranked_by_weight(graph)
+
+    if path is None and weighted:
+        path = search_best_path(
+            start_idx, end_idx, graph.adjacency_lists, neighbour_weights(graph),
+            max_path_len=max_path_len, max_expansions=max_expansions, max_neighbours=max_neighbours
+        )
+    elif path is None:
+        path = search_shortest_path(
+            start_idx, end_idx, graph.adjacency_lists, max_path_len=max_path_len,
+            bidirectional=bidirectional, max_expansions=max_expansions,
+            max_neighbours=max_neighbours
+        )
+
+    if cache is not None and key not in cache:
+        cache.put(key, path)
 
     if renderer:
         return renderer(path, graph)
@@ -116,4 +814,206 @@ def find_word_path(
         return path
 
 
-        
\ No newline at end of file
+def _search_variant(weighted: bool, max_expansions: int, max_neighbours: int) -> str:
+    """cache key component describing which search produced a path."""
+
+    variant = "weighted" if weighted else "bfs"
+    if max_expansions is not None or max_neighbours is not None:
+        variant += f"-e{max_expansions}-n{max_neighbours}"
+
+    return variant
+
+
+def find_word_paths(
+        start_terms: Iterable[str], end_terms: Iterable[str],
+        graph: ConceptNet,
+        max_path_len: int =3,
+        renderer=render_path_brief,
+        weighted: bool =False,
+        cache: PathCache =None) -> Dict[Tuple[str, str], Union[str, List[int]]]:
+    """Batched version of `find_word_path`: find the shortest paths between all pairs of 
+    `start_terms` and `end_terms` with a shared search (see `search_shortest_paths`).
+
+    Parameters
+    ----------
+    start_terms : Iterable[str]
+        start terms for path search
+    end_terms : Iterable[str]
+        end terms for path search
+    graph : ConceptNet
+        ConceptNet instance to work with
+    max_path_len : int, optional
+        maximal number of nodes in a path, by default 3
+    renderer, optional
+        function to visualize paths, by default render_path_brief. If None, raw paths are returned.
+    weighted : bool, optional
+        search the best weighted paths (see `search_best_paths`), by default False
+    cache : PathCache, optional
+        cache for raw search results, only pairs missing in the cache are searched, by default None
+
+    Returns
+    -------
+    dict[tuple[str, str], str | list[int]]
+        maps each (start_term, end_term) pair to what `find_word_path` would return for it
+    """
+
+    start_terms = list(dict.fromkeys(start_terms))
+    end_terms = list(dict.fromkeys(end_terms))
+
+    normalized = {t: normalize_input(t) for t in itertools.chain(start_terms, end_terms)}
+
+    def resolve(terms):
+        return {
+            t: graph.nodes_name2idx[normalized[t]] for t in terms
+            if normalized[t] in graph.nodes_name2idx
+        }
+
+    start_idx = resolve(start_terms)
+    end_idx = resolve(end_terms)
+
+    paths = find_node_paths(
+        start_idx.values(), end_idx.values(), graph, max_path_len=max_path_len,
+        weighted=weighted, cache=cache
+    )
+
+    result = {}
+
+    for ts in start_terms:
+        for te in end_terms:
+            if ts not in start_idx or te not in end_idx:
+                result[(ts, te)] = []
+                continue
+
+            path = paths.get((start_idx[ts], end_idx[te]), [])
+
+            result[(ts, te)] = renderer(path, graph) if renderer else path
+
+    return result
+
+
+def find_node_paths(
+        start_nodes: Iterable[int], end_nodes: Iterable[int],
+        graph: ConceptNet,
+        max_path_len: int =3,
+        weighted: bool =False,
+        cache: PathCache =None) -> Dict[Tuple[int, int], List[int]]:
+    """Like `find_word_paths`, but for node indices that are already resolved (e.g. by 
+    `phrase_matcher.PhraseMatcher`), so no normalization takes place. Returns raw paths only.
+
+    Parameters
+    ----------
+    start_nodes : Iterable[int]
+        start nodes for path search
+    end_nodes : Iterable[int]
+        end nodes for path search
+    graph : ConceptNet
+        ConceptNet instance to work with
+    max_path_len : int, optional
+        maximal number of nodes in a path, by default 3
+    weighted : bool, optional
+        search the best weighted paths (see `search_best_paths`), by default False
+    cache : PathCache, optional
+        cache for raw search results, only pairs missing in the cache are searched, by default None
+
+    Returns
+    -------
+    dict[tuple[int, int], list[int]]
+        maps each (start node, end node) pair to its path, empty if there is none
+    """
+
+    start_nodes = list(dict.fromkeys(start_nodes))
+    end_nodes = list(dict.fromkeys(end_nodes))
+
+    paths = {}
+    variant = _search_variant(weighted, None, None)
+
+    def key(start, end):
+        return PathCache.key(
+            graph.nodes_idx2name[start], graph.nodes_idx2name[end], max_path_len, graph, variant
+        )
+
+    if cache is not None:
+        for start in start_nodes:
+            for end in end_nodes:
+                path = cache.get(key(start, end))
+                if path is not None:
+                    paths[(start, end)] = path
+
+    # only search from/to nodes that take part in at least one uncached pair
+    missing = [(start, end) for start in start_nodes for end in end_nodes if (start, end) not in paths]
+    search_start = [start for start, _ in missing]
+    search_end = [end for _, end in missing]
+
+    if missing and weighted:
+        found = search_best_paths(
+            search_start, search_end, graph.adjacency_lists, neighbour_weights(graph),
+            max_path_len=max_path_len, reverse_edge_weights=neighbour_weights(graph, reverse=True)
+        )
+    elif missing:
+        found = search_shortest_paths(
+            search_start, search_end, graph.adjacency_lists, max_path_len=max_path_len
+        )
+
+    for start, end in missing:
+        path = found.get((start, end), [])
+        paths[(start, end)] = path
+
+        if cache is not None:
+            cache.put(key(start, end), path)
+
+    return paths
+
+
+def find_top_k_paths(
+        start_term: str, end_term: str,
+        graph: ConceptNet,
+        k: int,
+        max_path_len: int =3,
+        max_expansions: int =None,
+        renderer=render_path_brief,
+        weighted: bool =True) -> List[Union[str, List[int]]]:
+    """Find up to `k` paths between `start_term` and `end_term`, ranked by number of nodes and 
+    product of edge weights (see `search_top_k_paths`).
+
+    Parameters
+    ----------
+    start_term : str
+        start term for path search
+    end_term : str
+        end term for path search
+    graph : ConceptNet
+        ConceptNet instance to work with
+    k : int
+        maximal number of paths
+    max_path_len : int, optional
+        maximal number of nodes in a path, by default 3
+    max_expansions : int, optional
+        work budget in node expansions, by default unlimited
+    renderer, optional
+        function to visualize paths, by default render_path_brief. If None, raw paths are returned.
+    weighted : bool, optional
+        rank paths of the same length by their product of edge weights, by default True. Otherwise 
+        they are taken in the order of the adjacency lists.
+
+    Returns
+    -------
+    list[str | list[int]]
+        up to `k` (rendered) paths, best first
+    """
+
+    start_term = normalize_input(start_term)
+    end_term = normalize_input(end_term)
+
+    if start_term not in graph.nodes_name2idx or end_term not in graph.nodes_name2idx:
+        return []
+
+    paths = search_top_k_paths(
+        graph.nodes_name2idx[start_term], graph.nodes_name2idx[end_term],
+        graph.adjacency_lists, neighbour_weights(graph) if weighted else unit_weights(graph), k,
+        max_path_len=max_path_len, max_expansions=max_expansions
+    )
+
+    if renderer:
+        return [renderer(path, graph) for path in paths]
+    else:
+        return paths
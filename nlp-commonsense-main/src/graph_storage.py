@@ -0,0 +1,316 @@
+"""
+Directory-based binary storage format for `utils.ConceptNet`. All large arrays are written as
+`.npy` files and opened with `np.memmap` (via `np.load(..., mmap_mode="r")`), so loading is almost
+instant and all processes that open the same directory share one copy in the OS page cache.
+
+Layout
+------
+manifest.json
+    format version and sizes
+labels.json
+    edge labels (`labels_idx2name`)
+node_offsets.npy, node_blob.bin
+    node names as utf-8 blob with int64 offsets, node `i` is `blob[offsets[i]:offsets[i + 1]]`
+node_order.npy
+    indices of all nodes in `nodes_name2idx`, sorted by name (used for binary search)
+indptr.npy, indices.npy
+    CSR adjacency (see `utils.CSRAdjacency`), the neighbours of each node ranked by descending 
+    weight (see `utils.rank_neighbours_by_weight`)
+edge_keys.npy, edge_labels.npy, edge_weights.npy, edge_rows.npy
+    columnar edge descriptors (see `utils.EdgeStore`)
+best_keys.npy, best_edges.npy, best_reversed.npy
+    precomputed best edge per adjacent node pair (see `utils.EdgeStore.compute_best_edges`)
+
+String maps (e.g. the lemma table, see `utils.set_lemma_table`) are stored the same way: keys and 
+values as blob tables plus a sorted order of the keys (`save_string_map`/`load_string_map`).
+"""
+
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+import json
+import os
+import shutil
+from typing import Callable, Iterator, Mapping
+
+import numpy as np
+
+import utils as U
+
+FORMAT_VERSION = 1
+
+
+class StringTable(SequenceABC):
+    """Read-only sequence of strings stored as an utf-8 blob plus offsets."""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        if not -len(self) <= idx < len(self):
+            raise IndexError(idx)
+        if idx < 0:
+            idx += len(self)
+        return self.blob[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+
+class StringIndex(MappingABC):
+    """Read-only mapping from string to index, backed by a `StringTable` and a permutation of the
+    table that is sorted by string. Lookups are binary searches, so nothing is loaded up front.
+    """
+
+    def __init__(self, table: StringTable, order: np.ndarray):
+        self.table = table
+        self.order = order
+
+    def _find(self, name: str) -> int:
+        key = name.encode("utf-8")
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            idx = int(self.order[mid])
+            candidate = self.table.blob[self.table.offsets[idx]:self.table.offsets[idx + 1]].tobytes()
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return idx
+        return -1
+
+    def __getitem__(self, name: str) -> int:
+        idx = self._find(name)
+        if idx < 0:
+            raise KeyError(name)
+        return idx
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and self._find(name) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in self.order:
+            yield self.table[int(idx)]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+
+class StringMap(MappingABC):
+    """Read-only mapping from string to string, backed by two `StringTable`s."""
+
+    def __init__(self, index: StringIndex, values: StringTable):
+        self.index = index
+        self.values = values
+
+    def __getitem__(self, key: str) -> str:
+        return self.values[self.index[key]]
+
+    def get(self, key: str, default=None):
+        idx = self.index._find(key)
+        return self.values[idx] if idx >= 0 else default
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def _open_blob(path: str) -> np.ndarray:
+    # np.memmap refuses to map empty files
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def is_graph_dir(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "manifest.json"))
+
+
+def _save_strings(strings, path: str, name: str):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    with open(os.path.join(path, f"{name}_blob.bin"), "wb") as fp:
+        for e in encoded:
+            fp.write(e)
+    np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+
+
+def _load_strings(path: str, name: str) -> StringTable:
+    return StringTable(
+        np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r"),
+        _open_blob(os.path.join(path, f"{name}_blob.bin")),
+    )
+
+
+def _write_dir(path: str, write: Callable[[str], None]):
+    """Call `write` on a new temporary directory and swap it in for `path` afterwards. Files of an 
+    existing directory are never overwritten, since running processes may have them memory-mapped 
+    (truncating a mapped file crashes them with SIGBUS). The old directory is moved away and only 
+    deleted once the new one is in place, so `path` is never half-written."""
+
+    path = os.path.normpath(path)
+    tmp_path, old_path = path + ".tmp", path + ".old"
+
+    for leftover in (tmp_path, old_path):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    os.makedirs(tmp_path)
+    try:
+        write(tmp_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def save_string_map(mapping: Mapping[str, str], path: str):
+    """Write a str -> str mapping to directory `path`, readable with `load_string_map`. An existing 
+    directory is replaced as a whole (see `save_graph_dir`)."""
+
+    items = sorted(mapping.items(), key=lambda x: x[0].encode("utf-8"))
+
+    def write(path):
+        _save_strings((k for k, _ in items), path, "key")
+        _save_strings((v for _, v in items), path, "value")
+
+        with open(os.path.join(path, "manifest.json"), "w") as fp:
+            json.dump({"format_version": FORMAT_VERSION, "num_entries": len(items)}, fp, indent=2)
+
+    _write_dir(path, write)
+
+
+def load_string_map(path: str) -> StringMap:
+    """Open a mapping written by `save_string_map`, memory-mapped."""
+
+    keys = _load_strings(path, "key")
+    return StringMap(StringIndex(keys, np.arange(len(keys))), _load_strings(path, "value"))
+
+
+def save_graph_dir(graph: U.ConceptNet, path: str):
+    """Write `graph` to directory `path` in the memory-mappable format. Works for graphs with dict
+    based as well as CSR / columnar representations.
+
+    Parameters
+    ----------
+    graph : U.ConceptNet
+        graph to store
+    path : str
+        target directory, created if necessary. An existing directory is not written to but replaced 
+        as a whole once the new one is complete, since its files may be memory-mapped by running 
+        processes (or by `graph` itself).
+    """
+
+    _write_dir(path, lambda tmp_path: _save_graph_files(graph, tmp_path))
+
+
+def _save_graph_files(graph: U.ConceptNet, path: str):
+    num_nodes = len(graph.nodes_idx2name)
+
+    _save_strings(graph.nodes_idx2name, path, "node")
+
+    # only names that are actually resolvable (normalization can map several raw nodes to one name)
+    lookup = sorted(graph.nodes_name2idx.items(), key=lambda x: x[0].encode("utf-8"))
+    np.save(
+        os.path.join(path, "node_order.npy"),
+        np.asarray([idx for _, idx in lookup], dtype=np.int32),
+    )
+
+    compact = U.to_edge_store(U.to_csr_adjacency(graph))
+    edges = compact.edge_descriptors
+    if edges.best_keys is None:
+        edges.compute_best_edges()
+
+    # searches that cap the neighbours per node follow the strongest edges of hubs first
+    adjacency = U.rank_neighbours_by_weight(compact).adjacency_lists
+    np.save(os.path.join(path, "indptr.npy"), np.asarray(adjacency.indptr))
+    np.save(os.path.join(path, "indices.npy"), np.asarray(adjacency.indices))
+
+    np.save(os.path.join(path, "edge_keys.npy"), np.asarray(edges.pair_keys))
+    np.save(os.path.join(path, "edge_labels.npy"), np.asarray(edges.label_idx))
+    np.save(os.path.join(path, "edge_weights.npy"), np.asarray(edges.weight))
+    np.save(os.path.join(path, "edge_rows.npy"), np.asarray(edges.row_idx))
+
+    np.save(os.path.join(path, "best_keys.npy"), np.asarray(edges.best_keys))
+    np.save(os.path.join(path, "best_edges.npy"), np.asarray(edges.best_edge))
+    np.save(os.path.join(path, "best_reversed.npy"), np.asarray(edges.best_reversed))
+
+    with open(os.path.join(path, "labels.json"), "w") as fp:
+        json.dump(list(graph.labels_idx2name), fp)
+
+    # written last, a directory without manifest is an incomplete export (e.g. a leftover temporary 
+    # directory)
+    with open(os.path.join(path, "manifest.json"), "w") as fp:
+        json.dump(
+            {
+                "format_version": FORMAT_VERSION,
+                "num_nodes": num_nodes,
+                "num_labels": len(graph.labels_idx2name),
+                "num_adjacency_entries": int(len(adjacency.indices)),
+                "num_edges": int(len(edges.pair_keys)),
+            },
+            fp,
+            indent=2,
+        )
+
+
+def load_graph_dir(path: str) -> U.ConceptNet:
+    """Open a graph directory written by `save_graph_dir`. Arrays are memory-mapped read-only, node
+    names are decoded on access.
+
+    Parameters
+    ----------
+    path : str
+        graph directory
+
+    Returns
+    -------
+    U.ConceptNet
+        graph with `StringTable`/`StringIndex` nodes, `CSRAdjacency` and `EdgeStore`
+    """
+
+    with open(os.path.join(path, "manifest.json")) as fp:
+        manifest = json.load(fp)
+
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"unsupported graph format version {manifest['format_version']} in {path}"
+        )
+
+    def npy(name):
+        return np.load(os.path.join(path, name), mmap_mode="r")
+
+    def optional_npy(name):
+        # missing in directories written before best edges were precomputed
+        return npy(name) if os.path.isfile(os.path.join(path, name)) else None
+
+    nodes = _load_strings(path, "node")
+    nodes2idx = StringIndex(nodes, npy("node_order.npy"))
+
+    with open(os.path.join(path, "labels.json")) as fp:
+        labels = json.load(fp)
+    labels2idx = {label: idx for idx, label in enumerate(labels)}
+
+    adjacency = U.CSRAdjacency(npy("indptr.npy"), npy("indices.npy"))
+    edges = U.EdgeStore(
+        npy("edge_keys.npy"),
+        npy("edge_labels.npy"),
+        npy("edge_weights.npy"),
+        npy("edge_rows.npy"),
+        manifest["num_nodes"],
+        optional_npy("best_keys.npy"),
+        optional_npy("best_edges.npy"),
+        optional_npy("best_reversed.npy"),
+    )
+
+    return U.ConceptNet(nodes, nodes2idx, labels, labels2idx, adjacency, edges)
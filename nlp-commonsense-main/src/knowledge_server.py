@@ -0,0 +1,431 @@
+"""
+Asyncio server for knowledge retrieval. The graph is loaded once. Requests are JSON objects, one per
+line, over a TCP connection (by default on localhost):
+
+    {"id": 1, "premise": "The host cancelled the party.", "choices": ["She had the flu.", "It rained."]}
+    {"id": 2, "premise": "...", "choice": "...", "max_paths": 5}
+    {"id": 3, "op": "metrics"}
+
+Every request is answered with one line carrying the same id. The answer is
+`{"id": ..., "knowledge": [...], "partial": false}` (a string instead of a list for "choice"), or
+`{"id": ..., "error": "..."}`. Responses of one connection may arrive out of order.
+
+Concurrent requests are collected into micro-batches. For each batch, the graph nodes of all
+texts are extracted at once. Requests with the same premise (e.g. the choices of one COPA example
+sent separately) share one search. The batches run in a thread or process pool, so the event
+loop keeps accepting requests.
+
+Usage: `python knowledge_server.py --port 8765 [--compressed] [--matcher] [--deadline 0.5]`
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import fire
+
+from phrase_matcher import PhraseMatcher
+from qa_preprocessing import extract_nodes, get_knowledge_for_nodes
+from utils import ConceptNet
+
+
+def process_batch(
+    requests: List[dict], conceptnet: ConceptNet, matcher: PhraseMatcher =None, max_paths: int =3,
+    **kwargs
+) -> List[dict]:
+    """Answer a batch of requests (see module docstring) with shared node extraction and one
+    search per distinct premise.
+
+    Parameters
+    ----------
+    requests : list[dict]
+        requests with "premise" and "choice" or "choices", optionally "max_paths"
+    conceptnet : ConceptNet
+        knowledge base
+    matcher : PhraseMatcher, optional
+        extract nodes with this automaton instead of spaCy, by default None
+    max_paths : int, optional
+        default maximum number of paths per choice, by default 3
+    **kwargs
+        further arguments for `qa_preprocessing.get_knowledge_for_nodes`
+
+    Returns
+    -------
+    list[dict]
+        response for each request, in input order
+    """
+
+    responses: List[Optional[dict]] = [None] * len(requests)
+    # choices and max. number of paths of every valid request
+    parsed: List[Optional[Tuple[List[str], int]]] = [None] * len(requests)
+    texts = {}
+
+    for idx, request in enumerate(requests):
+        # invalid requests get an error response, the other requests of the batch are unaffected
+        try:
+            choices = request["choices"] if "choices" in request else [request["choice"]]
+            if not isinstance(choices, list):
+                raise TypeError("choices must be a list")
+            if not isinstance(request["premise"], str) or not all(isinstance(c, str) for c in choices):
+                raise TypeError("premise and choices must be strings")
+
+            request_max_paths = request.get("max_paths", max_paths)
+            if isinstance(request_max_paths, bool) or not isinstance(request_max_paths, int):
+                raise TypeError("max_paths must be an integer")
+            if request_max_paths < 1:
+                raise ValueError("max_paths must be positive")
+        except (KeyError, TypeError, ValueError) as e:
+            responses[idx] = {"id": request.get("id"), "error": f"invalid request: {e}"}
+            continue
+
+        parsed[idx] = (choices, request_max_paths)
+
+        texts.setdefault(request["premise"], None)
+        for choice in choices:
+            texts.setdefault(choice, None)
+
+    term_cache = kwargs.pop("term_cache", None)
+    try:
+        texts = dict(zip(texts, extract_nodes(list(texts), conceptnet, matcher, term_cache)))
+    except Exception as e:
+        logging.exception("node extraction failed")
+        for idx, request in enumerate(requests):
+            if parsed[idx] is not None:
+                responses[idx] = {"id": request.get("id"), "error": f"{type(e).__name__}: {e}"}
+        return responses
+
+    # requests with the same premise nodes and selection size share one search
+    groups: Dict[Tuple[frozenset, int], List[int]] = {}
+    for idx, request in enumerate(requests):
+        if parsed[idx] is not None:
+            key = (frozenset(texts[request["premise"]]), parsed[idx][1])
+            groups.setdefault(key, []).append(idx)
+
+    for (p_nodes, group_max_paths), indices in groups.items():
+        choices = [parsed[idx][0] for idx in indices]
+
+        try:
+            results, partial = get_knowledge_for_nodes(
+                set(p_nodes), [texts[c] for cs in choices for c in cs], conceptnet, group_max_paths,
+                **kwargs
+            )
+        except Exception as e:
+            logging.exception("knowledge retrieval failed")
+            for idx in indices:
+                responses[idx] = {"id": requests[idx].get("id"), "error": f"{type(e).__name__}: {e}"}
+            continue
+
+        offset = 0
+        for idx, cs in zip(indices, choices):
+            knowledge = results[offset:offset + len(cs)]
+            offset += len(cs)
+
+            responses[idx] = {
+                "id": requests[idx].get("id"),
+                "knowledge": knowledge if "choices" in requests[idx] else knowledge[0],
+                "partial": partial,
+            }
+
+    return responses
+
+
+# graph and matcher of worker processes, see `_init_worker`
+_worker_graph = None
+_worker_matcher = None
+
+
+def _init_worker(graph_path: str, use_matcher: bool):
+    global _worker_graph, _worker_matcher
+
+    import graph_storage
+
+    _worker_graph = graph_storage.load_graph_dir(graph_path)
+    _worker_matcher = PhraseMatcher.from_graph(_worker_graph) if use_matcher else None
+
+
+def _process_batch_in_worker(requests: List[dict], kwargs: dict) -> List[dict]:
+    return process_batch(requests, _worker_graph, _worker_matcher, **kwargs)
+
+
+def _percentiles(values, qs=(50, 95, 99)) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    return {
+        f"p{q}": values[min(len(values) - 1, len(values) * q // 100)] if values else None
+        for q in qs
+    }
+
+
+class KnowledgeServer:
+    """JSON-lines knowledge retrieval server, see the module docstring.
+
+    Parameters
+    ----------
+    conceptnet : ConceptNet
+        knowledge base, loaded once and shared by all requests (thread pool)
+    matcher : PhraseMatcher, optional
+        extract nodes with this automaton instead of spaCy, by default None
+    host : str, optional
+        address to listen on, by default "127.0.0.1"
+    port : int, optional
+        port to listen on, by default 0 (any free port, see `address` after `start`)
+    max_batch_size : int, optional
+        maximal number of requests per batch, by default 32
+    max_wait : float, optional
+        seconds a batch waits for more requests after its first one, by default 0.005
+    n_workers : int, optional
+        number of batches processed at once, by default 4
+    executor : str, optional
+        "thread" or "process", by default "thread". Process workers open the graph directory
+        `graph_path` themselves (see `graph_storage`).
+    graph_path : str, optional
+        graph directory for process workers
+    build_matcher : bool, optional
+        build a `PhraseMatcher` over the graph on `start` (in every worker for the process executor),
+        by default False
+    **kwargs
+        further arguments for `qa_preprocessing.get_knowledge_for_nodes` (e.g. max_paths, deadline)
+    """
+
+    def __init__(
+        self, conceptnet: ConceptNet =None, matcher: PhraseMatcher =None, host: str ="127.0.0.1",
+        port: int =0, max_batch_size: int =32, max_wait: float =0.005, n_workers: int =4,
+        executor: str ="thread", graph_path: str =None, build_matcher: bool =False, **kwargs
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"unknown executor {executor!r}")
+        if executor == "process" and graph_path is None:
+            raise ValueError("the process executor needs graph_path")
+        if executor == "thread" and conceptnet is None:
+            raise ValueError("the thread executor needs conceptnet")
+
+        self.conceptnet = conceptnet
+        self.matcher = matcher
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.n_workers = n_workers
+        self.executor_type = executor
+        self.graph_path = graph_path
+        self.build_matcher = build_matcher
+        self.kwargs = kwargs
+
+        self.address: Optional[Tuple[str, int]] = None
+
+        self.requests_total = 0
+        self.errors_total = 0
+        self.batches_total = 0
+        self.batch_sizes = deque(maxlen=10_000)
+        self.queue_waits = deque(maxlen=10_000)
+        self.latencies = deque(maxlen=10_000)
+        self.in_flight = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._executor: Optional[Executor] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._tasks = set()
+        self._writers = set()
+
+    async def start(self) -> Tuple[str, int]:
+        """start listening and processing, returns the (host, port) the server listens on."""
+
+        if self.executor_type == "thread":
+            if self.build_matcher and self.matcher is None:
+                self.matcher = PhraseMatcher.from_graph(self.conceptnet)
+            self._executor = ThreadPoolExecutor(self.n_workers)
+        else:
+            self._executor = ProcessPoolExecutor(
+                self.n_workers, initializer=_init_worker, initargs=(self.graph_path, self.build_matcher)
+            )
+
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.n_workers)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.address = self._server.sockets[0].getsockname()[:2]
+
+        logging.info(f"knowledge server listening on {self.address[0]}:{self.address[1]}")
+        return self.address
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # lets the connection handlers see the end of their stream
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._batcher, *self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        """queue depth, throughput counters and latency percentiles (milliseconds) of recent requests."""
+
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches_in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "batches_total": self.batches_total,
+            "mean_batch_size": sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else None,
+            "queue_wait_ms": _percentiles([w * 1000 for w in self.queue_waits]),
+            "latency_ms": _percentiles([l * 1000 for l in self.latencies]),
+        }
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        self._writers.add(writer)
+
+        async def respond(response: dict):
+            async with write_lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        async def answer(request: dict):
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((request, future, time.monotonic()))
+            await respond(await future)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    self.errors_total += 1
+                    await respond({"id": None, "error": f"invalid request: {e}"})
+                    continue
+
+                if request.get("op") == "metrics":
+                    await respond({"id": request.get("id"), "metrics": self.metrics()})
+                else:
+                    # answered concurrently, so that pipelined requests end up in the same batch
+                    self._spawn(answer(request))
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            batch_deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = batch_deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # at most n_workers batches at once, the rest waits in the queue (and gets batched)
+            await self._slots.acquire()
+            self._spawn(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        requests = [request for request, _, _ in batch]
+
+        self.in_flight += 1
+        try:
+            if self.executor_type == "thread":
+                responses = await loop.run_in_executor(
+                    self._executor,
+                    lambda: process_batch(requests, self.conceptnet, self.matcher, **self.kwargs),
+                )
+            else:
+                responses = await loop.run_in_executor(
+                    self._executor, _process_batch_in_worker, requests, self.kwargs
+                )
+        except Exception as e:
+            logging.exception("batch failed")
+            responses = [
+                {"id": request.get("id"), "error": f"{type(e).__name__}: {e}"} for request in requests
+            ]
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+        finished = time.monotonic()
+        self.batches_total += 1
+        self.batch_sizes.append(len(batch))
+
+        for (_, future, enqueued), response in zip(batch, responses):
+            self.requests_total += 1
+            self.errors_total += "error" in response
+            self.queue_waits.append(started - enqueued)
+            self.latencies.append(finished - enqueued)
+
+            if not future.done():
+                future.set_result(response)
+
+
+def serve(
+    host: str ="127.0.0.1", port: int =8765, compressed: bool =False, matcher: bool =False,
+    max_batch_size: int =32, max_wait: float =0.005, n_workers: int =4, executor: str ="thread",
+    max_paths: int =3, deadline: float =None, max_expansions: int =None
+):
+    """Load the graph (see `utils.load_conceptnet`) and serve knowledge requests until interrupted.
+
+    Parameters
+    ----------
+    matcher : bool, optional
+        extract nodes with a `PhraseMatcher` instead of spaCy, by default False
+    executor : str, optional
+        "thread" or "process", by default "thread". Processes need the graph directory written by
+        `prepare_data.py convert-graph`.
+    deadline : float, optional
+        time limit per request in seconds, by default none
+    """
+
+    import utils as U
+
+    logging.basicConfig(level=logging.INFO)
+
+    name = "graph_representation_compressed" if compressed else "graph_representation"
+    graph_path = f"../data/processed/{name}"
+    conceptnet = U.load_conceptnet(load_compressed=compressed, csr=True) if executor == "thread" else None
+
+    server = KnowledgeServer(
+        conceptnet, host=host, port=port, max_batch_size=max_batch_size, max_wait=max_wait,
+        n_workers=n_workers, executor=executor, graph_path=graph_path, build_matcher=matcher,
+        max_paths=max_paths, deadline=deadline, max_expansions=max_expansions,
+    )
+
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    fire.Fire(serve)
@@ -0,0 +1,212 @@
+"""
+Dictionary-based term extraction without spaCy. `PhraseMatcher` is an Aho-Corasick automaton over
+the tokenized node names of a `utils.ConceptNet`: it finds every node mentioned in a text, including
+multi-word nodes like "drawstring bag", in a single pass over the tokens of the text and returns
+node indices that can be passed to `find_shortest_path.find_node_paths` directly.
+"""
+
+from collections import deque
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+import utils as U
+
+TOKEN_PATTERN = re.compile(r"\w+(?:['’-]\w+)*")
+
+# spaCy's English stop words (`spacy.lang.en.stop_words.STOP_WORDS`), which spaCy term extraction
+# drops. A copy, so that the matcher does not need spaCy
+STOPWORDS = frozenset({
+    "'d", "'ll", "'m", "'re", "'s", "'ve", "a", "about", "above", "across", "after", "afterwards",
+    "again", "against", "all", "almost", "alone", "along", "already", "also", "although", "always",
+    "am", "among", "amongst", "amount", "an", "and", "another", "any", "anyhow", "anyone",
+    "anything", "anyway", "anywhere", "are", "around", "as", "at", "back", "be", "became",
+    "because", "become", "becomes", "becoming", "been", "before", "beforehand", "behind", "being",
+    "below", "beside", "besides", "between", "beyond", "both", "bottom", "but", "by", "ca", "call",
+    "can", "cannot", "could", "did", "do", "does", "doing", "done", "down", "due", "during", "each",
+    "eight", "either", "eleven", "else", "elsewhere", "empty", "enough", "even", "ever", "every",
+    "everyone", "everything", "everywhere", "except", "few", "fifteen", "fifty", "first", "five",
+    "for", "former", "formerly", "forty", "four", "from", "front", "full", "further", "get", "give",
+    "go", "had", "has", "have", "he", "hence", "her", "here", "hereafter", "hereby", "herein",
+    "hereupon", "hers", "herself", "him", "himself", "his", "how", "however", "hundred", "i", "if",
+    "in", "indeed", "into", "is", "it", "its", "itself", "just", "keep", "last", "latter",
+    "latterly", "least", "less", "made", "make", "many", "may", "me", "meanwhile", "might", "mine",
+    "more", "moreover", "most", "mostly", "move", "much", "must", "my", "myself", "n't", "name",
+    "namely", "neither", "never", "nevertheless", "next", "nine", "no", "nobody", "none", "noone",
+    "nor", "not", "nothing", "now", "nowhere", "n‘t", "n’t", "of", "off", "often", "on", "once",
+    "one", "only", "onto", "or", "other", "others", "otherwise", "our", "ours", "ourselves", "out",
+    "over", "own", "part", "per", "perhaps", "please", "put", "quite", "rather", "re", "really",
+    "regarding", "same", "say", "see", "seem", "seemed", "seeming", "seems", "serious", "several",
+    "she", "should", "show", "side", "since", "six", "sixty", "so", "some", "somehow", "someone",
+    "something", "sometime", "sometimes", "somewhere", "still", "such", "take", "ten", "than",
+    "that", "the", "their", "them", "themselves", "then", "thence", "there", "thereafter",
+    "thereby", "therefore", "therein", "thereupon", "these", "they", "third", "this", "those",
+    "though", "three", "through", "throughout", "thru", "thus", "to", "together", "too", "top",
+    "toward", "towards", "twelve", "twenty", "two", "under", "unless", "until", "up", "upon", "us",
+    "used", "using", "various", "very", "via", "was", "we", "well", "were", "what", "whatever",
+    "when", "whence", "whenever", "where", "whereafter", "whereas", "whereby", "wherein",
+    "whereupon", "wherever", "whether", "which", "while", "whither", "who", "whoever", "whole",
+    "whom", "whose", "why", "will", "with", "within", "without", "would", "yet", "you", "your",
+    "yours", "yourself", "yourselves", "‘d", "‘ll", "‘m", "‘re", "‘s", "‘ve", "’d", "’ll", "’m",
+    "’re", "’s", "’ve",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """split `text` into word tokens, hyphenated words and contractions stay one token."""
+    return TOKEN_PATTERN.findall(text)
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton whose alphabet are (normalized) tokens. Tokens are interned to ids
+    and all transitions live in one dict keyed by `state << 32 | token id`, which keeps an automaton
+    over all ConceptNet nodes in memory at a reasonable size.
+
+    Parameters
+    ----------
+    phrases : Iterable[tuple[Sequence[str], int]]
+        normalized token sequences and the value (node index) to return for them. If a sequence
+        occurs more than once, the first value is kept.
+    normalize : Callable[[str], str], optional
+        applied to every token of an input text, by default `utils.normalize_input`
+    exclude : Iterable[str], optional
+        phrases that are never reported, they still take part in longer phrases. By default the 
+        stopwords that spaCy term extraction drops (`STOPWORDS`).
+    """
+
+    def __init__(
+        self, phrases: Iterable[Tuple[Sequence[str], int]],
+        normalize: Callable[[str], str] =U.normalize_input, exclude: Iterable[str] =None
+    ):
+        self.normalize = normalize
+        self.vocab: Dict[str, int] = {}
+
+        self._goto: Dict[int, int] = {}
+        self._value = [-1]  # reported value per state, -1 for states that end no phrase
+        self._depth = [0]  # number of tokens on the way from the root
+        children: List[List[int]] = [[]]
+
+        excluded = set(STOPWORDS if exclude is None else exclude)
+
+        for tokens, value in phrases:
+            if not tokens:
+                continue
+
+            state = 0
+            for token in tokens:
+                token_id = self.vocab.setdefault(token, len(self.vocab))
+                key = state << 32 | token_id
+                child = self._goto.get(key)
+
+                if child is None:
+                    child = len(self._value)
+                    self._goto[key] = child
+                    self._value.append(-1)
+                    self._depth.append(self._depth[state] + 1)
+                    children.append([])
+                    children[state].append(token_id)
+
+                state = child
+
+            if self._value[state] < 0 and " ".join(tokens) not in excluded:
+                self._value[state] = value
+
+        # failure links (longest proper suffix that is a state) and output links (nearest state on
+        # the failure chain that ends a phrase), computed breadth first
+        self._fail = [0] * len(self._value)
+        self._output = [0] * len(self._value)
+
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+
+            for token_id in children[state]:
+                child = self._goto[state << 32 | token_id]
+                queue.append(child)
+
+                if state == 0:
+                    continue
+
+                fail = self._fail[state]
+                while fail and (fail << 32 | token_id) not in self._goto:
+                    fail = self._fail[fail]
+                fail = self._goto.get(fail << 32 | token_id, 0)
+
+                self._fail[child] = fail
+                self._output[child] = fail if self._value[fail] >= 0 else self._output[fail]
+
+    @classmethod
+    def from_graph(
+        cls, graph: U.ConceptNet, normalize: Callable[[str], str] =U.normalize_input,
+        exclude: Iterable[str] =None, max_tokens: int =None
+    ) -> "PhraseMatcher":
+        """build the automaton over all names in `graph.nodes_name2idx`. Every token of a name is
+        normalized with `normalize` as well, so that names and input texts agree token by token.
+
+        Parameters
+        ----------
+        graph : U.ConceptNet
+            graph whose nodes should be found
+        normalize : Callable[[str], str], optional
+            token normalization, by default `utils.normalize_input`
+        exclude : Iterable[str], optional
+            phrases that are never reported, by default the stopwords of spaCy term extraction
+        max_tokens : int, optional
+            skip names with more tokens, by default no limit
+
+        Returns
+        -------
+        PhraseMatcher
+            automaton that reports node indices
+        """
+
+        def phrases():
+            for name, idx in graph.nodes_name2idx.items():
+                tokens = tokenize(name)
+                if max_tokens is None or len(tokens) <= max_tokens:
+                    yield [normalize(t) for t in tokens], idx
+
+        return cls(phrases(), normalize=normalize, exclude=exclude)
+
+    def __len__(self) -> int:
+        """number of states."""
+        return len(self._value)
+
+    def match_tokens(self, tokens: Sequence[str]) -> Iterator[Tuple[int, int, int]]:
+        """find all phrases in a sequence of already normalized tokens.
+
+        Yields
+        ------
+        tuple[int, int, int]
+            start token, end token (exclusive) and value of each match, ordered by end token
+        """
+
+        goto, fail, value, output, depth = self._goto, self._fail, self._value, self._output, self._depth
+        state = 0
+
+        for i, token in enumerate(tokens):
+            token_id = self.vocab.get(token)
+            if token_id is None:
+                # unknown token, no phrase continues through it
+                state = 0
+                continue
+
+            while state and (state << 32 | token_id) not in goto:
+                state = fail[state]
+            state = goto.get(state << 32 | token_id, 0)
+
+            match = state if value[state] >= 0 else output[state]
+            while match:
+                yield i + 1 - depth[match], i + 1, value[match]
+                match = output[match]
+
+    def match(self, text: str) -> List[Tuple[int, int, int]]:
+        """find all phrases in `text`, see `match_tokens`. Positions refer to `tokenize(text)`."""
+        return list(self.match_tokens([self.normalize(t) for t in tokenize(text)]))
+
+    def extract(self, text: str) -> Set[int]:
+        """values (node indices) of all phrases in `text`."""
+        return {value for _, _, value in self.match(text)}
+
+    def extract_batch(self, texts: Iterable[str]) -> List[Set[int]]:
+        """`extract` for many texts, in input order."""
+        return [self.extract(text) for text in texts]
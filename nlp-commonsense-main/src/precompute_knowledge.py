@@ -0,0 +1,293 @@
+"""
+This script precomputes the knowledge for a whole dataset split and writes it to Parquet shards, so
+that training runs can load the knowledge instead of extracting it again. It should be executed via
+command line, e.g.
+
+    python precompute_knowledge.py ../data/raw/copa-train.jsonl ../data/processed/knowledge/copa-train
+
+The split is streamed (see `process_examples.iter_examples`): examples are read, processed and
+written one shard at a time. Each shard goes through batched node extraction, path search and
+rendering (see `qa_preprocessing.get_knowledge_for_nodes`). Shards are processed on several processes
+at once.
+
+Output layout
+-------------
+manifest.json
+    settings of the run, fingerprint of the graph and version of the term extraction; a rerun with 
+    other settings or another graph is refused
+shard-00000.parquet, shard-00001.parquet, ...
+    one row per example: idx, question, context, choices, knowledge (one string per choice), partial
+shard-00000.done, ...
+    checkpoints, written after their shard is complete
+
+A rerun (e.g. after a crash) skips all shards with a checkpoint and resumes with the first missing
+one.
+"""
+
+from collections import deque
+import itertools
+import json
+import multiprocessing
+import os
+from typing import Iterable, Iterator, List, Tuple
+
+from tqdm import tqdm
+import fire
+
+from phrase_matcher import PhraseMatcher
+from process_examples import Example, TermCache, iter_examples, term_extraction_version
+from qa_preprocessing import extract_nodes, get_knowledge_for_nodes
+import utils as U
+
+FORMAT_VERSION = 1
+
+# graph, matcher and term cache of worker processes, inherited via fork
+_worker_state = None
+
+
+def _shard_path(out_dir: str, shard_idx: int, suffix: str) -> str:
+    return os.path.join(out_dir, f"shard-{shard_idx:05d}.{suffix}")
+
+
+def is_shard_done(out_dir: str, shard_idx: int) -> bool:
+    return os.path.isfile(_shard_path(out_dir, shard_idx, "done"))
+
+
+def _iter_shards(examples: Iterable[Example], shard_size: int) -> Iterator[Tuple[int, int, List[Example]]]:
+    # (shard index, index of the first example, examples), only one shard in memory at a time
+    examples = iter(examples)
+    for shard_idx in itertools.count():
+        shard = list(itertools.islice(examples, shard_size))
+        if not shard:
+            return
+        yield shard_idx, shard_idx * shard_size, shard
+
+
+def premise_text(example: Example) -> str:
+    """text the premise-side terms are extracted from: context and question."""
+    return " ".join(t for t in (example["context"], example["question"]) if t)
+
+
+def process_shard(
+    examples: List[Example], first_idx: int, conceptnet: U.ConceptNet, matcher: PhraseMatcher =None,
+    term_cache: TermCache =None, max_paths: int =3, **kwargs
+):
+    """Knowledge for all examples of a shard as a `pyarrow.Table`. The nodes of all texts of the
+    shard are extracted in one batch.
+
+    Parameters
+    ----------
+    examples : list[Example]
+        examples as yielded by `iter_examples`
+    first_idx : int
+        index of the first example in the split
+    conceptnet : U.ConceptNet
+        knowledge base
+    matcher : PhraseMatcher, optional
+        extract nodes with this automaton instead of spaCy, by default None
+    term_cache : TermCache, optional
+        persistent cache for terms extracted with spaCy, by default None
+    max_paths : int, optional
+        maximum number of paths per choice, by default 3
+    **kwargs
+        further arguments for `qa_preprocessing.get_knowledge_for_nodes`
+    """
+
+    import pyarrow as pa
+
+    texts = list(dict.fromkeys(
+        t for e in examples for t in (premise_text(e), *e["choices"])
+    ))
+    nodes = dict(zip(texts, extract_nodes(texts, conceptnet, matcher, term_cache)))
+
+    knowledge = []
+    partial = []
+
+    for e in examples:
+        results, is_partial = get_knowledge_for_nodes(
+            nodes[premise_text(e)], [nodes[c] for c in e["choices"]], conceptnet, max_paths, **kwargs
+        )
+        knowledge.append(results)
+        partial.append(is_partial)
+
+    return pa.table({
+        "idx": pa.array(range(first_idx, first_idx + len(examples)), type=pa.int64()),
+        "question": pa.array([e["question"] for e in examples], type=pa.string()),
+        "context": pa.array([e["context"] for e in examples], type=pa.string()),
+        "choices": pa.array([e["choices"] for e in examples], type=pa.list_(pa.string())),
+        "knowledge": pa.array(knowledge, type=pa.list_(pa.string())),
+        "partial": pa.array(partial, type=pa.bool_()),
+    })
+
+
+def _write_shard(args) -> Tuple[int, int]:
+    shard_idx, first_idx, examples, out_dir, kwargs = args
+
+    import pyarrow.parquet as pq
+
+    conceptnet, matcher, term_cache = _worker_state
+    table = process_shard(examples, first_idx, conceptnet, matcher, term_cache, **kwargs)
+
+    # written under a temporary name first, an interrupted write never looks complete
+    path = _shard_path(out_dir, shard_idx, "parquet")
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    with open(_shard_path(out_dir, shard_idx, "done"), "w") as fp:
+        json.dump({"first_idx": first_idx, "num_examples": len(examples)}, fp)
+
+    return shard_idx, len(examples)
+
+
+def write_knowledge_shards(
+    examples: Iterable[Example], out_dir: str, conceptnet: U.ConceptNet, matcher: PhraseMatcher =None,
+    term_cache: TermCache =None, shard_size: int =1000, n_workers: int =None, settings: dict =None,
+    **kwargs
+) -> dict:
+    """Write the knowledge for `examples` to Parquet shards in `out_dir`, skipping shards that are
+    already done (see module docstring).
+
+    Parameters
+    ----------
+    examples : Iterable[Example]
+        examples, consumed lazily
+    out_dir : str
+        output directory, created if necessary
+    conceptnet : U.ConceptNet
+        knowledge base, inherited by the worker processes via fork
+    matcher : PhraseMatcher, optional
+        extract nodes with this automaton instead of spaCy, by default None
+    term_cache : TermCache, optional
+        persistent cache for terms extracted with spaCy, by default None
+    shard_size : int, optional
+        number of examples per shard, by default 1000
+    n_workers : int, optional
+        number of processes, by default the number of CPUs. With 1, everything runs in this process.
+    settings : dict, optional
+        further settings to record in (and compare with) the manifest, e.g. the source file
+    **kwargs
+        further arguments for `process_shard` (e.g. max_paths, weighted, deadline)
+
+    Returns
+    -------
+    dict
+        number of shards written and skipped and of examples written
+    """
+
+    global _worker_state
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # knowledge of another graph or term extraction must not be mixed with the existing shards
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "shard_size": shard_size,
+        "graph_fingerprint": U.graph_fingerprint(conceptnet),
+        "term_extraction_version": term_extraction_version(),
+        **kwargs,
+        **(settings or {}),
+    }
+    manifest_path = os.path.join(out_dir, "manifest.json")
+
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as fp:
+            previous = json.load(fp)
+        if previous != json.loads(json.dumps(manifest)):
+            raise ValueError(
+                f"{out_dir} was written with other settings ({previous}), use another directory"
+            )
+    else:
+        with open(manifest_path, "w") as fp:
+            json.dump(manifest, fp, indent=2)
+
+    stats = {"shards_written": 0, "shards_skipped": 0, "examples_written": 0}
+
+    def tasks():
+        for shard_idx, first_idx, shard in _iter_shards(examples, shard_size):
+            if is_shard_done(out_dir, shard_idx):
+                stats["shards_skipped"] += 1
+                continue
+            yield shard_idx, first_idx, shard, out_dir, kwargs
+
+    def record(result):
+        stats["shards_written"] += 1
+        stats["examples_written"] += result[1]
+        progress.update()
+
+    _worker_state = (conceptnet, matcher, term_cache)
+    progress = tqdm(unit="shard")
+
+    try:
+        if n_workers == 1:
+            for task in tasks():
+                record(_write_shard(task))
+        else:
+            # forked workers inherit the graph without pickling
+            with multiprocessing.get_context("fork").Pool(n_workers) as pool:
+                max_pending = 2 * (n_workers or os.cpu_count())
+                pending = deque()
+
+                for task in tasks():
+                    # at most two shards per worker in flight, the split is never read ahead further
+                    if len(pending) >= max_pending:
+                        record(pending.popleft().get())
+                    pending.append(pool.apply_async(_write_shard, (task,)))
+
+                while pending:
+                    record(pending.popleft().get())
+    finally:
+        _worker_state = None
+        progress.close()
+
+    return stats
+
+
+def precompute_knowledge(
+    src: str, out_dir: str, fmt: str =None, shard_size: int =1000, n_workers: int =None,
+    compressed: bool =False, matcher: bool =False, term_cache: str =None, max_paths: int =3,
+    weighted: bool =True, paths_per_pair: int =1, deadline: float =None, max_expansions: int =None
+):
+    """Precompute the knowledge for the dataset split `src` into `out_dir`, see module docstring.
+
+    Parameters
+    ----------
+    src : str
+        dataset split in a format understood by `iter_examples` (examples.txt format, JSONL or CSV)
+    out_dir : str
+        output directory
+    fmt : str, optional
+        format of `src`, by default derived from the file extension
+    shard_size : int, optional
+        number of examples per shard, by default 1000
+    n_workers : int, optional
+        number of processes, by default the number of CPUs
+    compressed : bool, optional
+        use the compressed graph (see `prepare_data.py compress-graph`), by default False
+    matcher : bool, optional
+        extract nodes with a `PhraseMatcher` instead of spaCy, by default False
+    term_cache : str, optional
+        SQLite file of a `TermCache` for terms extracted with spaCy, by default none
+    max_paths, weighted, paths_per_pair, deadline, max_expansions
+        see `qa_preprocessing.get_knowledge_for_example`
+    """
+
+    conceptnet = U.load_conceptnet(load_compressed=compressed, csr=True)
+
+    stats = write_knowledge_shards(
+        iter_examples(src, fmt), out_dir, conceptnet,
+        matcher=PhraseMatcher.from_graph(conceptnet) if matcher else None,
+        term_cache=TermCache(term_cache) if term_cache is not None else None,
+        shard_size=shard_size, n_workers=n_workers,
+        settings={"src": os.path.abspath(src), "compressed": compressed, "matcher": matcher},
+        max_paths=max_paths, weighted=weighted, paths_per_pair=paths_per_pair, deadline=deadline,
+        max_expansions=max_expansions,
+    )
+
+    print(
+        f"{stats['shards_written']} shards ({stats['examples_written']} examples) written, "
+        f"{stats['shards_skipped']} shards already done"
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(precompute_knowledge)
@@ -7,12 +7,31 @@ Steps
 -----
 1. Save the ConceptNet data under `../data/raw/conceptnet-assertions-5.7.0.csv.gz`
 2. Run `python prepare_data.py filter-conceptnet-en` to generate `../data/processed/en_edges.csv`
+   (or `--fmt parquet` for `../data/processed/en_edges.parquet`)
 3. Run `python prepare_data.py process-conceptnet-csv` to generate `../data/processed/graph_representation.joblib`
+   (add `--csr` to store the graph with the array-backed `utils.CSRAdjacency` and `utils.EdgeStore`) and the 
+   memory-mappable graph directory `../data/processed/graph_representation/` (see `graph_storage`).
+   Use `--n-workers` to normalize node names on several processes. The lemmas of all node names
+   are stored in `../data/processed/lemma_table/` and used by `utils.load_conceptnet`.
+
+An existing pickle can be converted to a graph directory with `python prepare_data.py convert-graph`.
+
+A smaller, pruned graph for `utils.load_conceptnet(load_compressed=True)` is built by
+`python prepare_data.py compress-graph` (see `compress_graph` for the pruning options). The options
+used are recorded in `../data/processed/graph_representation_compressed.manifest.json`.
+
+Changes of the source assertions can be applied to an existing graph without a full rebuild via
+`python prepare_data.py apply-delta --added added.csv.gz --removed removed.csv.gz`. Both files use the
+format of the raw dump. Existing node and label indices stay unchanged.
 """
 
 from collections import defaultdict
+import csv
 import gzip
 import json
+import multiprocessing
+import os
+from typing import Dict, Tuple
 
 import pandas as pd
 import numpy as np
@@ -21,70 +40,569 @@ import joblib
 import fire
 
 import utils as U
+import graph_storage
 
 LINE_COUNT = 34074917  # number of lines in conceptnet-assertions-5.7.0.csv.gz
 
 
-def filter_conceptnet_en():
+def filter_conceptnet_en(fmt: str = "csv", chunk_size: int = 100_000):
     """Read the raw conceptnet dump (.csv.gz), filter all edges between /c/en/* nodes and save them
-    to processed/en_edges.csv.
+    to processed/en_edges.csv (or processed/en_edges.parquet).
+
+    Edges are written while the dump is read, so memory usage does not depend on the size of the 
+    dump. In addition to the raw columns, the edge weight is extracted from the `info` JSON into a 
+    numeric `weight` column.
+
+    Parameters
+    ----------
+    fmt : str, optional
+        "csv" or "parquet" (requires pyarrow), by default "csv"
+    chunk_size : int, optional
+        number of edges per written chunk (parquet row group), by default 100_000
     """
 
-    raw_edges = []
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"unknown format {fmt}")
 
-    with gzip.open(
-        "../data/raw/conceptnet-assertions-5.7.0.csv.gz", mode="rt", encoding="utf-8"
-    ) as fp:
-        for line in tqdm(fp, total=LINE_COUNT):
-            parts = line.split("\t")
-            assert len(parts) == 5, f"Bad line: {parts}"
-            if not (parts[2].startswith("/c/en/") and parts[3].startswith("/c/en/")):
-                continue
-            raw_edges.append(parts)
+    columns = ["uri", "label", "start", "end", "info", "weight"]
+
+    if fmt == "csv":
+        out = open("../data/processed/en_edges.csv", "w", newline="", encoding="utf-8")
+        csv_writer = csv.writer(out)
+        csv_writer.writerow(["", *columns])  # unnamed index column, as written by pandas
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [(c, pa.string()) for c in columns[:-1]] + [("weight", pa.float64())]
+        )
+        parquet_writer = pq.ParquetWriter("../data/processed/en_edges.parquet", schema)
+
+    chunk = []
+    row_idx = 0
+
+    def flush():
+        if fmt == "csv":
+            # missing weights are written as empty fields, as pandas does for NaN
+            csv_writer.writerows(r if r[-1] == r[-1] else [*r[:-1], ""] for r in chunk)
+        else:
+            parquet_writer.write_table(
+                pa.Table.from_arrays(
+                    [pa.array([r[i + 1] for r in chunk], type=schema.field(i).type)
+                     for i in range(len(columns))],
+                    schema=schema,
+                )
+            )
+        chunk.clear()
+
+    try:
+        with gzip.open(
+            "../data/raw/conceptnet-assertions-5.7.0.csv.gz", mode="rt", encoding="utf-8"
+        ) as fp:
+            for line in tqdm(fp, total=LINE_COUNT):
+                parts = line.rstrip("\n").split("\t")
+                assert len(parts) == 5, f"Bad line: {parts}"
+                if not (parts[2].startswith("/c/en/") and parts[3].startswith("/c/en/")):
+                    continue
+
+                weight = json.loads(parts[4]).get("weight", np.nan)
+                chunk.append([row_idx, *parts, weight])
+                row_idx += 1
+
+                if len(chunk) >= chunk_size:
+                    flush()
+
+        if chunk:
+            flush()
+    finally:
+        if fmt == "csv":
+            out.close()
+        else:
+            parquet_writer.close()
 
-    df = pd.DataFrame(raw_edges, columns=["uri", "label", "start", "end", "info"])
 
-    df.to_csv("../data/processed/en_edges.csv")
+def process_conceptnet_csv(
+    csr: bool = False, fmt: str = "both", src: str = "../data/processed/en_edges.csv",
+    n_workers: int = 1
+):
+    """Build a ConceptNet object out of en_edges.csv and store it as graph_representation.joblib 
+    and/or as memory-mappable graph directory graph_representation/.
 
+    Every distinct node URI is normalized only once (optionally on several processes), edge end 
+    points and labels are mapped to indices via categorical codes and the graph is assembled from 
+    the resulting arrays. Node and label indices are the same as in earlier row-by-row builds.
 
-def process_conceptnet_csv():
-    """Build a ConceptNet object out of en_edges.csv and store it as graph_representation.joblib.
+    Parameters
+    ----------
+    csr : bool, optional
+        store adjacency lists and edge descriptors as `utils.CSRAdjacency` and `utils.EdgeStore` 
+        instead of dicts of sets, by default False
+    fmt : str, optional
+        one of "joblib", "dir" or "both", by default "both"
+    src : str, optional
+        filtered edges as written by `filter_conceptnet_en` (.csv or .parquet), by default 
+        ../data/processed/en_edges.csv
+    n_workers : int, optional
+        number of processes used for normalization, by default 1
     """
 
-    df = pd.read_csv("../data/processed/en_edges.csv")
+    if fmt not in ("joblib", "dir", "both"):
+        raise ValueError(f"unknown format {fmt}")
+
+    graph_repr, lemma_table = build_conceptnet(read_edges(src), csr=csr, n_workers=n_workers)
+
+    # lets normalization of known words skip the lemmatizer at runtime
+    graph_storage.save_string_map(lemma_table, "../data/processed/lemma_table")
+
+    if fmt in ("joblib", "both"):
+        joblib.dump(graph_repr, "../data/processed/graph_representation.joblib")
+    if fmt in ("dir", "both"):
+        graph_storage.save_graph_dir(graph_repr, "../data/processed/graph_representation")
+
+
+def read_edges(src: str) -> pd.DataFrame:
+    """Read filtered edges (.csv or .parquet) and make sure they have a numeric weight column."""
+
+    if src.endswith(".parquet"):
+        df = pd.read_parquet(src)
+    else:
+        df = pd.read_csv(src, index_col=0)
+
+    df = df.reset_index(drop=True)
+
+    if "weight" not in df:
+        # edges filtered before the weight column existed, extract it from the info JSON in bulk
+        df["weight"] = pd.to_numeric(
+            df["info"].str.extract(r'"weight":\s*([-+0-9.eE]+)', expand=False), errors="coerce"
+        )
+
+    return df
+
+
+def build_conceptnet(
+    df: pd.DataFrame, csr: bool = False, n_workers: int = 1
+) -> Tuple[U.ConceptNet, Dict[str, str]]:
+    """Build a ConceptNet object from a DataFrame with columns label, start, end and weight. The 
+    row position is used as `EdgeDescriptor.row_idx`.
+
+    Returns
+    -------
+    U.ConceptNet
+        the graph
+    dict[str, str]
+        lemma table mapping the surface form of every node to its lemma (see `U.set_lemma_table`)
+    """
 
     edges = list(sorted(df.label.unique()))
+    uris = sorted(set(df.start).union(set(df.end)))
+
+    # perform lemmatization etc to ensure that matching between nodes and words in examples works.
+    # many URIs share a surface form (/c/en/dog, /c/en/dog/n, ...), so each form is lemmatized once
+    surface_forms = [U.conceptnet_surface_form(s) for s in uris]
+    unique_forms = list(dict.fromkeys(surface_forms))
 
-    # perform lemmatization etc to ensure that matching between nodes and words in examples works
-    nodes = [U.normalize_conceptnet(s) for s in tqdm(sorted(set(df.start).union(set(df.end))))]
+    if n_workers > 1:
+        with multiprocessing.Pool(n_workers) as pool:
+            lemmas = list(tqdm(pool.imap(U.lemmatize, unique_forms, chunksize=4096), total=len(unique_forms)))
+    else:
+        lemmas = [U.lemmatize(s) for s in tqdm(unique_forms)]
+
+    lemma_table = dict(zip(unique_forms, lemmas))
+    nodes = [lemma_table[s] for s in surface_forms]
 
     nodes2idx = {node: idx for idx, node in enumerate(nodes)}
     edges2idx = {edge: idx for idx, edge in enumerate(edges)}
 
-    adjacency_list = defaultdict(set)
-    edges2description = defaultdict(set)
+    # several URIs can share a normalized name, they all map to the last node with that name
+    uri_code2idx = np.array([nodes2idx[node] for node in nodes], dtype=np.int64)
 
-    for row_idx, row in tqdm(df.iterrows(), total=len(df)):
-        start_idx = nodes2idx[U.normalize_conceptnet(row["start"])]
-        end_idx = nodes2idx[U.normalize_conceptnet(row["end"])]
+    start_idx = uri_code2idx[pd.Categorical(df.start, categories=uris).codes]
+    end_idx = uri_code2idx[pd.Categorical(df.end, categories=uris).codes]
+    label_idx = pd.Categorical(df.label, categories=edges).codes.astype(np.int32)
+    weights = df.weight.to_numpy(dtype=np.float64)
+    row_idx = np.arange(len(df), dtype=np.int64)
 
-        adjacency_list[start_idx].add(end_idx)
-        adjacency_list[end_idx].add(start_idx)  # undirected graph
+    if csr:
+        adjacency_list = U.CSRAdjacency.from_edges(start_idx, end_idx, len(nodes))
+        edges2description = U.EdgeStore.from_arrays(
+            start_idx, end_idx, label_idx, weights, row_idx, len(nodes)
+        )
+    else:
+        adjacency_list = defaultdict(set)
+        edges2description = defaultdict(set)
 
-        weight = json.loads(row["info"]).get("weight", np.nan)
+        for s, e, l, w, r in zip(
+            start_idx.tolist(), end_idx.tolist(), label_idx.tolist(), weights.tolist(), row_idx.tolist()
+        ):
+            adjacency_list[s].add(e)
+            adjacency_list[e].add(s)  # undirected graph
 
-        edges2description[(start_idx, end_idx)].add(
-            U.EdgeDescriptor(edges2idx[row["label"]], weight, row_idx)
-        )
+            edges2description[(s, e)].add(U.EdgeDescriptor(l, w, r))
 
     graph_repr = U.ConceptNet(
         nodes, nodes2idx, edges, edges2idx, adjacency_list, edges2description
     )
 
-    joblib.dump(graph_repr, "../data/processed/graph_representation.joblib")
+    return graph_repr, lemma_table
+
+
+def read_assertions(path: str) -> pd.DataFrame:
+    """Read English edges from a file in the format of the raw ConceptNet dump (optionally gzipped)."""
+
+    opener = gzip.open if path.endswith(".gz") else open
+
+    rows = []
+    with opener(path, mode="rt", encoding="utf-8") as fp:
+        for line in fp:
+            parts = line.rstrip("\n").split("\t")
+            assert len(parts) == 5, f"Bad line: {parts}"
+            if parts[2].startswith("/c/en/") and parts[3].startswith("/c/en/"):
+                rows.append(parts)
+
+    df = pd.DataFrame(rows, columns=["uri", "label", "start", "end", "info"])
+    df["weight"] = [json.loads(info).get("weight", np.nan) for info in df["info"]]
+
+    return df
+
+
+def _edge_arrays(graph: U.ConceptNet):
+    """all edges of `graph` as parallel arrays (starts, ends, labels, weights, rows)."""
+
+    edges = graph.edge_descriptors
+
+    if isinstance(edges, U.EdgeStore):
+        starts, ends = np.divmod(np.asarray(edges.pair_keys), edges.num_nodes)
+        return starts, ends, np.asarray(edges.label_idx), np.asarray(edges.weight), np.asarray(edges.row_idx)
+
+    flat = [(s, e, d.label_idx, d.weight, d.row_idx) for (s, e), ds in edges.items() for d in ds]
+    columns = list(zip(*flat)) or [[]] * 5
+
+    return tuple(np.asarray(c, dtype=t) for c, t in zip(columns, [np.int64] * 3 + [np.float64, np.int64]))
+
+
+def apply_delta_to_graph(
+    graph: U.ConceptNet, added: pd.DataFrame = None, removed: pd.DataFrame = None
+) -> U.ConceptNet:
+    """Add and remove edges from an existing graph. New nodes and labels are appended, so all 
+    existing indices stay valid. Removed edges are matched by (start, end, label); nodes are kept 
+    even if they lose all edges. Added edges get row_idx -1, as they are not in en_edges.csv.
+
+    Parameters
+    ----------
+    graph : U.ConceptNet
+        graph to patch, it is not modified
+    added : pd.DataFrame, optional
+        edges to add, with columns label, start, end, weight (see `read_assertions`)
+    removed : pd.DataFrame, optional
+        edges to remove, same columns as `added`
+
+    Returns
+    -------
+    U.ConceptNet
+        patched graph
+    """
+
+    nodes = list(graph.nodes_idx2name)
+    nodes2idx = dict(graph.nodes_name2idx)
+    labels = list(graph.labels_idx2name)
+    labels2idx = dict(graph.labels_name2idx)
+
+    def node_idx(uri: str, create: bool) -> int:
+        name = U.normalize_conceptnet(uri)
+        if name not in nodes2idx:
+            if not create:
+                return -1
+            nodes2idx[name] = len(nodes)
+            nodes.append(name)
+        return nodes2idx[name]
+
+    def label_idx(label: str, create: bool) -> int:
+        if label not in labels2idx:
+            if not create:
+                return -1
+            labels2idx[label] = len(labels)
+            labels.append(label)
+        return labels2idx[label]
+
+    to_remove = set()
+    if removed is not None:
+        for row in removed.itertuples():
+            s, e, l = node_idx(row.start, False), node_idx(row.end, False), label_idx(row.label, False)
+            if -1 not in (s, e, l):
+                to_remove.add((s, e, l))
+
+    to_add = []
+    if added is not None:
+        to_add = [
+            (node_idx(row.start, True), node_idx(row.end, True), label_idx(row.label, True), row.weight)
+            for row in added.itertuples()
+        ]
+
+    if isinstance(graph.adjacency_lists, U.CSRAdjacency) or isinstance(graph.edge_descriptors, U.EdgeStore):
+        starts, ends, label_ids, weights, rows = _edge_arrays(graph)
+
+        if to_remove:
+            keep = np.array(
+                [(s, e, l) not in to_remove for s, e, l in zip(starts.tolist(), ends.tolist(), label_ids.tolist())],
+                dtype=bool,
+            )
+            starts, ends, label_ids, weights, rows = (a[keep] for a in (starts, ends, label_ids, weights, rows))
+
+        if to_add:
+            s_add, e_add, l_add, w_add = (np.asarray(c) for c in zip(*to_add))
+            starts = np.concatenate([starts, s_add])
+            ends = np.concatenate([ends, e_add])
+            label_ids = np.concatenate([label_ids, l_add])
+            weights = np.concatenate([weights, w_add.astype(np.float64)])
+            rows = np.concatenate([rows, np.full(len(to_add), -1, dtype=np.int64)])
+
+        adjacency = U.CSRAdjacency.from_edges(starts, ends, len(nodes))
+        descriptors = U.EdgeStore.from_arrays(starts, ends, label_ids, weights, rows, len(nodes))
+
+        if not isinstance(graph.adjacency_lists, U.CSRAdjacency):
+            adjacency = {n: set(adjacency[n]) for n in range(len(nodes)) if adjacency.degree(n)}
+        if not isinstance(graph.edge_descriptors, U.EdgeStore):
+            descriptors = {pair: descriptors[pair] for pair in descriptors}
+
+        return U.ConceptNet(nodes, nodes2idx, labels, labels2idx, adjacency, descriptors)
+
+    # copies, the passed graph stays unchanged like in the CSR branch
+    adjacency = {n: set(neighbours) for n, neighbours in graph.adjacency_lists.items()}
+    descriptors = {pair: set(ds) for pair, ds in graph.edge_descriptors.items()}
+
+    for s, e, l in to_remove:
+        if (s, e) not in descriptors:
+            continue
+
+        descriptors[(s, e)] = {d for d in descriptors[(s, e)] if d.label_idx != l}
+        if not descriptors[(s, e)]:
+            del descriptors[(s, e)]
+
+            if (e, s) not in descriptors:
+                adjacency[s].discard(e)
+                adjacency[e].discard(s)
+
+    for s, e, l, w in to_add:
+        adjacency.setdefault(s, set()).add(e)
+        adjacency.setdefault(e, set()).add(s)
+        descriptors.setdefault((s, e), set()).add(U.EdgeDescriptor(l, w, -1))
+
+    return U.ConceptNet(nodes, nodes2idx, labels, labels2idx, adjacency, descriptors)
+
+
+def apply_delta(added: str = None, removed: str = None, compressed: bool = False):
+    """Patch graph_representation(_compressed) with added and removed assertions. Both the joblib 
+    pickle and the graph directory are updated, if they exist.
+
+    Parameters
+    ----------
+    added : str, optional
+        file with assertions to add, in the format of the raw dump (optionally gzipped)
+    removed : str, optional
+        file with assertions to remove, in the format of the raw dump (optionally gzipped)
+    compressed : bool, optional
+        patch the compressed graph instead of the full one, by default False
+    """
+
+    name = "graph_representation_compressed" if compressed else "graph_representation"
+    pickle_path = f"../data/processed/{name}.joblib"
+    dir_path = f"../data/processed/{name}"
+
+    if os.path.exists(pickle_path):
+        graph_repr = joblib.load(pickle_path)
+    elif graph_storage.is_graph_dir(dir_path):
+        graph_repr = graph_storage.load_graph_dir(dir_path)
+    else:
+        raise FileNotFoundError(f"no graph found at {pickle_path} or {dir_path}")
+
+    graph_repr = apply_delta_to_graph(
+        graph_repr,
+        read_assertions(added) if added else None,
+        read_assertions(removed) if removed else None,
+    )
+
+    # new files are written under temporary names and swapped in afterwards, so an interrupted run
+    # never leaves a half-written graph behind (`save_graph_dir` does the same for the directory, 
+    # which may still be memory-mapped by the loaded graph)
+    if os.path.exists(pickle_path):
+        joblib.dump(graph_repr, pickle_path + ".tmp")
+        os.replace(pickle_path + ".tmp", pickle_path)
+    if graph_storage.is_graph_dir(dir_path):
+        graph_storage.save_graph_dir(graph_repr, dir_path)
+
+
+DEFAULT_EXCLUDED_RELATIONS = (
+    "/r/ExternalURL", "/r/EtymologicallyRelatedTo", "/r/EtymologicallyDerivedFrom"
+)
+
+
+def compress_conceptnet(
+    graph: U.ConceptNet,
+    relations: list = None,
+    exclude_relations: list = DEFAULT_EXCLUDED_RELATIONS,
+    min_weight: float = None,
+    min_degree: int = 1,
+    max_degree: int = None,
+    remove_top_hubs: int = 0,
+    csr: bool = False,
+):
+    """Prune a graph and reindex the remaining nodes densely. Steps, in this order:
+
+    1. keep only edges with a label in `relations` (if given) and not in `exclude_relations`
+    2. drop edges with a weight below `min_weight` (if given, edges without weight are dropped too)
+    3. remove hubs: nodes with more than `max_degree` neighbours and the `remove_top_hubs` nodes with 
+       the most neighbours
+    4. remove nodes with less than `min_degree` neighbours (single pass)
+    5. drop nodes without edges and reindex, keeping the relative order of nodes
+
+    Labels are kept unchanged.
+
+    Returns
+    -------
+    U.ConceptNet
+        pruned graph
+    dict
+        number of nodes/edges before and after pruning
+    """
+
+    num_nodes = len(graph.nodes_idx2name)
+    starts, ends, label_ids, weights, rows = _edge_arrays(graph)
+    stats = {"nodes_before": num_nodes, "edges_before": int(len(starts))}
+
+    def keep_edges(mask):
+        nonlocal starts, ends, label_ids, weights, rows
+        starts, ends, label_ids, weights, rows = (a[mask] for a in (starts, ends, label_ids, weights, rows))
+
+    def degrees():
+        return np.diff(U.CSRAdjacency.from_edges(starts, ends, num_nodes).indptr.astype(np.int64))
+
+    def remove_nodes(removed):
+        keep_edges(~(removed[starts] | removed[ends]))
+
+    def label_mask(names):
+        ids = [graph.labels_name2idx[n] for n in names if n in graph.labels_name2idx]
+        return np.isin(label_ids, ids)
+
+    if relations is not None:
+        keep_edges(label_mask(relations))
+    if exclude_relations:
+        keep_edges(~label_mask(exclude_relations))
+    if min_weight is not None:
+        keep_edges(weights >= min_weight)
+
+    degree = degrees()
+    hubs = np.zeros(num_nodes, dtype=bool)
+    if max_degree is not None:
+        hubs |= degree > max_degree
+    if remove_top_hubs:
+        hubs[np.argsort(-degree, kind="stable")[:remove_top_hubs]] = True
+    remove_nodes(hubs)
+
+    if min_degree > 1:
+        remove_nodes(degrees() < min_degree)
+
+    # dense reindexing of all nodes that still have edges
+    kept = degrees() > 0
+    old2new = np.full(num_nodes, -1, dtype=np.int64)
+    old2new[kept] = np.arange(int(kept.sum()))
+
+    nodes = [graph.nodes_idx2name[i] for i in np.flatnonzero(kept).tolist()]
+
+    # names keep their node if it survives, otherwise they map to the last surviving node with
+    # that name (several nodes can share a normalized name)
+    nodes2idx = {name: idx for idx, name in enumerate(nodes)}
+    nodes2idx.update(
+        (name, int(old2new[idx])) for name, idx in graph.nodes_name2idx.items() if kept[idx]
+    )
+
+    starts, ends = old2new[starts], old2new[ends]
+    adjacency = U.CSRAdjacency.from_edges(starts, ends, len(nodes))
+    descriptors = U.EdgeStore.from_arrays(starts, ends, label_ids, weights, rows, len(nodes))
+
+    if not csr:
+        adjacency = {n: set(adjacency[n]) for n in range(len(nodes))}
+        descriptors = {pair: descriptors[pair] for pair in descriptors}
+
+    stats.update({"nodes_after": len(nodes), "edges_after": int(len(starts))})
+
+    compressed = U.ConceptNet(
+        nodes, nodes2idx, list(graph.labels_idx2name), dict(graph.labels_name2idx), adjacency, descriptors
+    )
+
+    return compressed, stats
+
+
+def compress_graph(
+    relations: list = None,
+    exclude_relations: list = DEFAULT_EXCLUDED_RELATIONS,
+    min_weight: float = None,
+    min_degree: int = 1,
+    max_degree: int = None,
+    remove_top_hubs: int = 0,
+    csr: bool = False,
+    fmt: str = "both",
+):
+    """Build graph_representation_compressed(.joblib) from the full graph with `compress_conceptnet`
+    and write a manifest with the options, the fingerprint of the source graph and the resulting 
+    sizes, so the compressed graph can be rebuilt exactly.
+
+    Parameters are the ones of `compress_conceptnet`; `fmt` is one of "joblib", "dir" or "both".
+    """
+
+    if fmt not in ("joblib", "dir", "both"):
+        raise ValueError(f"unknown format {fmt}")
+
+    options = {
+        "relations": list(relations) if relations is not None else None,
+        "exclude_relations": list(exclude_relations or []),
+        "min_weight": min_weight,
+        "min_degree": min_degree,
+        "max_degree": max_degree,
+        "remove_top_hubs": remove_top_hubs,
+    }
+
+    graph_repr = U.load_conceptnet()
+    compressed, stats = compress_conceptnet(graph_repr, csr=csr, **options)
+
+    if fmt in ("joblib", "both"):
+        joblib.dump(compressed, "../data/processed/graph_representation_compressed.joblib")
+    if fmt in ("dir", "both"):
+        graph_storage.save_graph_dir(compressed, "../data/processed/graph_representation_compressed")
+
+    with open("../data/processed/graph_representation_compressed.manifest.json", "w") as fp:
+        json.dump(
+            {
+                "source_fingerprint": U.graph_fingerprint(graph_repr),
+                "fingerprint": U.graph_fingerprint(compressed),
+                "options": options,
+                **stats,
+            },
+            fp,
+            indent=2,
+        )
+
+
+def convert_graph(compressed: bool = False):
+    """Convert graph_representation(_compressed).joblib into the memory-mappable graph directory 
+    format read by `utils.load_conceptnet`.
+
+    Parameters
+    ----------
+    compressed : bool, optional
+        convert the compressed graph instead of the full one, by default False
+    """
+
+    name = "graph_representation_compressed" if compressed else "graph_representation"
+
+    graph_repr = joblib.load(f"../data/processed/{name}.joblib")
+    graph_storage.save_graph_dir(graph_repr, f"../data/processed/{name}")
 
 if __name__ == "__main__":
     fire.Fire({
         "filter-conceptnet-en": filter_conceptnet_en,
         "process-conceptnet-csv": process_conceptnet_csv,
+        "convert-graph": convert_graph,
+        "apply-delta": apply_delta,
+        "compress-graph": compress_graph,
     })
\ No newline at end of file
@@ -1,26 +1,172 @@
 """
-Functions to transform examples.txt into machine readable form and to extract terms from example 
-questions.
+Functions to transform examples.txt (and COPA/CommonsenseQA-shaped JSONL or CSV files) into machine 
+readable form and to extract terms from example questions.
 """
 
-from typing import Dict, List, Set, Tuple, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+import csv
+import gzip
+import hashlib
 import itertools
-
-import spacy
+import json
+import os
+import re
+import sqlite3
+import threading
 
 import utils as U
 
-nlp = spacy.load("en_core_web_sm")
-stopwords = set(nlp.Defaults.stop_words).union({",", ".", "?", ":", ";"})
+SPACY_MODEL = "en_core_web_sm"
 
+# increase whenever term extraction or `utils.normalize_input` changes its output, so that 
+# `TermCache` entries of the old version are dropped
+TERM_EXTRACTION_VERSION = 1
 
-def load_examples() -> List[Dict[str, Union[str, List[str]]]]:
-    """Quick and dirty parser to turn examples.txt into a machine-readable form.
+# loaded on first use by `get_nlp`, importing this module must not load spaCy
+_nlp = None
+_stopwords = None
 
-    Returns
-    -------
-    list[dict[str, Union[str, list[str]]]]
-        list of examples. Each examples is of the form
+# pipeline components `Doc.noun_chunks` depends on (dependency parse and coarse POS tags), all 
+# others (NER, lemmatizer, ...) are disabled during term extraction
+NOUN_CHUNK_COMPONENTS = ("tok2vec", "tagger", "attribute_ruler", "parser")
+
+
+def get_nlp():
+    """The spaCy pipeline used for term extraction, loaded on first use."""
+
+    global _nlp
+
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load(SPACY_MODEL)
+
+    return _nlp
+
+
+def get_stopwords() -> Set[str]:
+    """spaCy stop words plus punctuation, loaded on first use."""
+
+    global _stopwords
+
+    if _stopwords is None:
+        from spacy.lang.en.stop_words import STOP_WORDS
+        _stopwords = set(STOP_WORDS).union({",", ".", "?", ":", ";"})
+
+    return _stopwords
+
+
+def __getattr__(name):
+    # `nlp` and `stopwords` used to be module attributes, keep them available (lazily)
+    if name == "nlp":
+        return get_nlp()
+    if name == "stopwords":
+        return get_stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+Example = Dict[str, Union[str, List[str]]]
+
+# numbered choice columns, e.g. choice1, choice2, ... or answerA, answerB, ... (Social IQa)
+CHOICE_KEY_PATTERN = re.compile(r"(choice|answer)(\d+|[A-Za-z])")
+
+
+def _parse_text_example(block: str) -> Example:
+    parts = block.split("\n")
+
+    question = next(
+        (
+            U.removeprefix(p, "Question:").strip()
+            for p in parts
+            if p.startswith("Question: ")
+        ),
+        "",
+    )
+    context = next(
+        (
+            U.removeprefix(p, "Context:").strip()
+            for p in parts
+            if p.startswith("Context: ")
+        ),
+        "",
+    )
+    choices = [p.split(")")[1].strip() for p in parts if p.startswith("(")]
+
+    return {"question": question, "context": context, "choices": choices}
+
+
+def _iter_text_examples(lines: Iterable[str]) -> Iterator[Example]:
+    # every "#" starts a new example, text before the first one is ignored
+    block = None
+
+    for line in lines:
+        head, *rest = line.split("#")
+
+        if block is not None:
+            block.append(head)
+
+        for piece in rest:
+            if block is not None:
+                yield _parse_text_example("".join(block))
+            block = [piece]
+
+    if block is not None:
+        yield _parse_text_example("".join(block))
+
+
+def _record_to_example(record: dict) -> Example:
+    """convert a COPA, CommonsenseQA, Social IQa or already converted record to the example schema."""
+
+    question = record.get("question", "")
+    context = record.get("context", "")
+
+    if isinstance(question, dict):
+        # CommonsenseQA jsonl: {"question": {"stem": ..., "choices": [{"label": ..., "text": ...}]}}
+        choices = [c["text"] for c in question.get("choices", [])]
+        question = question.get("stem", "")
+    elif "premise" in record:
+        # COPA: the question field names the asked relation ("cause" or "effect")
+        context = record["premise"]
+        question = f"What was the {question}?" if question in ("cause", "effect") else question
+        choices = [record["choice1"], record["choice2"]]
+    elif "choices" in record:
+        choices = record["choices"]
+        if isinstance(choices, str):
+            # CSV columns can only hold the choices as JSON
+            choices = json.loads(choices)
+        if isinstance(choices, dict):
+            # CommonsenseQA on the huggingface hub: {"label": [...], "text": [...]}
+            choices = choices["text"]
+    else:
+        # numbered columns, in numeric order (choice10 after choice9). Empty choices are kept, 
+        # missing ones (None) are not
+        numbered = []
+        for k, v in record.items():
+            match = CHOICE_KEY_PATTERN.fullmatch(k)
+            if match and v is not None:
+                prefix, suffix = match.groups()
+                numbered.append(((prefix, int(suffix) if suffix.isdigit() else -1, suffix), v))
+
+        choices = [v for _, v in sorted(numbered, key=lambda x: x[0])]
+
+    return {"question": question or "", "context": context or "", "choices": list(choices)}
+
+
+def iter_examples(path: str ="../data/raw/examples.txt", fmt: str =None) -> Iterator[Example]:
+    """Read examples lazily, one at a time, so that corpora of any size can be streamed.
+
+    Parameters
+    ----------
+    path : str, optional
+        file to read, by default "../data/raw/examples.txt". Files ending in ".gz" are decompressed.
+    fmt : str, optional
+        "txt" (format of examples.txt), "jsonl" or "csv", by default derived from the file extension. 
+        JSONL and CSV records can be shaped like COPA, CommonsenseQA or Social IQa records, or use 
+        the example schema directly.
+
+    Yields
+    ------
+    dict[str, Union[str, list[str]]]
+        examples of the form
             {
                 "question": QUESTION,
                 "context": CONTEXT or "",
@@ -28,76 +174,264 @@ def load_examples() -> List[Dict[str, Union[str, List[str]]]]:
             }
     """
 
-    with open("../data/raw/examples.txt") as fp:
-        data = fp.read()
+    name = U.removesuffix(path, ".gz")
+
+    if fmt is None:
+        fmt = os.path.splitext(name)[1].lstrip(".")
+        fmt = {"json": "jsonl", "tsv": "csv"}.get(fmt, fmt)
+
+    if fmt not in ("txt", "jsonl", "csv"):
+        raise ValueError(f"unknown example format {fmt!r}")
+
+    opener = gzip.open if path.endswith(".gz") else open
+
+    with opener(path, "rt", encoding="utf-8", newline="" if fmt == "csv" else None) as fp:
+        if fmt == "txt":
+            yield from _iter_text_examples(fp)
+        elif fmt == "jsonl":
+            for line in fp:
+                if line.strip():
+                    yield _record_to_example(json.loads(line))
+        else:
+            dialect = "excel-tab" if name.endswith(".tsv") else "excel"
+            for record in csv.DictReader(fp, dialect=dialect):
+                yield _record_to_example(record)
+
+
+def load_examples(path: str ="../data/raw/examples.txt", fmt: str =None) -> List[Example]:
+    """Quick and dirty parser to turn examples.txt into a machine-readable form. All examples are 
+    loaded at once, use `iter_examples` to stream large files.
+
+    Returns
+    -------
+    list[dict[str, Union[str, list[str]]]]
+        list of examples, see `iter_examples`
+    """
+
+    return list(iter_examples(path, fmt))
 
-    examples = data.split("#")[1:]
 
-    parsed = []
+def term_extraction_version() -> str:
+    """version of the output of `extract_terms`: spaCy model, model version and 
+    `TERM_EXTRACTION_VERSION`. Determined without loading spaCy."""
 
-    for e in examples:
-        parts = e.split("\n")
+    from importlib import metadata
 
-        question = next(
-            (
-                U.removeprefix(p, "Question:").strip()
-                for p in parts
-                if p.startswith("Question: ")
-            ),
-            "",
-        )
-        context = next(
-            (
-                U.removeprefix(p, "Context:").strip()
-                for p in parts
-                if p.startswith("Context: ")
-            ),
-            "",
-        )
-        choices = [p.split(")")[1].strip() for p in parts if p.startswith("(")]
+    try:
+        model_version = metadata.version(SPACY_MODEL)
+    except metadata.PackageNotFoundError:
+        model_version = "unknown"
 
-        parsed.append({"question": question, "context": context, "choices": choices})
+    return f"{SPACY_MODEL}=={model_version}/{TERM_EXTRACTION_VERSION}"
 
-    return parsed
 
+class TermCache:
+    """Persistent cache for `extract_terms_batch` in a SQLite file: sha1 of the text -> term set. 
+    Entries of other versions (see `term_extraction_version`) are deleted on first use. The file 
+    holds at most `capacity` entries, the least recently used ones are evicted.
 
-def extract_terms(input: str) -> Set[str]:
+    Several processes and threads can use the same file at once: every process and thread opens its 
+    own connection (also after fork or unpickling) and SQLite serializes the writes.
+
+    Attributes
+    ----------
+    hits:
+        number of texts found in the cache
+    misses:
+        number of texts not found in the cache
+    """
+
+    def __init__(self, db_path: str, capacity: int =1_000_000, version: str =None):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.version = version if version is not None else term_extraction_version()
+        self.hits = 0
+        self.misses = 0
+        # connection of each thread, with the pid it was opened in
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "con", None) is None or local.pid != os.getpid():
+            con = sqlite3.connect(self.db_path, timeout=60)
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                con.execute(
+                    """CREATE TABLE IF NOT EXISTS terms (
+                        key TEXT PRIMARY KEY, version TEXT, terms TEXT, last_used INTEGER
+                    )"""
+                )
+                con.execute("CREATE INDEX IF NOT EXISTS terms_last_used ON terms (last_used)")
+                con.execute("DELETE FROM terms WHERE version != ?", (self.version,))
+
+            local.con = con
+            local.pid = os.getpid()
+
+        return local.con
+
+    def _counter(self, con: sqlite3.Connection) -> int:
+        (counter,) = con.execute("SELECT COALESCE(MAX(last_used), 0) FROM terms").fetchone()
+        return counter
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[Set[str]]]:
+        """cached term sets of `texts`, None for texts that are not cached."""
+
+        keys = [self.key(text) for text in texts]
+        found = {}
+        con = self._connect()
+
+        with con:
+            # chunked to stay below SQLite's limit on query parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                found.update(con.execute(
+                    f"SELECT key, terms FROM terms WHERE version = ? AND key IN ({','.join('?' * len(chunk))})",
+                    (self.version, *chunk),
+                ).fetchall())
+
+            if found:
+                counter = self._counter(con)
+                con.executemany(
+                    "UPDATE terms SET last_used = ? WHERE key = ?",
+                    ((counter + i + 1, key) for i, key in enumerate(found)),
+                )
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return [set(json.loads(found[key])) if key in found else None for key in keys]
+
+    def put_many(self, texts: Sequence[str], terms: Sequence[Set[str]]):
+        """store the term sets of `texts` and evict the least recently used entries."""
+
+        con = self._connect()
+
+        with con:
+            counter = self._counter(con)
+            con.executemany(
+                "INSERT OR REPLACE INTO terms VALUES (?, ?, ?, ?)",
+                (
+                    (self.key(text), self.version, json.dumps(sorted(t)), counter + i + 1)
+                    for i, (text, t) in enumerate(zip(texts, terms))
+                ),
+            )
+            con.execute(
+                "DELETE FROM terms WHERE last_used <= "
+                "(SELECT COALESCE(MAX(last_used), 0) FROM terms) - ?",
+                (self.capacity,),
+            )
+
+    def __len__(self) -> int:
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM terms").fetchone()
+        return count
+
+    def close(self):
+        """close the connection of the calling thread."""
+        if getattr(self._local, "con", None) is not None:
+            self._local.con.close()
+            self._local.con = None
+
+
+def _unused_components(nlp) -> List[str]:
+    return [name for name in nlp.pipe_names if name not in NOUN_CHUNK_COMPONENTS]
+
+
+def _terms_from_doc(doc, stopwords: Set[str]) -> Set[str]:
+    token_texts = (U.normalize_input(t.text) for t in itertools.chain(doc, doc.noun_chunks))
+
+    return set(
+        U.removeprefix(U.removeprefix(U.removeprefix(t, "the "), "a "), "an ")
+        for t in token_texts
+        if t not in stopwords
+    )
+
+
+def extract_terms_batch(
+    texts: Iterable[str], batch_size: int =256, n_process: int =1, cache: TermCache =None
+) -> List[Set[str]]:
+    """extract terms from many strings at once, see `extract_terms`. The strings are streamed 
+    through `nlp.pipe` with only the components needed for noun chunks enabled.
+
+    Parameters
+    ----------
+    texts : Iterable[str]
+        strings to extract terms from
+    batch_size : int, optional
+        number of strings spaCy processes at once, by default 256
+    n_process : int, optional
+        number of processes used by spaCy, by default 1
+    cache : TermCache, optional
+        persistent cache, only strings missing in it are processed by spaCy, by default None
+
+    Returns
+    -------
+    list[set[str]]
+        set of terms for each string, in input order
+    """
+
+    if cache is not None:
+        texts = list(texts)
+        results = cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+
+        if missing:
+            extracted = dict(zip(missing, extract_terms_batch(missing, batch_size, n_process)))
+            cache.put_many(missing, [extracted[t] for t in missing])
+            results = [r if r is not None else set(extracted[t]) for t, r in zip(texts, results)]
+
+        return results
+
+    nlp = get_nlp()
+    stopwords = get_stopwords()
+
+    docs = nlp.pipe(
+        texts, batch_size=batch_size, n_process=n_process, disable=_unused_components(nlp)
+    )
+
+    return [_terms_from_doc(doc, stopwords) for doc in docs]
+
+
+def extract_terms(input: str, cache: TermCache =None) -> Set[str]:
     """extract terms from a string. Terms are all tokens and noun chunks that are no stopwords. Spacy is used for processing
 
     Parameters
     ----------
     input : str
         string to extract terms from
+    cache : TermCache, optional
+        persistent cache for extracted terms, by default None
 
     Returns
     -------
     set[str]
         set of terms
     """
-    doc = nlp(input)
 
-    tokens = [*doc, *doc.noun_chunks]
+    return extract_terms_batch([input], cache=cache)[0]
 
-    token_texts = [
-        U.normalize_input(t.text)
-        for t in tokens
-        if U.normalize_input(t.text) not in stopwords
-    ]
-    token_texts = set(
-        U.removeprefix(U.removeprefix(U.removeprefix(t, "the "), "a "), "an ")
-        for t in token_texts
-    )
 
-    return token_texts
-
-
-def extract_terms_from_example(example: dict) -> Tuple[Set[str], Set[str]]:
-    """extract terms from an example using `extract_terms`.
+def extract_terms_from_example(example: dict, cache: TermCache =None) -> Tuple[Set[str], Set[str]]:
+    """extract terms from an example using `extract_terms_batch`.
 
     Parameters
     ----------
     example : dict
         example as returned by `load_examples`.
+    cache : TermCache, optional
+        persistent cache for extracted terms, by default None
 
     Returns
     -------
@@ -107,14 +441,11 @@ def extract_terms_from_example(example: dict) -> Tuple[Set[str], Set[str]]:
         all terms appearing in one of the answer choices
     """
 
-    question_context = set(
-        itertools.chain(
-            extract_terms(example["question"]), extract_terms(example["context"])
-        )
+    question_terms, context_terms, *choice_terms = extract_terms_batch(
+        [example["question"], example["context"], *example["choices"]], cache=cache
     )
 
-    choices = set(
-        itertools.chain.from_iterable(extract_terms(c) for c in example["choices"])
-    )
+    question_context = question_terms | context_terms
+    choices = set(itertools.chain.from_iterable(choice_terms))
 
     return question_context, choices
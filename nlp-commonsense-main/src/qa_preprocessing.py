@@ -1,14 +1,312 @@
-from typing import List
+"""
+Extraction of knowledge paths for Q&A examples, for single examples (`get_knowledge_for_example`), 
+all choices of an example (`get_knowledge_for_choices`) and for whole datasets on several processes 
+(`get_knowledge_for_examples`).
+"""
 
-from process_examples import extract_terms
-from find_shortest_path import find_word_path
+import heapq
+import logging
+import multiprocessing
+import time
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
+from process_examples import TermCache, extract_terms_batch
+from find_shortest_path import (
+    ExpansionBudget, PathCache, find_node_paths, search_best_path, search_shortest_path,
+    search_top_k_paths
+)
+from phrase_matcher import PhraseMatcher
 from renderer import render_path_natural
-from utils import ConceptNet, prod
+from utils import (
+    ConceptNet, CSRAdjacency, neighbour_weights, normalize_input, path_weights, prod, unit_weights
+)
+
+
+def _resolve_terms(terms: Iterable[str], conceptnet: ConceptNet) -> Set[int]:
+    nodes = set()
+    for term in terms:
+        idx = conceptnet.nodes_name2idx.get(normalize_input(term))
+        if idx is not None:
+            nodes.add(idx)
+    return nodes
+
+
+def extract_nodes(
+    texts: List[str], conceptnet: ConceptNet, matcher: PhraseMatcher =None, term_cache: TermCache =None
+) -> List[Set[int]]:
+    """graph nodes mentioned in each text, found by `matcher` if given, else by spaCy term 
+    extraction (see `extract_terms_batch`) and normalization of the terms."""
+
+    if matcher is not None:
+        return matcher.extract_batch(texts)
+
+    return [_resolve_terms(terms, conceptnet) for terms in extract_terms_batch(texts, cache=term_cache)]
+
+
+class _TopPaths:
+    """Bounded selection of the best `k` raw paths, primarily by lower number of edges and 
+    secondarily by higher product of edge weights, ties in order of arrival. The worst selected 
+    path is at the top of a heap, so every candidate costs O(log k).
+    """
+
+    def __init__(self, k: int, conceptnet: ConceptNet):
+        self.k = k
+        self.conceptnet = conceptnet
+        self.count = 0
+        self._heap = []  # (-edges, weight product, -arrival, path, weights), worst first
+
+    def worst_edges(self) -> Optional[int]:
+        """number of edges of the worst selected path once `k` paths are selected, else None."""
+        return -self._heap[0][0] if self.k and len(self._heap) >= self.k else None
+
+    def max_path_len(self, max_path_len: int) -> int:
+        """max. number of nodes a path still needs to be able to enter the selection."""
+        worst = self.worst_edges()
+        return max_path_len if worst is None else min(max_path_len, worst + 1)
+
+    def push(self, path: List[int]):
+        if len(path) < 2:
+            # nothing to describe
+            return
+
+        self.count += 1  # arrival order, for ties
+        worst = self.worst_edges()
+        if self.k == 0 or worst is not None and len(path) - 1 > worst:
+            return
+
+        weights = path_weights(self.conceptnet, path)
+        item = (-(len(path) - 1), prod(weights), -self.count, path, weights)
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:3] > self._heap[0][:3]:
+            heapq.heapreplace(self._heap, item)
+
+    def paths(self) -> List[List[int]]:
+        """selected paths, best first if the selection is full (searches may have been cut short 
+        then, so it is unknown whether paths were dropped), else in arrival order."""
+        if self.worst_edges() is None:
+            return [item[3] for item in sorted(self._heap, key=lambda x: -x[2])]
+        return [item[3] for item in sorted(self._heap, reverse=True)]
+
+
+def _render_paths(paths: List[List[int]], conceptnet: ConceptNet, raw_output: bool):
+    # only the selected paths are rendered
+    rendered = [render_path_natural(p, conceptnet) for p in paths]
+
+    if not raw_output:
+        return " ".join(context for context, _ in rendered)
+    else:
+        return rendered
+
+
+def _search_anytime(
+    p_nodes: Set[int], c_nodes: List[Set[int]], selections: List[_TopPaths], conceptnet: ConceptNet,
+    weighted: bool, paths_per_pair: int, deadline_at: Optional[float], max_expansions: Optional[int],
+    cache: Optional[PathCache]
+) -> bool:
+    """search the term pairs one at a time, most promising (lowest degree) first, until all are 
+    done, `max_expansions` expansions were made in total or `deadline_at` (`time.monotonic()`) has 
+    passed. The deadline is also checked inside the searches. With one path per pair, complete 
+    results are taken from and stored in `cache`. Returns whether the result is partial."""
+
+    adjacency = conceptnet.adjacency_lists
+
+    def degree(node):
+        if isinstance(adjacency, CSRAdjacency):
+            return adjacency.degree(node)
+        return len(adjacency.get(node, ()))
+
+    # selections each pair can contribute to
+    pairs = {}
+    for nodes, selection in zip(c_nodes, selections):
+        for start in p_nodes:
+            for end in nodes:
+                pairs.setdefault((start, end), []).append(selection)
+
+    # pairs of specific (low-degree) nodes are cheap to search and give the most specific knowledge
+    order = sorted(pairs, key=lambda pair: degree(pair[0]) + degree(pair[1]))
+    edge_weights = neighbour_weights(conceptnet) if weighted else unit_weights(conceptnet)
+    # one budget for the whole call, so neither the deadline nor the work limit depend on the 
+    # number of pairs
+    budget = ExpansionBudget(max_expansions, deadline=deadline_at)
+    partial = False
+
+    if paths_per_pair > 1:
+        # the cache holds single paths
+        cache = None
+    variant = "weighted" if weighted else "bfs"
+
+    def key(start, end):
+        names = conceptnet.nodes_idx2name
+        return PathCache.key(names[start], names[end], 3, conceptnet, variant)
+
+    for start, end in order:
+        if budget.exhausted():
+            return True
+
+        targets = pairs[(start, end)]
+        max_path_len = max(selection.max_path_len(3) for selection in targets)
+
+        cached = cache.get(key(start, end)) if cache is not None else None
+        if cached is not None:
+            # a shortest path within 3 nodes is also the one for shorter limits
+            found, truncated = [cached], False
+        elif paths_per_pair > 1:
+            found, truncated = search_top_k_paths(
+                start, end, adjacency, edge_weights, paths_per_pair, max_path_len=max_path_len,
+                return_truncated=True, budget=budget
+            )
+        elif weighted:
+            # Dijkstra settles a direct edge right away, even next to a hub
+            path, truncated = search_best_path(
+                start, end, adjacency, edge_weights, max_path_len=max_path_len,
+                return_truncated=True, budget=budget
+            )
+            found = [path]
+        else:
+            path, truncated = search_shortest_path(
+                start, end, adjacency, max_path_len=max_path_len, bidirectional=True,
+                return_truncated=True, budget=budget
+            )
+            found = [path]
+
+        if cache is not None and cached is None and not truncated and max_path_len == 3:
+            cache.put(key(start, end), found[0] if found else [])
+
+        partial = partial or truncated
+
+        for selection in targets:
+            limit = selection.max_path_len(3)
+            for path in found:
+                if len(path) <= limit:
+                    selection.push(path)
+
+    return partial
+
+
+def get_knowledge_for_choices(
+    premise_question: str, choices: List[str], conceptnet: ConceptNet, max_paths: int, raw_output: bool=False,
+    weighted: bool=True, paths_per_pair: int=1, cache: PathCache=None, matcher: PhraseMatcher=None,
+    term_cache: TermCache=None, deadline: float=None, max_expansions: int=None, return_partial: bool=False
+) -> Union[list, Tuple[list, bool]]:
+    """`get_knowledge_for_example` for all choices of a multiple-choice example at once. Premise 
+    terms are extracted and resolved once, and a single search from the premise nodes towards the 
+    nodes of all choices replaces one search per choice.
+
+    Parameters
+    ----------
+    premise_question : str
+        premise/question sentence from a Q&A example
+    choices : list[str]
+        all choices/hypotheses of the example
+    conceptnet : ConceptNet
+        knowledge base
+    max_paths : int
+        maximum number of paths to return per choice
+    raw_output, weighted, paths_per_pair, cache, matcher, term_cache, deadline, max_expansions, return_partial
+        see `get_knowledge_for_example`
+
+    Returns
+    -------
+    list
+        result of `get_knowledge_for_example` for each choice, in input order
+    bool
+        whether the results are partial, only returned if `return_partial` is set
+    """
+
+    started = time.monotonic()
+
+    p_nodes, *c_nodes = extract_nodes([premise_question, *choices], conceptnet, matcher, term_cache)
+
+    if deadline is not None:
+        # term extraction counts towards the deadline
+        deadline = max(0.0, deadline - (time.monotonic() - started))
+
+    results, partial = get_knowledge_for_nodes(
+        p_nodes, c_nodes, conceptnet, max_paths, raw_output=raw_output, weighted=weighted,
+        paths_per_pair=paths_per_pair, cache=cache, deadline=deadline, max_expansions=max_expansions
+    )
+
+    return (results, partial) if return_partial else results
+
+
+def get_knowledge_for_nodes(
+    p_nodes: Set[int], c_nodes: List[Set[int]], conceptnet: ConceptNet, max_paths: int, raw_output: bool=False,
+    weighted: bool=True, paths_per_pair: int=1, cache: PathCache=None, deadline: float=None,
+    max_expansions: int=None
+) -> Tuple[list, bool]:
+    """`get_knowledge_for_choices` for graph nodes that are already extracted (see `extract_nodes`).
+
+    Parameters
+    ----------
+    p_nodes : set[int]
+        nodes of the premise/question
+    c_nodes : list[set[int]]
+        nodes of each choice
+    conceptnet : ConceptNet
+        knowledge base
+    max_paths : int
+        maximum number of paths to return per choice
+    raw_output, weighted, paths_per_pair, cache, deadline, max_expansions
+        see `get_knowledge_for_example`
+
+    Returns
+    -------
+    list
+        knowledge for each choice, in input order
+    bool
+        whether the results are partial
+    """
+
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    selections = [_TopPaths(max_paths, conceptnet) for _ in c_nodes]
+    partial = False
+
+    if deadline is not None or max_expansions is not None:
+        partial = _search_anytime(
+            p_nodes, c_nodes, selections, conceptnet, weighted, paths_per_pair, deadline_at,
+            max_expansions, cache
+        )
+    elif paths_per_pair > 1:
+        edge_weights = neighbour_weights(conceptnet) if weighted else unit_weights(conceptnet)
+        # paths of a pair and the max. path length they were searched with, shared between choices
+        pair_paths = {}
+
+        for nodes, selection in zip(c_nodes, selections):
+            for start in p_nodes:
+                for end in nodes:
+                    # pairs without a path as short as the worst selected one cannot contribute
+                    max_path_len = selection.max_path_len(3)
+
+                    searched_len, found = pair_paths.get((start, end), (0, None))
+                    if searched_len < max_path_len:
+                        found = search_top_k_paths(
+                            start, end, conceptnet.adjacency_lists, edge_weights, paths_per_pair,
+                            max_path_len=max_path_len
+                        )
+                        pair_paths[(start, end)] = (max_path_len, found)
+
+                    for path in found:
+                        if len(path) <= max_path_len:
+                            selection.push(path)
+    else:
+        # one shared search for all term pairs of all choices instead of one search per pair
+        pair_paths = find_node_paths(p_nodes, set().union(*c_nodes), conceptnet, weighted=weighted, cache=cache)
+
+        for nodes, selection in zip(c_nodes, selections):
+            for start in p_nodes:
+                for end in nodes:
+                    selection.push(pair_paths[(start, end)])
+
+    return [_render_paths(selection.paths(), conceptnet, raw_output) for selection in selections], partial
 
 
 def get_knowledge_for_example(
-    premise_question: str, choice: str, conceptnet: ConceptNet, max_paths: int, raw_output:bool=False
-) -> str:
+    premise_question: str, choice: str, conceptnet: ConceptNet, max_paths: int, raw_output:bool=False,
+    weighted: bool=True, paths_per_pair: int=1, cache: PathCache=None, matcher: PhraseMatcher=None,
+    term_cache: TermCache=None, deadline: float=None, max_expansions: int=None, return_partial: bool=False
+) -> Union[str, Tuple[str, bool]]:
     """Return a list of paths connecting terms from the premise with terms from the choice. Paths are extracted from a knowledge base and encoded in natural language. If more than max_paths paths are found, paths are selected primarily based lower number of nodes and secondarily on higher product of edge weights.
 
     Assignment 2.
@@ -23,6 +321,29 @@ def get_knowledge_for_example(
         knoqledge base
     max_paths : int
         maximum number of paths to return
+    weighted : bool
+        for every term pair, search the path with the highest product of edge weights among the 
+        shortest ones instead of an arbitrary shortest path
+    paths_per_pair : int
+        number of candidate paths per term pair (see `find_top_k_paths`). Values above 1 give the 
+        selection more candidates but need one search per term pair. Without `weighted`, the 
+        candidates of a pair are only ranked by their number of nodes.
+    cache : PathCache
+        cache for search results of term pairs (see `find_word_paths`). Not used if paths_per_pair 
+        is above 1.
+    matcher : PhraseMatcher
+        find graph nodes in the texts with this automaton instead of extracting terms with spaCy
+    term_cache : TermCache
+        persistent cache for the terms extracted with spaCy
+    deadline : float
+        time limit in seconds for the whole call. Term pairs are then searched one at a time, pairs 
+        of low-degree nodes first, and the best paths found until the deadline are returned.
+    max_expansions : int
+        limit on the node expansions of all term pairs together (see `search_top_k_paths`), also 
+        switches to searching one term pair at a time
+    return_partial : bool
+        return a tuple (knowledge, partial), where partial tells whether the deadline or the 
+        expansion limit cut the search short
 
     Returns
     -------
@@ -30,31 +351,126 @@ def get_knowledge_for_example(
         concatenated paths, each encoded as natural language
     """
 
-    p_terms = extract_terms(premise_question)
-    c_terms = extract_terms(choice)
+    results, partial = get_knowledge_for_choices(
+        premise_question, [choice], conceptnet, max_paths, raw_output=raw_output, weighted=weighted,
+        paths_per_pair=paths_per_pair, cache=cache, matcher=matcher, term_cache=term_cache,
+        deadline=deadline, max_expansions=max_expansions, return_partial=True
+    )
 
-    paths = []
+    return (results[0], partial) if return_partial else results[0]
 
-    for tp in p_terms:
-        for tc in c_terms:
-            p = find_word_path(tp, tc, conceptnet, renderer=None)
 
-            context, weights = render_path_natural(p, conceptnet)
+# graph used by worker processes of `get_knowledge_for_examples`, either inherited via fork or 
+# memory-mapped from a graph directory by `_init_worker`
+_worker_graph = None
+# (max_paths, kwargs, in_pool) of `get_knowledge_for_examples`, handed to each worker once instead 
+# of with every task
+_worker_args = None
 
-            if context:
-                paths.append((context, weights))
 
-    if len(paths) > max_paths:
-        # Too many paths, need to select the most relevant ones
+def _init_worker(graph_path: Optional[str], max_paths: int, kwargs: dict, in_pool: bool =True):
+    global _worker_graph, _worker_args
 
-        # Sort the paths using the ascending number of edges (= number of weights) as primary key
-        # and the descending product of weights as secondary key
-        paths.sort(key=lambda x: prod(x[1]), reverse=True)
-        paths.sort(key=lambda x: len(x[1]))
+    if graph_path is not None:
+        import graph_storage
+        _worker_graph = graph_storage.load_graph_dir(graph_path)
 
-        paths = paths[:max_paths]
+    _worker_args = (max_paths, kwargs, in_pool)
 
-    if not raw_output:
-        return " ".join(context for context, _ in paths)
-    else:
-        return paths
+    cache = kwargs.get("cache")
+    if in_pool and isinstance(cache, PathCache):
+        # the cache is a copy, new entries are sent back with the results
+        cache.start_journal()
+
+
+def _knowledge_worker(args):
+    idx, premise_question, choice = args
+    max_paths, kwargs, in_pool = _worker_args
+
+    try:
+        result = get_knowledge_for_example(premise_question, choice, _worker_graph, max_paths, **kwargs)
+        error = None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+
+    cache = kwargs.get("cache")
+    new_entries = cache.pop_journal() if in_pool and isinstance(cache, PathCache) else []
+
+    return idx, result, error, new_entries
+
+
+def get_knowledge_for_examples(
+    examples: Iterable[Tuple[str, str]], conceptnet: ConceptNet =None, max_paths: int =3,
+    n_workers: int =None, graph_path: str =None, chunksize: int =8, **kwargs
+) -> List[Optional[str]]:
+    """Run `get_knowledge_for_example` for many (premise/question, choice) pairs on `n_workers` 
+    processes. The graph is never pickled: either the workers memory-map the graph directory 
+    `graph_path` (see `graph_storage`), so the OS shares one copy between them, or, if only 
+    `conceptnet` is given, they inherit it from the parent process via fork.
+
+    Parameters
+    ----------
+    examples : Iterable[Tuple[str, str]]
+        pairs of premise/question and choice
+    conceptnet : ConceptNet, optional
+        knowledge base, used if `graph_path` is not given (requires the fork start method)
+    max_paths : int, optional
+        maximum number of paths per example, by default 3
+    n_workers : int, optional
+        number of processes, by default the number of CPUs. With 1, everything runs in this process.
+    graph_path : str, optional
+        graph directory to memory-map in each worker
+    chunksize : int, optional
+        number of examples sent to a worker at once, by default 8
+    **kwargs
+        further arguments for `get_knowledge_for_example`, sent to each worker once. New entries of 
+        a `PathCache` passed as `cache` are sent back and stored in it.
+
+    Returns
+    -------
+    list[Optional[str]]
+        results in input order. Examples that raised an exception are logged and result in None.
+    """
+
+    global _worker_graph, _worker_args
+
+    if conceptnet is None and graph_path is None:
+        raise ValueError("either conceptnet or graph_path must be given")
+
+    tasks = [(idx, premise_question, choice) for idx, (premise_question, choice) in enumerate(examples)]
+    results = [None] * len(tasks)
+
+    # restored afterwards, calls may be nested (e.g. inside a worker of another pool)
+    previous = _worker_graph, _worker_args
+
+    try:
+        if n_workers == 1:
+            _worker_graph = conceptnet
+            _init_worker(graph_path if conceptnet is None else None, max_paths, kwargs, in_pool=False)
+            outputs = [_knowledge_worker(task) for task in tasks]
+        else:
+            if graph_path is not None:
+                context = multiprocessing.get_context()
+                initargs = (graph_path, max_paths, kwargs)
+            else:
+                # set before the pool is created, so that forked workers inherit it without pickling
+                context = multiprocessing.get_context("fork")
+                initargs = (None, max_paths, kwargs)
+                _worker_graph = conceptnet
+
+            with context.Pool(n_workers, initializer=_init_worker, initargs=initargs) as pool:
+                outputs = list(pool.imap_unordered(_knowledge_worker, tasks, chunksize=chunksize))
+    finally:
+        _worker_graph, _worker_args = previous
+
+    cache = kwargs.get("cache")
+
+    for idx, result, error, new_entries in outputs:
+        if error is not None:
+            logging.warning(f"knowledge extraction failed for example {idx}: {error}")
+        results[idx] = result
+
+        for key, path in new_entries:
+            cache.put(key, path)
+
+    return results
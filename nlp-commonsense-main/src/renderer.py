@@ -1,5 +1,5 @@
 from typing import List, Tuple
-from utils import ConceptNet, removeprefix
+from utils import ConceptNet, lookup_best_edge, removeprefix
 
 
 def render_path_verbose(path: List[int], graph: ConceptNet):
@@ -64,18 +64,7 @@ def render_path_brief(path: List[int], graph: ConceptNet):
             path_idx - 1
         ]  # index of the previous node in path for edge lookup
 
-        if (prev_idx, node_idx) in graph.edge_descriptors:
-            edges = graph.edge_descriptors[(prev_idx, node_idx)]
-            reverse_edge = False
-        elif (node_idx, prev_idx) in graph.edge_descriptors:
-            edges = graph.edge_descriptors[(node_idx, prev_idx)]
-            reverse_edge = True
-        else:
-            raise ValueError(
-                f"Illegal State: edge descriptors missing for edge present in graph ({node_idx}, {prev_idx})"
-            )
-
-        best_edge = max(edges, key=lambda x: x.weight)
+        best_edge, reverse_edge = lookup_best_edge(graph, prev_idx, node_idx)
         best_edge_str = removeprefix(graph.labels_idx2name[best_edge.label_idx], "/r/")
 
         if not reverse_edge:
@@ -172,18 +161,7 @@ def render_path_natural(path: List[int], graph: ConceptNet) -> Tuple[str, List[f
             path_idx - 1
         ]  # index of the previous node in path for edge lookup
 
-        if (prev_idx, node_idx) in graph.edge_descriptors:
-            edges = graph.edge_descriptors[(prev_idx, node_idx)]
-            reverse_edge = False
-        elif (node_idx, prev_idx) in graph.edge_descriptors:
-            edges = graph.edge_descriptors[(node_idx, prev_idx)]
-            reverse_edge = True
-        else:
-            raise ValueError(
-                f"Illegal State: edge descriptors missing for edge present in graph ({node_idx}, {prev_idx})"
-            )
-
-        best_edge = max(edges, key=lambda x: x.weight)
+        best_edge, reverse_edge = lookup_best_edge(graph, prev_idx, node_idx)
         best_edge_str = removeprefix(graph.labels_idx2name[best_edge.label_idx], "/r/")
 
         if best_edge_str not in RELATION_MAP:
@@ -2,9 +2,19 @@
 some unit tests to ensure that the BFS works as expected.
 """
 
+import itertools
+import math
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
 import unittest
 
 from find_shortest_path import *
+from test_graph_storage import make_graph
+import utils as U
 
 class FindShortestPathTest(unittest.TestCase):
 
@@ -82,6 +92,476 @@ class FindShortestPathTest(unittest.TestCase):
 
         self.assertListEqual(search_shortest_path(0, 1, adj), [])
 
+    def test_csr_adjacency(self):
+
+        adj = {
+            0: [1, 3],
+            1: [0, 2, 3],
+            2: [1, 4],
+            3: [0, 1, 4],
+            4: [2, 3],
+            5: [],
+        }
+
+        csr = CSRAdjacency.from_adjacency_lists(adj, 6)
+
+        self.assertEqual(len(csr), 6)
+        self.assertListEqual(csr[3], [0, 1, 4])
+        self.assertListEqual(csr[5], [])
+        self.assertEqual(csr.degree(1), 3)
+
+        self.assertListEqual(search_shortest_path(0, 2, csr), [0, 1, 2])
+        self.assertListEqual(search_shortest_path(2, 0, csr), [2, 1, 0])
+        self.assertListEqual(search_shortest_path(0, 5, csr), [])
+
+    def test_bidirectional(self):
+
+        adj = {
+            0: [1, 3],
+            1: [0, 2, 3],
+            2: [1, 4],
+            3: [0, 1, 4],
+            4: [2, 3]
+        }
+
+        self.assertListEqual(search_shortest_path(0, 2, adj, bidirectional=True), [0, 1, 2])
+        self.assertListEqual(search_shortest_path(2, 0, adj, bidirectional=True), [2, 1, 0])
+        self.assertListEqual(search_shortest_path(0, 0, adj, bidirectional=True), [0])
+        self.assertListEqual(search_shortest_path(0, 4, adj, max_path_len=2, bidirectional=True), [])
+
+        adj2 = {
+            0: [1],
+            1: [0, 2],
+            2: [1, 3],
+            3: [2, 4],
+            4: [3],
+            5: [],
+        }
+
+        self.assertListEqual(search_shortest_path(0, 4, adj2, bidirectional=True), [])
+        self.assertListEqual(
+            search_shortest_path(0, 4, adj2, max_path_len=5, bidirectional=True), [0, 1, 2, 3, 4]
+        )
+        self.assertListEqual(search_shortest_path(0, 5, adj2, bidirectional=True), [])
+
+    def test_bidirectional_random(self):
+
+        rng = random.Random(0)
+
+        for _ in range(50):
+            n = 30
+            adj = {i: set() for i in range(n)}
+            for _ in range(40):
+                a, b = rng.randrange(n), rng.randrange(n)
+                adj[a].add(b)
+                adj[b].add(a)
+
+            for max_path_len in (1, 2, 3, 4, 6):
+                start, end = rng.randrange(n), rng.randrange(n)
+
+                path = search_shortest_path(start, end, adj, max_path_len)
+                path_bidi = search_shortest_path(start, end, adj, max_path_len, bidirectional=True)
+
+                self.assertEqual(len(path_bidi), len(path))
+                if path_bidi:
+                    self.assertEqual((path_bidi[0], path_bidi[-1]), (start, end))
+                    for a, b in zip(path_bidi, path_bidi[1:]):
+                        self.assertIn(b, adj[a])
+
+    def test_multi_source(self):
+
+        adj = {
+            0: [1, 3],
+            1: [0, 2, 3],
+            2: [1, 4],
+            3: [0, 1, 4],
+            4: [2, 3],
+            5: [],
+        }
+
+        paths = search_shortest_paths([0, 5], [2, 4, 0], adj)
+
+        self.assertDictEqual(
+            paths, {(0, 2): [0, 1, 2], (0, 4): [0, 3, 4], (0, 0): [0]}
+        )
+
+        # more start than end nodes, search runs from the end nodes
+        paths = search_shortest_paths([2, 4, 0], [0], adj, max_path_len=2)
+        self.assertDictEqual(paths, {(0, 0): [0]})
+
+    def test_multi_source_random(self):
+
+        rng = random.Random(1)
+
+        for _ in range(30):
+            n = 30
+            adj = {i: set() for i in range(n)}
+            for _ in range(40):
+                a, b = rng.randrange(n), rng.randrange(n)
+                adj[a].add(b)
+                adj[b].add(a)
+
+            starts = rng.sample(range(n), 4)
+            ends = rng.sample(range(n), rng.randint(1, 8))
+
+            paths = search_shortest_paths(starts, ends, adj, max_path_len=4)
+
+            for s in starts:
+                for e in ends:
+                    expected = search_shortest_path(s, e, adj, max_path_len=4)
+                    path = paths.get((s, e), [])
+
+                    self.assertEqual(len(path), len(expected))
+                    if path:
+                        self.assertEqual((path[0], path[-1]), (s, e))
+
+    def test_best_path(self):
+
+        weights = {(0, 1): 1.0, (1, 3): 1.0, (0, 2): 2.0, (2, 3): 2.0, (3, 4): 1.0}
+        weights.update({(b, a): w for (a, b), w in list(weights.items())})
+
+        adj = {i: [b for (a, b) in weights if a == i] for i in range(5)}
+
+        def edge_weights(node):
+            return [weights[(node, nb)] for nb in adj[node]]
+
+        self.assertListEqual(search_best_path(0, 3, adj, edge_weights), [0, 2, 3])
+        self.assertListEqual(search_best_path(3, 0, adj, edge_weights), [3, 2, 0])
+        self.assertListEqual(search_best_path(0, 4, adj, edge_weights), [])
+        self.assertListEqual(search_best_path(0, 4, adj, edge_weights, max_path_len=4), [0, 2, 3, 4])
+
+        # fewer hops always win over higher weights
+        weights[(0, 3)] = weights[(3, 0)] = 0.1
+        adj = {i: [b for (a, b) in weights if a == i] for i in range(5)}
+
+        self.assertListEqual(search_best_path(0, 3, adj, edge_weights), [0, 3])
+
+    def test_best_paths_random(self):
+
+        rng = random.Random(2)
+
+        def brute_force(s, e, adj, weights, max_path_len):
+            best, best_key = [], None
+            stack = [[s]]
+            while stack:
+                path = stack.pop()
+                if path[-1] == e:
+                    key = (len(path), -math.prod(weights[p] for p in zip(path, path[1:])))
+                    if best_key is None or key < best_key:
+                        best, best_key = path, key
+                    continue
+                if len(path) < max_path_len:
+                    stack.extend(path + [nb] for nb in adj[path[-1]] if nb not in path)
+            return best_key
+
+        for _ in range(30):
+            n = 12
+            weights = {}
+            for _ in range(25):
+                a, b = rng.randrange(n), rng.randrange(n)
+                if a != b:
+                    weights[(a, b)] = weights[(b, a)] = rng.choice([0.5, 1.0, 2.0, 3.0])
+            adj = {i: [b for (a, b) in weights if a == i] for i in range(n)}
+
+            def edge_weights(node):
+                return [weights[(node, nb)] for nb in adj[node]]
+
+            starts = rng.sample(range(n), 3)
+            ends = rng.sample(range(n), 2)
+
+            paths = search_best_paths(starts, ends, adj, edge_weights, max_path_len=4)
+
+            for s, e in itertools.product(starts, ends):
+                expected = brute_force(s, e, adj, weights, 4)
+                path = paths.get((s, e), [])
+
+                if expected is None:
+                    self.assertListEqual(path, [])
+                    continue
+
+                key = (len(path), -math.prod(weights[p] for p in zip(path, path[1:])))
+                self.assertEqual(key[0], expected[0])
+                self.assertAlmostEqual(key[1], expected[1])
+
+    def test_top_k_paths(self):
+
+        rng = random.Random(3)
+
+        def all_paths(s, e, adj, max_path_len):
+            paths, stack = [], [[s]]
+            while stack:
+                path = stack.pop()
+                if path[-1] == e:
+                    paths.append(path)
+                    continue
+                if len(path) < max_path_len:
+                    stack.extend(path + [nb] for nb in adj[path[-1]] if nb not in path)
+            return paths
+
+        for _ in range(30):
+            n = 10
+            weights = {}
+            for _ in range(25):
+                a, b = rng.randrange(n), rng.randrange(n)
+                if a != b:
+                    weights[(a, b)] = weights[(b, a)] = rng.choice([0.5, 1.0, 2.0, 3.0])
+            adj = {i: [b for (a, b) in weights if a == i] for i in range(n)}
+
+            def edge_weights(node):
+                return [weights[(node, nb)] for nb in adj[node]]
+
+            def key(path):
+                return (len(path), -round(math.prod(weights[p] for p in zip(path, path[1:])), 6))
+
+            s, e = rng.randrange(n), rng.randrange(n)
+            k = rng.randint(1, 6)
+            max_path_len = rng.randint(2, 4)
+
+            expected = sorted(key(p) for p in all_paths(s, e, adj, max_path_len))[:k]
+            paths = search_top_k_paths(s, e, adj, edge_weights, k, max_path_len=max_path_len)
+
+            self.assertListEqual([key(p) for p in paths], expected)
+            self.assertEqual(len(set(map(tuple, paths))), len(paths))
+
+    def test_top_k_paths_budget(self):
+
+        adj = {
+            0: [1, 3],
+            1: [0, 2, 3],
+            2: [1, 4],
+            3: [0, 1, 4],
+            4: [2, 3]
+        }
+
+        def edge_weights(node):
+            return [1.0] * len(adj[node])
+
+        self.assertEqual(len(search_top_k_paths(0, 4, adj, edge_weights, 10, max_path_len=5)), 4)
+        self.assertListEqual(
+            search_top_k_paths(0, 4, adj, edge_weights, 10, max_path_len=5, max_expansions=1), []
+        )
+        self.assertListEqual(search_top_k_paths(0, 0, adj, edge_weights, 2), [[0]])
+
+        self.assertFalse(
+            search_top_k_paths(0, 4, adj, edge_weights, 10, max_path_len=5, return_truncated=True)[1]
+        )
+        self.assertTupleEqual(
+            search_top_k_paths(
+                0, 4, adj, edge_weights, 10, max_path_len=5, max_expansions=1, return_truncated=True
+            ),
+            ([], True)
+        )
+
+    def test_top_k_paths_hub(self):
+
+        # 0 - 1, and 1 is a hub: its neighbours are not expanded for a path of one edge
+        adj = {0: [1], 1: [0, *range(2, 2002)], **{leaf: [1] for leaf in range(2, 2002)}}
+
+        def edge_weights(node):
+            return [1.0] * len(adj[node])
+
+        for start, end in ((0, 1), (1, 0)):
+            budget = ExpansionBudget(10)
+            self.assertListEqual(
+                search_top_k_paths(start, end, adj, edge_weights, 1, max_path_len=3, budget=budget),
+                [[start, end]]
+            )
+            self.assertLessEqual(10 - budget.remaining, 3)
+
+        self.assertListEqual(
+            search_top_k_paths(0, 2, adj, edge_weights, 2, max_path_len=3, max_expansions=10),
+            [[0, 1, 2]]
+        )
+
+    def test_expansion_limits(self):
+
+        # hub 0 connects 1..9, the target 10 is only reachable via 9
+        adj = {0: list(range(1, 10))}
+        adj.update({i: [0] for i in range(1, 9)})
+        adj[9] = [0, 10]
+        adj[10] = [9]
+        csr = CSRAdjacency.from_adjacency_lists(adj, 11)
+
+        for graph in (adj, csr):
+            for bidirectional in (False, True):
+                path, truncated = search_shortest_path(
+                    1, 10, graph, max_path_len=4, bidirectional=bidirectional, return_truncated=True
+                )
+                self.assertListEqual(path, [1, 0, 9, 10])
+                self.assertFalse(truncated)
+
+                path, truncated = search_shortest_path(
+                    1, 10, graph, max_path_len=4, bidirectional=bidirectional, max_neighbours=3,
+                    return_truncated=True
+                )
+                self.assertListEqual(path, [])
+                self.assertTrue(truncated)
+
+                path, truncated = search_shortest_path(
+                    1, 10, graph, max_path_len=4, bidirectional=bidirectional, max_expansions=1,
+                    return_truncated=True
+                )
+                self.assertListEqual(path, [])
+                self.assertTrue(truncated)
+
+            # the weighted search honours the same limits
+            def edge_weights(node):
+                return [1.0] * len(graph[node])
+
+            for limits, expected in [
+                ({}, ([1, 0, 9, 10], False)),
+                ({"max_neighbours": 3}, ([], True)),
+                ({"max_expansions": 1}, ([], True)),
+            ]:
+                self.assertTupleEqual(
+                    search_best_path(
+                        1, 10, graph, edge_weights, max_path_len=4, return_truncated=True, **limits
+                    ),
+                    expected,
+                )
+
+        # with the neighbour of the target ranked first, the capped search succeeds
+        adj[0] = [9] + list(range(1, 9))
+        path, truncated = search_shortest_path(
+            1, 10, adj, max_path_len=4, max_neighbours=3, return_truncated=True
+        )
+        self.assertListEqual(path, [1, 0, 9, 10])
+        self.assertTrue(truncated)
+
+    def test_neighbour_limit_ranking(self):
+
+        # dog (3) has the neighbours animal (1, weight 2.0), café (2, 0.25) and bark (4, 1.0)
+        graph = make_graph()
+        compact = U.to_edge_store(U.to_csr_adjacency(graph))
+        self.assertListEqual(compact.adjacency_lists[3], [1, 2, 4])
+
+        U.set_lemma_table({name: name for name in graph.nodes_name2idx})
+        try:
+            for g in (graph, compact):
+                for weighted in (False, True):
+                    # the two strongest edges of dog are kept, whatever the order of the adjacency
+                    self.assertListEqual(
+                        find_word_path(
+                            "dog", "bark", g, renderer=None, weighted=weighted, max_neighbours=2
+                        ),
+                        [3, 4],
+                    )
+                    # the weakest one is dropped (café is not reached from dog's side only)
+                    self.assertListEqual(
+                        find_word_path(
+                            "dog", "café", g, renderer=None, bidirectional=False, weighted=weighted,
+                            max_neighbours=2
+                        ),
+                        [],
+                    )
+        finally:
+            U.set_lemma_table({})
+
+        # the ranked copy is memoized per graph
+        self.assertIs(U.ranked_by_weight(compact), U.ranked_by_weight(compact))
+
+    def test_shared_budget(self):
+
+        adj = {0: list(range(1, 10))}
+        adj.update({i: [0] for i in range(1, 9)})
+        adj[9] = [0, 10]
+        adj[10] = [9]
+
+        # the first search expands 1, 0 and 2..9, the second one runs out of expansions
+        budget = ExpansionBudget(12)
+        self.assertTupleEqual(
+            search_shortest_path(1, 10, adj, max_path_len=4, return_truncated=True, budget=budget),
+            ([1, 0, 9, 10], False),
+        )
+        self.assertTupleEqual(
+            search_shortest_path(2, 10, adj, max_path_len=4, return_truncated=True, budget=budget),
+            ([], True),
+        )
+
+        # the deadline is checked before every expansion, not only between searches
+        def edge_weights(node):
+            return [1.0] * len(adj[node])
+
+        budget = ExpansionBudget(deadline=time.monotonic() - 1)
+        self.assertTupleEqual(
+            search_top_k_paths(
+                1, 10, adj, edge_weights, 2, max_path_len=4, return_truncated=True, budget=budget
+            ),
+            ([], True),
+        )
+        self.assertTupleEqual(
+            search_shortest_path(
+                1, 10, adj, max_path_len=4, bidirectional=True, return_truncated=True, budget=budget
+            ),
+            ([], True),
+        )
+
+
+class PathCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+
+        cache = PathCache(capacity=2)
+
+        cache.put(("a", "b", 3, "fp", "bfs"), [0, 1])
+        cache.put(("a", "c", 3, "fp", "bfs"), [])
+
+        self.assertListEqual(cache.get(("a", "b", 3, "fp", "bfs")), [0, 1])
+        self.assertIsNone(cache.get(("a", "b", 4, "fp", "bfs")))
+
+        # ("a", "c") is the least recently used entry now
+        cache.put(("a", "d", 3, "fp", "bfs"), [0, 2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(("a", "c", 3, "fp", "bfs")))
+        self.assertListEqual(cache.get(("a", "d", 3, "fp", "bfs")), [0, 2])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_persistence(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "paths.sqlite")
+
+            cache = PathCache(capacity=2, db_path=db_path)
+            cache.put(("a", "b", 3, "fp", "bfs"), [0, 1])
+            cache.put(("a", "c", 3, "fp", "bfs"), [])
+            cache.save()
+
+            cache = PathCache(capacity=2, db_path=db_path)
+            self.assertListEqual(cache.get(("a", "c", 3, "fp", "bfs")), [])
+            cache.put(("a", "d", 3, "fp", "bfs"), [0, 2])
+            cache.save()
+
+            # the file is bounded by the capacity as well, ("a", "b") was used least recently
+            cache = PathCache(capacity=2, db_path=db_path)
+            self.assertIsNone(cache.get(("a", "b", 3, "fp", "bfs")))
+            self.assertListEqual(cache.get(("a", "c", 3, "fp", "bfs")), [])
+            self.assertListEqual(cache.get(("a", "d", 3, "fp", "bfs")), [0, 2])
+
+    def test_threads(self):
+
+        cache = PathCache(capacity=50)
+
+        def put_and_get(start):
+            for i in range(start, start + 200):
+                cache.put((str(i), "b", 3, "fp", "bfs"), [i])
+                cache.get((str(i - 1), "b", 3, "fp", "bfs"))
+
+        threads = [threading.Thread(target=put_and_get, args=(start,)) for start in range(0, 800, 200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(cache), 50)
+        self.assertEqual(cache.hits + cache.misses, 800)
+
+        # the lock is not pickled, the copy gets its own
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(copy), 50)
+        copy.put(("a", "b", 3, "fp", "bfs"), [0, 1])
+        self.assertListEqual(copy.get(("a", "b", 3, "fp", "bfs")), [0, 1])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
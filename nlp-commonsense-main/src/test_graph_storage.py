@@ -0,0 +1,116 @@
+"""
+unit tests for the memory-mapped graph directory format.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import utils as U
+from graph_storage import *
+from renderer import render_path_brief
+
+
+def make_graph() -> U.ConceptNet:
+    nodes = ["dog", "animal", "café", "dog", "bark"]  # "dog" twice, as produced by normalization
+    nodes2idx = {"animal": 1, "café": 2, "dog": 3, "bark": 4}
+    labels = ["/r/IsA", "/r/CapableOf", "/r/RelatedTo"]
+    labels2idx = {label: idx for idx, label in enumerate(labels)}
+
+    adjacency = {1: {3}, 2: {3}, 3: {1, 2, 4}, 4: {3}}
+    edges = {
+        (3, 1): {U.EdgeDescriptor(0, 2.0, 0), U.EdgeDescriptor(2, 0.5, 1)},
+        (3, 4): {U.EdgeDescriptor(1, 1.0, 2)},
+        (4, 3): {U.EdgeDescriptor(2, 5.0, 4)},
+        (2, 3): {U.EdgeDescriptor(2, 0.25, 3)},
+    }
+
+    return U.ConceptNet(nodes, nodes2idx, labels, labels2idx, adjacency, edges)
+
+
+class GraphStorageTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+
+        graph = make_graph()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_graph_dir(graph, tmp)
+            self.assertTrue(is_graph_dir(tmp))
+
+            loaded = load_graph_dir(tmp)
+
+            self.assertListEqual(list(loaded.nodes_idx2name), graph.nodes_idx2name)
+            self.assertDictEqual(dict(loaded.nodes_name2idx), graph.nodes_name2idx)
+            self.assertNotIn("cat", loaded.nodes_name2idx)
+            self.assertListEqual(loaded.labels_idx2name, graph.labels_idx2name)
+
+            # neighbours are stored by descending weight
+            self.assertIsInstance(loaded.adjacency_lists.indices, np.memmap)
+            ranked = U.rank_neighbours_by_weight(graph)
+            for node in graph.adjacency_lists:
+                self.assertListEqual(loaded.adjacency_lists[node], ranked.adjacency_lists[node])
+            self.assertListEqual(loaded.adjacency_lists[3], [1, 4, 2])
+            self.assertIs(U.ranked_by_weight(loaded), loaded)
+
+            self.assertEqual(len(loaded.edge_descriptors), len(graph.edge_descriptors))
+            for pair, edges in graph.edge_descriptors.items():
+                self.assertIn(pair, loaded.edge_descriptors)
+                self.assertSetEqual(loaded.edge_descriptors[pair], edges)
+            self.assertNotIn((1, 3), loaded.edge_descriptors)
+
+            self.assertEqual(
+                render_path_brief([2, 3, 1], loaded), render_path_brief([2, 3, 1], graph)
+            )
+
+    def test_overwrite(self):
+
+        graph = make_graph()
+        changed = make_graph()
+        changed.labels_idx2name = ["/r/IsA"]
+        changed.adjacency_lists = {0: {1}, 1: {0}}
+        changed.edge_descriptors = {(0, 1): {U.EdgeDescriptor(0, 1.0, 0)}}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph")
+            save_graph_dir(graph, path)
+            mapped = load_graph_dir(path)
+
+            # the files of the mapped graph are not overwritten, the directory is replaced
+            save_graph_dir(changed, path)
+            self.assertListEqual(os.listdir(tmp), ["graph"])
+            self.assertDictEqual(
+                {node: set(nbs) for node, nbs in graph.adjacency_lists.items()},
+                {node: set(mapped.adjacency_lists[node]) for node in graph.adjacency_lists},
+            )
+            self.assertListEqual(load_graph_dir(path).labels_idx2name, ["/r/IsA"])
+            self.assertEqual(len(load_graph_dir(path).edge_descriptors), 1)
+
+            # the graph can be written over the directory it is mapped from
+            save_graph_dir(mapped, path)
+            self.assertSetEqual(
+                load_graph_dir(path).edge_descriptors[(3, 1)], graph.edge_descriptors[(3, 1)]
+            )
+
+            path = os.path.join(tmp, "lemma_table")
+            save_string_map({"dogs": "dog", "cats": "cat"}, path)
+            save_string_map({"dogs": "hound"}, path)
+            self.assertDictEqual(dict(load_string_map(path)), {"dogs": "hound"})
+            self.assertListEqual(sorted(os.listdir(tmp)), ["graph", "lemma_table"])
+
+    def test_empty_graph(self):
+
+        graph = U.ConceptNet([], {}, [], {}, {}, {})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_graph_dir(graph, tmp)
+            loaded = load_graph_dir(tmp)
+
+            self.assertEqual(len(loaded.nodes_idx2name), 0)
+            self.assertNotIn("dog", loaded.nodes_name2idx)
+
+
+if __name__ == "__main__":
+    unittest.main()
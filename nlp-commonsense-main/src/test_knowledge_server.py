@@ -0,0 +1,205 @@
+"""
+unit tests for the knowledge retrieval server, on localhost and without spaCy.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import tempfile
+import unittest
+
+from graph_storage import save_graph_dir
+from find_shortest_path import PathCache
+from knowledge_server import *
+from phrase_matcher import PhraseMatcher
+from process_examples import TermCache
+from qa_preprocessing import get_knowledge_for_choices, get_knowledge_for_example
+from test_graph_storage import make_graph
+import utils as U
+
+
+async def query(address, requests):
+    reader, writer = await asyncio.open_connection(*address)
+
+    # all requests are sent before reading, so that they can be batched together
+    for request in requests:
+        writer.write((request if isinstance(request, str) else json.dumps(request)).encode() + b"\n")
+    await writer.drain()
+
+    responses = [json.loads(await reader.readline()) for _ in requests]
+
+    writer.close()
+    await writer.wait_closed()
+
+    return responses
+
+
+class KnowledgeServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = make_graph()
+        self.matcher = PhraseMatcher.from_graph(self.graph, normalize=str.casefold)
+
+    def test_process_batch(self):
+
+        requests = [
+            {"id": 0, "premise": "The café", "choices": ["a dog", "an animal"]},
+            {"id": 1, "premise": "the café", "choice": "dog and animal"},
+            {"id": 2, "premise": "A dog", "choice": "bark", "max_paths": 1},
+            {"id": 3, "choice": "bark"},
+        ]
+
+        responses = process_batch(requests, self.graph, self.matcher)
+
+        self.assertListEqual([r["id"] for r in responses], [0, 1, 2, 3])
+        self.assertListEqual(
+            responses[0]["knowledge"],
+            get_knowledge_for_choices("The café", ["a dog", "an animal"], self.graph, 3, matcher=self.matcher),
+        )
+        self.assertEqual(
+            responses[1]["knowledge"],
+            get_knowledge_for_example("the café", "dog and animal", self.graph, 3, matcher=self.matcher),
+        )
+        self.assertEqual(
+            responses[2]["knowledge"],
+            get_knowledge_for_example("A dog", "bark", self.graph, 1, matcher=self.matcher),
+        )
+        self.assertFalse(responses[2]["partial"])
+        self.assertIn("error", responses[3])
+
+    def test_invalid_requests(self):
+
+        requests = [
+            {"id": 0, "premise": "The café", "choice": "a dog", "max_paths": "x"},
+            {"id": 1, "premise": "The café", "choice": "a dog"},
+            {"id": 2, "premise": "The café", "choice": "a dog", "max_paths": -1},
+            {"id": 3, "premise": "The café", "choices": "abc"},
+            {"id": 4, "premise": "The café", "choices": ["a dog"], "max_paths": 0},
+            {"id": 5, "premise": "A dog", "choice": "bark", "max_paths": 1},
+            {"id": 6, "premise": "The café", "choice": "a dog", "max_paths": True},
+        ]
+
+        responses = process_batch(requests, self.graph, self.matcher)
+
+        self.assertListEqual([r["id"] for r in responses], list(range(7)))
+        for idx in (0, 2, 3, 4, 6):
+            self.assertIn("error", responses[idx])
+            self.assertNotIn("knowledge", responses[idx])
+
+        # the valid requests of the batch are answered as usual
+        self.assertEqual(
+            responses[1]["knowledge"],
+            get_knowledge_for_example("The café", "a dog", self.graph, 3, matcher=self.matcher),
+        )
+        self.assertEqual(
+            responses[5]["knowledge"],
+            get_knowledge_for_example("A dog", "bark", self.graph, 1, matcher=self.matcher),
+        )
+
+    def test_shared_caches(self):
+
+        # caches created in this thread are used by the worker threads of the server
+        with tempfile.TemporaryDirectory() as tmp:
+            term_cache = TermCache(os.path.join(tmp, "terms.sqlite"), version="test")
+            term_cache.put_many(["A dog", "bark"], [{"dog"}, {"bark"}])
+            path_cache = PathCache()
+            request = {"id": 0, "premise": "A dog", "choice": "bark"}
+
+            U.set_lemma_table({"dog": "dog", "bark": "bark"})
+            try:
+                with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                    responses = list(executor.map(
+                        lambda _: process_batch(
+                            [request], self.graph, term_cache=term_cache, cache=path_cache,
+                            max_expansions=100
+                        )[0],
+                        range(8),
+                    ))
+            finally:
+                U.set_lemma_table({})
+                term_cache.close()
+
+        expected = get_knowledge_for_example("A dog", "bark", self.graph, 3, matcher=self.matcher)
+        self.assertTrue(expected)
+        for response in responses:
+            self.assertEqual(response["knowledge"], expected)
+        self.assertGreater(path_cache.hits, 0)
+
+    def test_extraction_error(self):
+
+        class FailingMatcher(PhraseMatcher):
+            def extract_batch(self, texts):
+                raise RuntimeError("no nodes")
+
+        matcher = FailingMatcher.from_graph(self.graph, normalize=str.casefold)
+        requests = [{"id": 0, "premise": "A dog", "choice": "bark"}, {"id": 1, "choice": "bark"}]
+
+        with self.assertLogs(level="ERROR"):
+            responses = process_batch(requests, self.graph, matcher)
+
+        self.assertDictEqual(responses[0], {"id": 0, "error": "RuntimeError: no nodes"})
+        self.assertTrue(responses[1]["error"].startswith("invalid request"))
+
+    def test_server(self):
+
+        requests = [
+            {"id": i, "premise": "The café", "choice": choice}
+            for i, choice in enumerate(["a dog", "an animal", "nothing"] * 5)
+        ]
+        expected = [
+            get_knowledge_for_example(r["premise"], r["choice"], self.graph, 3, matcher=self.matcher)
+            for r in requests
+        ]
+
+        async def run():
+            server = KnowledgeServer(self.graph, self.matcher, max_wait=0.05, n_workers=2)
+            address = await server.start()
+            try:
+                responses = await query(address, [*requests, "not json"])
+                metrics = (await query(address, [{"id": "m", "op": "metrics"}]))[0]
+            finally:
+                await server.close()
+            return responses, metrics, server
+
+        responses, metrics, server = asyncio.run(run())
+
+        by_id = {r["id"]: r for r in responses}
+        for request, knowledge in zip(requests, expected):
+            self.assertEqual(by_id[request["id"]]["knowledge"], knowledge)
+        self.assertIn("error", by_id[None])
+
+        self.assertEqual(metrics["id"], "m")
+        self.assertEqual(metrics["metrics"]["requests_total"], len(requests))
+        self.assertEqual(metrics["metrics"]["queue_depth"], 0)
+        self.assertIsNotNone(metrics["metrics"]["latency_ms"]["p99"])
+        # pipelined requests are batched
+        self.assertLess(server.batches_total, len(requests))
+
+    def test_process_executor(self):
+
+        # forked workers inherit the lemma table, so WordNet is not needed
+        U.set_lemma_table({name: name for name in self.graph.nodes_name2idx})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_graph_dir(self.graph, tmp)
+
+            async def run():
+                server = KnowledgeServer(executor="process", graph_path=tmp, n_workers=1, build_matcher=True)
+                await server.start()
+                try:
+                    return await query(server.address, [{"id": 0, "premise": "café", "choices": ["dog", "animal"]}])
+                finally:
+                    await server.close()
+
+            try:
+                responses = asyncio.run(run())
+            finally:
+                U.set_lemma_table({})
+
+        expected = get_knowledge_for_choices("café", ["dog", "animal"], self.graph, 3, matcher=self.matcher)
+        self.assertListEqual(responses, [{"id": 0, "knowledge": expected, "partial": False}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+unit tests for the dictionary-based term extraction.
+"""
+
+import random
+import subprocess
+import sys
+import unittest
+
+from phrase_matcher import *
+from qa_preprocessing import get_knowledge_for_example
+from test_graph_storage import make_graph
+
+
+class PhraseMatcherTest(unittest.TestCase):
+
+    def test_multi_word(self):
+
+        phrases = ["drawstring bag", "bag", "jewelry store", "store", "jewelry"]
+        matcher = PhraseMatcher(
+            ((p.split(), idx) for idx, p in enumerate(phrases)), normalize=str.casefold
+        )
+
+        self.assertListEqual(
+            matcher.match("A Drawstring bag from the jewelry store"),
+            [(1, 3, 0), (2, 3, 1), (5, 6, 4), (5, 7, 2), (6, 7, 3)],
+        )
+        self.assertSetEqual(matcher.extract("drawstring"), set())
+
+    def test_overlapping(self):
+
+        # "b c d" has to be found through the failure link of "a b c"
+        matcher = PhraseMatcher([(["a", "b", "c"], 0), (["b", "c", "d"], 1), (["c"], 2)])
+
+        self.assertListEqual(
+            list(matcher.match_tokens("a b c d".split())), [(0, 3, 0), (2, 3, 2), (1, 4, 1)]
+        )
+
+    def test_exclude(self):
+
+        matcher = PhraseMatcher(
+            [(["the"], 0), (["the", "end"], 1)], normalize=str.casefold, exclude={"the"}
+        )
+
+        self.assertSetEqual(matcher.extract("The end"), {1})
+        self.assertSetEqual(matcher.extract("the"), set())
+
+        # stopwords are excluded by default, as in spaCy term extraction
+        graph = make_graph()
+        graph.nodes_name2idx["the"] = 0
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+
+        self.assertSetEqual(matcher.extract("The dog"), {3})
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold, exclude=())
+        self.assertSetEqual(matcher.extract("The dog"), {0, 3})
+
+    def test_stopwords(self):
+
+        # the default matcher works without spaCy
+        code = (
+            "import sys, phrase_matcher; "
+            "phrase_matcher.PhraseMatcher([(['the'], 0), (['dog'], 1)], normalize=str.casefold); "
+            "assert 'spacy' not in sys.modules"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+        # the copy of the stop words is the one of the installed spaCy
+        try:
+            from spacy.lang.en.stop_words import STOP_WORDS
+        except ImportError:
+            self.skipTest("spaCy is not installed")
+        self.assertSetEqual(STOPWORDS, set(STOP_WORDS))
+
+    def test_from_graph(self):
+
+        graph = make_graph()
+        graph.nodes_name2idx["bark loudly"] = 0
+
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+
+        self.assertSetEqual(matcher.extract("Dogs bark loudly at a café."), {4, 0, 2})
+        self.assertListEqual(matcher.extract_batch(["dog", "animal"]), [{3}, {1}])
+
+    def test_random(self):
+
+        rng = random.Random(0)
+        alphabet = "abcd"
+
+        for _ in range(50):
+            phrases = list(dict.fromkeys(
+                tuple(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(10)
+            ))
+            matcher = PhraseMatcher(((p, idx) for idx, p in enumerate(phrases)), exclude=())
+            tokens = [rng.choice(alphabet + "x") for _ in range(30)]
+
+            expected = sorted(
+                (start, start + len(p), idx)
+                for idx, p in enumerate(phrases)
+                for start in range(len(tokens) - len(p) + 1)
+                if tuple(tokens[start:start + len(p)]) == p
+            )
+
+            self.assertListEqual(sorted(matcher.match_tokens(tokens)), expected)
+
+    def test_knowledge_for_example(self):
+
+        graph = make_graph()
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+
+        paths = get_knowledge_for_example(
+            "The café", "a dog", graph, 3, raw_output=True, matcher=matcher
+        )
+
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(len(paths[0][1]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
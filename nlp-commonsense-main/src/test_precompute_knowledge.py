@@ -0,0 +1,80 @@
+"""
+unit tests for the knowledge precomputation pipeline, using the phrase matcher instead of spaCy.
+"""
+
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet as pq
+
+from phrase_matcher import PhraseMatcher
+from precompute_knowledge import *
+from qa_preprocessing import get_knowledge_for_choices
+from test_graph_storage import make_graph
+import utils as U
+
+
+class PrecomputeKnowledgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = make_graph()
+        self.matcher = PhraseMatcher.from_graph(self.graph, normalize=str.casefold)
+        self.examples = [
+            {"question": "What was the cause?", "context": f"The café {i}", "choices": ["a dog", "an animal"]}
+            for i in range(5)
+        ]
+
+    def read(self, out_dir):
+        shards = sorted(f for f in os.listdir(out_dir) if f.endswith(".parquet"))
+        return [row for f in shards for row in pq.read_table(os.path.join(out_dir, f)).to_pylist()]
+
+    def test_shards(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            stats = write_knowledge_shards(
+                iter(self.examples), tmp, self.graph, self.matcher, shard_size=2, n_workers=2
+            )
+            self.assertDictEqual(stats, {"shards_written": 3, "shards_skipped": 0, "examples_written": 5})
+
+            rows = self.read(tmp)
+
+            self.assertListEqual([row["idx"] for row in rows], list(range(5)))
+            for row, example in zip(rows, self.examples):
+                self.assertEqual(row["choices"], example["choices"])
+                self.assertFalse(row["partial"])
+                self.assertEqual(
+                    row["knowledge"],
+                    get_knowledge_for_choices(
+                        premise_text(example), example["choices"], self.graph, 3, matcher=self.matcher
+                    ),
+                )
+
+    def test_resume(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            write_knowledge_shards(self.examples, tmp, self.graph, self.matcher, shard_size=2, n_workers=1)
+            expected = self.read(tmp)
+
+            # simulate a crash while the second shard was written
+            os.remove(os.path.join(tmp, "shard-00001.done"))
+            os.remove(os.path.join(tmp, "shard-00001.parquet"))
+
+            stats = write_knowledge_shards(self.examples, tmp, self.graph, self.matcher, shard_size=2, n_workers=1)
+            self.assertDictEqual(stats, {"shards_written": 1, "shards_skipped": 2, "examples_written": 2})
+            self.assertListEqual(self.read(tmp), expected)
+
+            with self.assertRaises(ValueError):
+                write_knowledge_shards(self.examples, tmp, self.graph, self.matcher, shard_size=3, n_workers=1)
+
+            # same settings, but another graph
+            graph = make_graph()
+            graph.edge_descriptors[(3, 4)] = {U.EdgeDescriptor(1, 2.0, 2)}
+            with self.assertRaises(ValueError):
+                write_knowledge_shards(
+                    self.examples, tmp, graph, self.matcher, shard_size=2, n_workers=1
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
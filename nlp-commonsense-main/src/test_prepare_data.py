@@ -0,0 +1,338 @@
+"""
+unit tests for building, patching and pruning the graph, on small inputs in a temporary directory.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import graph_storage
+from prepare_data import *
+from test_graph_storage import make_graph
+import utils as U
+
+
+ASSERTIONS = [
+    ("/a/1", "/r/IsA", "/c/en/dog", "/c/en/animal", {"weight": 2.0}),
+    ("/a/2", "/r/IsA", "/c/de/hund", "/c/en/dog", {"weight": 1.0}),
+    ("/a/3", "/r/RelatedTo", "/c/en/dog/n", "/c/en/bark", {"dataset": "/d/wiktionary/en"}),
+    ("/a/4", "/r/Synonym", "/c/en/dog", "/c/fr/chien", {"weight": 1.0}),
+    ("/a/5", "/r/CapableOf", "/c/en/dog", "/c/en/bark", {"weight": 0.5, "surfaceText": "a, b\tc"}),
+]
+
+
+def write_assertions(path, assertions=ASSERTIONS):
+    with gzip.open(path, "wt", encoding="utf-8") as fp:
+        for *parts, info in assertions:
+            fp.write("\t".join([*parts, json.dumps(info)]) + "\n")
+
+
+def filter_conceptnet_en_reference(src, dst):
+    # filter as it was before streaming: whole dump in memory, written by pandas
+    with gzip.open(src, mode="rt", encoding="utf-8") as fp:
+        raw_edges = [
+            parts for parts in (line.split("\t") for line in fp)
+            if parts[2].startswith("/c/en/") and parts[3].startswith("/c/en/")
+        ]
+
+    pd.DataFrame(raw_edges, columns=["uri", "label", "start", "end", "info"]).to_csv(dst)
+
+
+class FilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for d in ("src", "data/raw", "data/processed"):
+            os.makedirs(os.path.join(self.tmp.name, d))
+        write_assertions(os.path.join(self.tmp.name, "data/raw/conceptnet-assertions-5.7.0.csv.gz"))
+
+        # paths of the data pipeline are relative to src/
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(self.tmp.name, "src"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_filter_conceptnet_en(self):
+
+        filter_conceptnet_en(chunk_size=2)
+        filter_conceptnet_en(fmt="parquet", chunk_size=2)
+        filter_conceptnet_en_reference(
+            "../data/raw/conceptnet-assertions-5.7.0.csv.gz", "../data/processed/reference.csv"
+        )
+
+        reference = pd.read_csv("../data/processed/reference.csv", index_col=0)
+        # the old filter kept the line break in the last column
+        reference["info"] = reference["info"].str.rstrip("\n")
+
+        columns = ["uri", "label", "start", "end", "info"]
+        expected_weights = [2.0, np.nan, 0.5]
+
+        for df in (
+            pd.read_csv("../data/processed/en_edges.csv", index_col=0),
+            pd.read_parquet("../data/processed/en_edges.parquet"),
+        ):
+            self.assertListEqual(list(df.uri), ["/a/1", "/a/3", "/a/5"])
+            pd.testing.assert_frame_equal(df[columns].reset_index(drop=True), reference[columns])
+            np.testing.assert_array_equal(df.weight.to_numpy(), expected_weights)
+
+        # files of the old filter get the same weights when they are read
+        np.testing.assert_array_equal(
+            read_edges("../data/processed/reference.csv").weight.to_numpy(), expected_weights
+        )
+
+
+EDGES = pd.DataFrame(
+    [
+        ("/r/IsA", "/c/en/dogs", "/c/en/animal", 2.0),
+        ("/r/IsA", "/c/en/dog/n", "/c/en/animal", 1.0),  # same edge after normalization
+        ("/r/IsA", "/c/en/dogs", "/c/en/animal", 2.0),  # duplicate row
+        ("/r/RelatedTo", "/c/en/dog", "/c/en/dogs", 1.0),  # self-loop after normalization
+        ("/r/CapableOf", "/c/en/dog", "/c/en/bark", np.nan),
+        ("/r/RelatedTo", "/c/en/ice_cream", "/c/en/dog", 0.5),
+    ],
+    columns=["label", "start", "end", "weight"],
+)
+
+LEMMAS = {"dog": "dog", "dogs": "dog", "animal": "animal", "bark": "bark", "ice cream": "ice cream"}
+
+
+def build_conceptnet_reference(df):
+    # row-by-row build, as before the vectorized one
+    nodes = [U.normalize_conceptnet(s) for s in sorted(set(df.start).union(set(df.end)))]
+    nodes2idx = {node: idx for idx, node in enumerate(nodes)}
+    edges = list(sorted(df.label.unique()))
+    edges2idx = {edge: idx for idx, edge in enumerate(edges)}
+
+    adjacency_list = {}
+    edges2description = {}
+
+    for row_idx, row in df.iterrows():
+        start_idx = nodes2idx[U.normalize_conceptnet(row.start)]
+        end_idx = nodes2idx[U.normalize_conceptnet(row.end)]
+
+        adjacency_list.setdefault(start_idx, set()).add(end_idx)
+        adjacency_list.setdefault(end_idx, set()).add(start_idx)
+
+        edges2description.setdefault((start_idx, end_idx), set()).add(
+            U.EdgeDescriptor(edges2idx[row.label], row.weight, row_idx)
+        )
+
+    return U.ConceptNet(nodes, nodes2idx, edges, edges2idx, adjacency_list, edges2description)
+
+
+def adjacency_sets(graph):
+    adjacency = graph.adjacency_lists
+    if isinstance(adjacency, U.CSRAdjacency):
+        return {n: set(adjacency[n]) for n in range(adjacency.num_nodes) if adjacency.degree(n)}
+    return {n: set(neighbours) for n, neighbours in adjacency.items() if neighbours}
+
+
+def descriptor_sets(graph):
+    # NaN weights never compare equal, so they are replaced by None
+    return {
+        pair: {(d.label_idx, None if d.weight != d.weight else d.weight, d.row_idx) for d in ds}
+        for pair, ds in graph.edge_descriptors.items()
+    }
+
+
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        U.set_lemma_table(LEMMAS)
+
+    def tearDown(self):
+        U.set_lemma_table({})
+
+    def test_build_conceptnet(self):
+
+        reference = build_conceptnet_reference(EDGES)
+
+        for csr in (False, True):
+            graph, lemma_table = build_conceptnet(EDGES, csr=csr)
+
+            self.assertListEqual(graph.nodes_idx2name, reference.nodes_idx2name)
+            self.assertDictEqual(graph.nodes_name2idx, reference.nodes_name2idx)
+            self.assertListEqual(graph.labels_idx2name, reference.labels_idx2name)
+            self.assertDictEqual(adjacency_sets(graph), adjacency_sets(reference))
+            self.assertDictEqual(descriptor_sets(graph), descriptor_sets(reference))
+            self.assertDictEqual(lemma_table, LEMMAS)
+
+        # the self-loop and both spellings of the duplicate edge are there
+        dog, animal = reference.nodes_name2idx["dog"], reference.nodes_name2idx["animal"]
+        self.assertIn(dog, reference.adjacency_lists[dog])
+        self.assertEqual(len(reference.edge_descriptors[(dog, animal)]), 3)
+
+
+class DeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        U.set_lemma_table({name: name for name in ["dog", "animal", "café", "bark", "cat"]})
+
+        self.tmp = tempfile.TemporaryDirectory()
+        for d in ("src", "data/processed"):
+            os.makedirs(os.path.join(self.tmp.name, d))
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(self.tmp.name, "src"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        U.set_lemma_table({})
+
+    def test_apply_delta_to_graph(self):
+
+        columns = ["label", "start", "end", "weight"]
+        added = pd.DataFrame(
+            [
+                ("/r/IsA", "/c/en/dog", "/c/en/cat", 1.0),
+                ("/r/CapableOf", "/c/en/cat", "/c/en/bark", 0.5),
+            ],
+            columns=columns,
+        )
+        # dog IsA animal goes, dog RelatedTo animal stays
+        removed = pd.DataFrame([("/r/IsA", "/c/en/dog", "/c/en/animal", 2.0)], columns=columns)
+
+        dict_graph = make_graph()
+        csr_graph = U.to_edge_store(U.to_csr_adjacency(dict_graph))
+
+        for graph in (dict_graph, csr_graph):
+            adjacency_before, descriptors_before = adjacency_sets(graph), descriptor_sets(graph)
+
+            patched = apply_delta_to_graph(graph, added, removed)
+
+            # the passed graph is unchanged
+            self.assertDictEqual(adjacency_sets(graph), adjacency_before)
+            self.assertDictEqual(descriptor_sets(graph), descriptors_before)
+            self.assertEqual(len(graph.nodes_idx2name), 5)
+
+            self.assertIs(type(patched.adjacency_lists), type(graph.adjacency_lists))
+            self.assertIs(type(patched.edge_descriptors), type(graph.edge_descriptors))
+
+            # existing indices are stable, new nodes are appended
+            self.assertListEqual(patched.nodes_idx2name, [*graph.nodes_idx2name, "cat"])
+            self.assertDictEqual(patched.nodes_name2idx, {**graph.nodes_name2idx, "cat": 5})
+            self.assertListEqual(patched.labels_idx2name, graph.labels_idx2name)
+
+            expected = dict(descriptors_before)
+            expected[(3, 1)] = {(2, 0.5, 1)}
+            expected[(3, 5)] = {(0, 1.0, -1)}
+            expected[(5, 4)] = {(1, 0.5, -1)}
+            self.assertDictEqual(descriptor_sets(patched), expected)
+
+            self.assertDictEqual(
+                adjacency_sets(patched), {1: {3}, 2: {3}, 3: {1, 2, 4, 5}, 4: {3, 5}, 5: {3, 4}}
+            )
+
+        # removing the last label of a pair removes the neighbours, unless the reverse edge exists
+        removed = pd.DataFrame(
+            [
+                ("/r/RelatedTo", "/c/en/café", "/c/en/dog", 0.25),
+                ("/r/CapableOf", "/c/en/dog", "/c/en/bark", 1.0),
+            ],
+            columns=columns,
+        )
+        patched = apply_delta_to_graph(dict_graph, removed=removed)
+        self.assertNotIn((2, 3), patched.edge_descriptors)
+        self.assertDictEqual(adjacency_sets(patched), {1: {3}, 3: {1, 4}, 4: {3}})
+
+    def test_apply_delta(self):
+
+        joblib.dump(make_graph(), "../data/processed/graph_representation.joblib")
+        graph_storage.save_graph_dir(make_graph(), "../data/processed/graph_representation")
+        write_assertions(
+            "../added.csv.gz", [("/a/6", "/r/IsA", "/c/en/dog", "/c/en/cat", {"weight": 1.0})]
+        )
+
+        apply_delta(added="../added.csv.gz")
+
+        for graph in (
+            joblib.load("../data/processed/graph_representation.joblib"),
+            graph_storage.load_graph_dir("../data/processed/graph_representation"),
+        ):
+            self.assertEqual(graph.nodes_name2idx["cat"], 5)
+            self.assertIn((3, 5), graph.edge_descriptors)
+
+        self.assertListEqual(sorted(os.listdir("../data/processed")), [
+            "graph_representation", "graph_representation.joblib"
+        ])
+
+
+class CompressTest(unittest.TestCase):
+
+    def assertCompressed(self, compressed, nodes, edges):
+        # edges by node names, so that the expected values do not depend on the reindexing
+        names = compressed.nodes_idx2name
+        self.assertListEqual(names, nodes)
+        self.assertDictEqual(
+            {(names[s], names[e]): ds for (s, e), ds in descriptor_sets(compressed).items()}, edges
+        )
+
+    def test_reindexing(self):
+
+        graph = make_graph()
+
+        for csr in (False, True):
+            compressed, stats = compress_conceptnet(graph, csr=csr)
+
+            # the first "dog" has no edges
+            self.assertCompressed(compressed, ["animal", "café", "dog", "bark"], {
+                ("dog", "animal"): {(0, 2.0, 0), (2, 0.5, 1)},
+                ("dog", "bark"): {(1, 1.0, 2)},
+                ("bark", "dog"): {(2, 5.0, 4)},
+                ("café", "dog"): {(2, 0.25, 3)},
+            })
+            self.assertDictEqual(
+                compressed.nodes_name2idx, {"animal": 0, "café": 1, "dog": 2, "bark": 3}
+            )
+            self.assertDictEqual(adjacency_sets(compressed), {0: {2}, 1: {2}, 2: {0, 1, 3}, 3: {2}})
+            self.assertListEqual(compressed.labels_idx2name, graph.labels_idx2name)
+            self.assertIsInstance(compressed.adjacency_lists, U.CSRAdjacency if csr else dict)
+            self.assertDictEqual(
+                stats, {"nodes_before": 5, "edges_before": 5, "nodes_after": 4, "edges_after": 5}
+            )
+
+    def test_relations(self):
+
+        graph = make_graph()
+
+        compressed, _ = compress_conceptnet(graph, exclude_relations=["/r/RelatedTo"])
+        self.assertCompressed(compressed, ["animal", "dog", "bark"], {
+            ("dog", "animal"): {(0, 2.0, 0)}, ("dog", "bark"): {(1, 1.0, 2)},
+        })
+
+        compressed, _ = compress_conceptnet(
+            graph, relations=["/r/IsA", "/r/RelatedTo"], min_weight=1.0
+        )
+        self.assertCompressed(compressed, ["animal", "dog", "bark"], {
+            ("dog", "animal"): {(0, 2.0, 0)}, ("bark", "dog"): {(2, 5.0, 4)},
+        })
+
+    def test_pruning(self):
+
+        graph = make_graph()
+        # an edge for the first "dog", so the name survives the removal of the other "dog"
+        graph.adjacency_lists.update({0: {2}, 2: {0, 3}})
+        graph.edge_descriptors[(0, 2)] = {U.EdgeDescriptor(0, 3.0, 5)}
+
+        for options in ({"max_degree": 2}, {"remove_top_hubs": 1}):
+            compressed, _ = compress_conceptnet(graph, **options)
+
+            self.assertCompressed(compressed, ["dog", "café"], {("dog", "café"): {(0, 3.0, 5)}})
+            self.assertDictEqual(compressed.nodes_name2idx, {"dog": 0, "café": 1})
+
+        # only café and the second "dog" have two neighbours
+        compressed, _ = compress_conceptnet(graph, min_degree=2)
+        self.assertCompressed(compressed, ["café", "dog"], {("café", "dog"): {(2, 0.25, 3)}})
+        self.assertDictEqual(compressed.nodes_name2idx, {"café": 0, "dog": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
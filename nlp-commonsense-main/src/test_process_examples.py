@@ -0,0 +1,228 @@
+"""
+unit tests for example loading and the term extraction helpers that work without a spaCy model.
+"""
+
+import concurrent.futures
+import csv
+import gzip
+import importlib.util
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import unittest
+
+import process_examples
+from process_examples import *
+import utils as U
+
+
+def _put_range(args):
+    db_path, start = args
+    cache = TermCache(db_path, version="test")
+    texts = [f"text {i}" for i in range(start, start + 50)]
+    cache.put_many(texts, [{t} for t in texts])
+    return len(cache)
+
+
+class TermCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "terms.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persistence(self):
+
+        cache = TermCache(self.db_path, version="test")
+        cache.put_many(["The dog barks.", "a cat"], [{"dog", "bark"}, {"cat"}])
+        cache.close()
+
+        cache = TermCache(self.db_path, version="test")
+        self.assertListEqual(
+            cache.get_many(["a cat", "a bird", "The dog barks."]), [{"cat"}, None, {"dog", "bark"}]
+        )
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # pickled caches (e.g. sent to worker processes) open their own connection
+        self.assertListEqual(pickle.loads(pickle.dumps(cache)).get_many(["a cat"]), [{"cat"}])
+
+        # entries of another version are never returned
+        self.assertListEqual(TermCache(self.db_path, version="other").get_many(["a cat"]), [None])
+
+    def test_eviction(self):
+
+        cache = TermCache(self.db_path, capacity=3, version="test")
+        cache.put_many(["a", "b", "c"], [{"a"}, {"b"}, {"c"}])
+        cache.get_many(["a"])
+        cache.put_many(["d"], [{"d"}])
+
+        self.assertEqual(len(cache), 3)
+        self.assertListEqual(cache.get_many(["a", "b", "c", "d"]), [{"a"}, None, {"c"}, {"d"}])
+
+    def test_processes(self):
+
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            pool.map(_put_range, [(self.db_path, start) for start in range(0, 400, 50)])
+
+        self.assertEqual(len(TermCache(self.db_path, version="test")), 400)
+
+    def test_threads(self):
+
+        # a cache created in one thread can be used from others (e.g. by the knowledge server)
+        cache = TermCache(self.db_path, version="test")
+        cache.put_many(["a dog"], [{"dog"}])
+
+        def put_and_get(start):
+            texts = [f"text {i}" for i in range(start, start + 50)]
+            cache.put_many(texts, [{t} for t in texts])
+            return cache.get_many(["a dog", *texts])
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(put_and_get, range(0, 200, 50)))
+
+        for start, result in zip(range(0, 200, 50), results):
+            self.assertListEqual(result, [{"dog"}, *({f"text {i}"} for i in range(start, start + 50))])
+        self.assertEqual(len(cache), 201)
+
+    def test_extract_terms_batch_cached(self):
+
+        cache = TermCache(self.db_path, version="test")
+        cache.put_many(["a dog", "a cat"], [{"dog"}, {"cat"}])
+
+        previous = process_examples._nlp
+        process_examples._nlp = None
+        try:
+            # nothing to extract, so spaCy is never loaded
+            self.assertListEqual(
+                extract_terms_batch(["a cat", "a dog", "a cat"], cache=cache), [{"cat"}, {"dog"}, {"cat"}]
+            )
+            self.assertIsNone(process_examples._nlp)
+        finally:
+            process_examples._nlp = previous
+
+
+def _nlp_available() -> bool:
+    # the spaCy model and the WordNet data for normalization
+    if importlib.util.find_spec(process_examples.SPACY_MODEL) is None:
+        return False
+    try:
+        U.lemmatize("dogs")
+    except (ImportError, LookupError):
+        return False
+    return True
+
+
+@unittest.skipUnless(_nlp_available(), f"{process_examples.SPACY_MODEL} or WordNet is not installed")
+class TermExtractionTest(unittest.TestCase):
+
+    def test_extract_terms_batch(self):
+
+        texts = [
+            "The dog barks at the mailman.",
+            "A cat sleeps on a warm windowsill.",
+            "",
+            "Where would you put a drawstring bag?",
+            "The dog barks at the mailman.",
+            "She bought ice cream in New York because it was hot.",
+            "What do people do when they are hungry?",
+        ]
+
+        # reference: the full pipeline, one text at a time
+        nlp = get_nlp()
+        stopwords = get_stopwords()
+        expected = [process_examples._terms_from_doc(nlp(text), stopwords) for text in texts]
+        self.assertTrue(all(expected[i] for i in (0, 1, 3, 5, 6)))
+
+        # disabling the components noun chunks do not need changes nothing, the order is kept
+        for batch_size, n_process in ((256, 1), (2, 1), (3, 2)):
+            self.assertListEqual(
+                extract_terms_batch(texts, batch_size=batch_size, n_process=n_process), expected
+            )
+        self.assertListEqual([extract_terms(text) for text in texts], expected)
+
+
+class ExamplesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_text(self):
+
+        with open(self.path("examples.txt"), "w") as fp:
+            fp.write(
+                "header\n# Example 1\n\nContext: The host cancelled the party.\n"
+                "Question: What was the cause?\n(a) flu\n(b) rain\n\n# Example 2\nQuestion: Why?\n"
+            )
+
+        examples = iter_examples(self.path("examples.txt"))
+
+        self.assertDictEqual(
+            next(examples),
+            {"question": "What was the cause?", "context": "The host cancelled the party.", "choices": ["flu", "rain"]},
+        )
+        self.assertListEqual(list(examples), [{"question": "Why?", "context": "", "choices": []}])
+
+    def test_jsonl(self):
+
+        records = [
+            {"premise": "The man broke his toe.", "choice1": "He dropped a hammer.", "choice2": "He ran.", "question": "cause", "label": 0},
+            {"question": {"stem": "Where?", "choices": [{"label": "A", "text": "bank"}, {"label": "B", "text": "store"}]}},
+            {"question": "Where?", "choices": {"label": ["A", "B"], "text": ["bank", "store"]}},
+        ]
+
+        with gzip.open(self.path("train.jsonl.gz"), "wt") as fp:
+            for record in records:
+                fp.write(json.dumps(record) + "\n")
+
+        self.assertListEqual(
+            load_examples(self.path("train.jsonl.gz")),
+            [
+                {"question": "What was the cause?", "context": "The man broke his toe.", "choices": ["He dropped a hammer.", "He ran."]},
+                {"question": "Where?", "context": "", "choices": ["bank", "store"]},
+                {"question": "Where?", "context": "", "choices": ["bank", "store"]},
+            ],
+        )
+
+    def test_numbered_choices(self):
+
+        record = {"question": "Which?", "answerKey": "choice2"}
+        record.update({f"choice{i}": f"c{i}" for i in range(11, 0, -1)})
+        record["choice3"] = ""
+
+        with open(self.path("many.jsonl"), "w") as fp:
+            fp.write(json.dumps(record) + "\n")
+
+        # numeric order, the empty choice keeps its position
+        self.assertListEqual(
+            load_examples(self.path("many.jsonl"))[0]["choices"],
+            ["c1", "c2", "", "c4", "c5", "c6", "c7", "c8", "c9", "c10", "c11"],
+        )
+
+    def test_csv(self):
+
+        with open(self.path("dev.csv"), "w", newline="") as fp:
+            writer = csv.DictWriter(fp, ["context", "question", "answerA", "answerB", "answerC"])
+            writer.writeheader()
+            writer.writerow({"context": "Tracy ran.", "question": "Why?", "answerA": "late", "answerB": "fun", "answerC": "cold"})
+
+        self.assertListEqual(
+            load_examples(self.path("dev.csv")),
+            [{"question": "Why?", "context": "Tracy ran.", "choices": ["late", "fun", "cold"]}],
+        )
+
+        with self.assertRaises(ValueError):
+            load_examples(self.path("dev.csv"), fmt="xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
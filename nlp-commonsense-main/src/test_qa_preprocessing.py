@@ -0,0 +1,286 @@
+"""
+unit tests for knowledge extraction, using the phrase matcher instead of spaCy.
+"""
+
+import random
+import unittest
+
+from find_shortest_path import PathCache, find_node_paths, search_top_k_paths
+from phrase_matcher import PhraseMatcher
+import qa_preprocessing
+from qa_preprocessing import *
+from renderer import render_path_natural
+from test_graph_storage import make_graph
+import utils as U
+
+
+def make_random_graph(rng: random.Random, num_nodes: int, num_edges: int) -> U.ConceptNet:
+    nodes = [f"n{i}" for i in range(num_nodes)]
+    adjacency = {i: set() for i in range(num_nodes)}
+    edges = {}
+
+    for row in range(num_edges):
+        a, b = rng.sample(range(num_nodes), 2)
+        if (b, a) in edges:
+            a, b = b, a
+        adjacency[a].add(b)
+        adjacency[b].add(a)
+        # few distinct weights, so that ties occur
+        edges.setdefault((a, b), set()).add(U.EdgeDescriptor(0, rng.choice([0.5, 1.0, 2.0]), row))
+
+    return U.ConceptNet(
+        nodes, {name: idx for idx, name in enumerate(nodes)}, ["/r/RelatedTo"], {"/r/RelatedTo": 0},
+        adjacency, edges
+    )
+
+
+def make_hub_graph(num_leaves: int =2000) -> U.ConceptNet:
+    # dog - person, and person is a hub with many leaves
+    nodes = ["dog", "person", *(f"n{i}" for i in range(num_leaves))]
+    adjacency = {0: {1}, 1: {0, *range(2, num_leaves + 2)}}
+    edges = {(0, 1): {U.EdgeDescriptor(0, 1.0, 0)}}
+    for leaf in range(2, num_leaves + 2):
+        adjacency[leaf] = {1}
+        edges[(leaf, 1)] = {U.EdgeDescriptor(0, 1.0, leaf)}
+
+    return U.ConceptNet(
+        nodes, {name: idx for idx, name in enumerate(nodes)}, ["/r/RelatedTo"], {"/r/RelatedTo": 0},
+        adjacency, edges
+    )
+
+
+class CountingMatcher(PhraseMatcher):
+    # counts how often it is pickled, i.e. sent to a worker process
+    pickled = 0
+
+    def __getstate__(self):
+        CountingMatcher.pickled += 1
+        return self.__dict__
+
+
+def select_all(paths, graph, max_paths):
+    # reference: render every path, sort all of them, then cut
+    rendered = [render_path_natural(p, graph) for p in paths]
+    rendered = [r for r in rendered if r[0]]
+
+    if len(rendered) >= max_paths:
+        rendered.sort(key=lambda x: U.prod(x[1]), reverse=True)
+        rendered.sort(key=lambda x: len(x[1]))
+
+    return rendered[:max_paths]
+
+
+class KnowledgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = make_graph()
+        self.matcher = PhraseMatcher.from_graph(self.graph, normalize=str.casefold)
+
+    def test_choices(self):
+
+        choices = ["a dog", "an animal", "nothing", "dog and animal"]
+
+        for paths_per_pair in (1, 2):
+            shared = get_knowledge_for_choices(
+                "The café", choices, self.graph, 3, raw_output=True,
+                paths_per_pair=paths_per_pair, matcher=self.matcher
+            )
+
+            self.assertListEqual(
+                shared,
+                [
+                    get_knowledge_for_example(
+                        "The café", choice, self.graph, 3, raw_output=True,
+                        paths_per_pair=paths_per_pair, matcher=self.matcher
+                    )
+                    for choice in choices
+                ],
+            )
+
+        self.assertEqual([len(paths) for paths in shared], [1, 1, 0, 2])
+
+    def test_selection_random(self):
+
+        rng = random.Random(0)
+
+        for _ in range(30):
+            graph = make_random_graph(rng, 30, 60)
+            matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+            premise = " ".join(rng.sample(graph.nodes_idx2name, 4))
+            choices = [" ".join(rng.sample(graph.nodes_idx2name, 3)) for _ in range(3)]
+            max_paths = rng.randint(1, 5)
+
+            p_nodes = matcher.extract(premise)
+
+            def knowledge(**kwargs):
+                return get_knowledge_for_choices(
+                    premise, choices, graph, max_paths, raw_output=True, matcher=matcher, **kwargs
+                )
+
+            results = knowledge(weighted=False)
+            top_k_results = knowledge(paths_per_pair=2)
+            unweighted_top_k_results = knowledge(paths_per_pair=2, weighted=False)
+
+            # the work budget applies to top-k searches as well. Pairs are then searched in another 
+            # order, so tied paths may be exchanged
+            def ranks(results):
+                return [sorted((len(w), U.prod(w)) for _, w in result) for result in results]
+
+            budget_results, partial = knowledge(
+                paths_per_pair=2, max_expansions=10**6, return_partial=True
+            )
+            self.assertFalse(partial)
+            self.assertListEqual(ranks(budget_results), ranks(top_k_results))
+            self.assertTrue(knowledge(paths_per_pair=2, max_expansions=1, return_partial=True)[1])
+
+            for choice, result, top_k_result, unweighted_top_k_result in zip(
+                choices, results, top_k_results, unweighted_top_k_results
+            ):
+                c_nodes = matcher.extract(choice)
+
+                # the shared search may pick other shortest paths, so only the lengths have to agree
+                shortest = find_node_paths(p_nodes, c_nodes, graph).values()
+                self.assertListEqual(
+                    [len(w) for _, w in result],
+                    [len(w) for _, w in select_all(shortest, graph, max_paths)],
+                )
+
+                for weights, expected in (
+                    (U.neighbour_weights(graph), top_k_result),
+                    (U.unit_weights(graph), unweighted_top_k_result),
+                ):
+                    candidates = [
+                        p
+                        for s in p_nodes
+                        for e in c_nodes
+                        for p in search_top_k_paths(s, e, graph.adjacency_lists, weights, 2)
+                    ]
+                    self.assertListEqual(expected, select_all(candidates, graph, max_paths))
+
+    def test_examples_multiprocessing(self):
+
+        rng = random.Random(3)
+        graph = make_random_graph(rng, 40, 80)
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+        names = graph.nodes_idx2name
+        examples = [
+            (" ".join(rng.sample(names, 4)), " ".join(rng.sample(names, 3))) for _ in range(20)
+        ]
+
+        serial = get_knowledge_for_examples(examples, graph, n_workers=1, matcher=matcher)
+        self.assertEqual(len(serial), len(examples))
+        self.assertTrue(any(serial))
+
+        # the graph of an enclosing call survives the pool
+        previous = qa_preprocessing._worker_graph
+        qa_preprocessing._worker_graph = "enclosing"
+        try:
+            parallel = get_knowledge_for_examples(
+                examples, graph, n_workers=2, chunksize=3, matcher=matcher
+            )
+            self.assertListEqual(parallel, serial)
+            self.assertEqual(qa_preprocessing._worker_graph, "enclosing")
+        finally:
+            qa_preprocessing._worker_graph = previous
+
+        # the arguments are sent to each worker once, not with every chunk
+        counting = CountingMatcher.from_graph(graph, normalize=str.casefold)
+        CountingMatcher.pickled = 0
+        self.assertListEqual(
+            get_knowledge_for_examples(examples, graph, n_workers=2, chunksize=2, matcher=counting),
+            serial
+        )
+        self.assertLessEqual(CountingMatcher.pickled, 2)
+
+        # entries the workers add to the path cache reach the cache of the caller
+        serial_cache, parallel_cache = PathCache(), PathCache()
+        get_knowledge_for_examples(examples, graph, n_workers=1, matcher=matcher, cache=serial_cache)
+        get_knowledge_for_examples(
+            examples, graph, n_workers=2, chunksize=3, matcher=matcher, cache=parallel_cache
+        )
+        self.assertGreater(len(serial_cache), 0)
+        self.assertSetEqual(set(parallel_cache._entries), set(serial_cache._entries))
+        self.assertIsNone(parallel_cache._journal)
+
+    def test_deadline(self):
+
+        rng = random.Random(1)
+        graph = make_random_graph(rng, 40, 80)
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+        premise = " ".join(graph.nodes_idx2name[:6])
+        choices = [" ".join(graph.nodes_idx2name[10:15]), " ".join(graph.nodes_idx2name[20:25])]
+
+        for weighted in (False, True):
+            complete = get_knowledge_for_choices(
+                premise, choices, graph, 3, raw_output=True, weighted=weighted, matcher=matcher
+            )
+            results, partial = get_knowledge_for_choices(
+                premise, choices, graph, 3, raw_output=True, weighted=weighted, matcher=matcher,
+                deadline=60, return_partial=True
+            )
+
+            self.assertFalse(partial)
+            for result, expected in zip(results, complete):
+                self.assertListEqual([len(w) for _, w in result], [len(w) for _, w in expected])
+
+        # no time at all: nothing is searched, but the call still returns
+        self.assertTupleEqual(
+            get_knowledge_for_example(premise, choices[0], graph, 3, matcher=matcher, deadline=0, return_partial=True),
+            ("", True)
+        )
+
+        result, partial = get_knowledge_for_example(
+            premise, choices[0], graph, 3, matcher=matcher, max_expansions=1, return_partial=True
+        )
+        self.assertTrue(partial)
+
+    def test_deadline_hub(self):
+
+        # a direct edge into a hub is found with a budget far below the degree of the hub
+        graph = make_hub_graph()
+
+        for weighted in (False, True):
+            expected, partial = get_knowledge_for_nodes({0}, [{1}], graph, 3, weighted=weighted)
+            self.assertListEqual(expected, ["dog is like person."])
+            self.assertFalse(partial)
+
+            for limits in ({"max_expansions": 10}, {"deadline": 60}):
+                self.assertTupleEqual(
+                    get_knowledge_for_nodes({0}, [{1}], graph, 3, weighted=weighted, **limits),
+                    (expected, False)
+                )
+
+    def test_deadline_cache(self):
+
+        rng = random.Random(2)
+        graph = make_random_graph(rng, 40, 80)
+        matcher = PhraseMatcher.from_graph(graph, normalize=str.casefold)
+        premise = " ".join(graph.nodes_idx2name[:6])
+        choices = [" ".join(graph.nodes_idx2name[10:15]), " ".join(graph.nodes_idx2name[20:25])]
+
+        for weighted in (False, True):
+            def knowledge(cache, **kwargs):
+                return get_knowledge_for_choices(
+                    premise, choices, graph, 3, weighted=weighted, matcher=matcher, cache=cache,
+                    **kwargs
+                )
+
+            complete = PathCache()
+            expected = knowledge(complete, deadline=60)
+            self.assertGreater(len(complete), 0)
+
+            # complete results are stored and reused
+            hits = complete.hits
+            self.assertListEqual(knowledge(complete, deadline=60), expected)
+            self.assertGreater(complete.hits, hits)
+
+            # searches cut short by the expansion limit are not stored
+            limited = PathCache()
+            self.assertTrue(knowledge(limited, max_expansions=4, return_partial=True)[1])
+            self.assertLess(len(limited), len(complete))
+            for key in list(limited._entries):
+                self.assertEqual(len(limited.get(key)), len(complete.get(key)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+unit tests for the graph helpers, normalization and lazy loading in `utils`.
+"""
+
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from graph_storage import load_graph_dir, load_string_map, save_graph_dir, save_string_map
+from test_graph_storage import make_graph
+import utils as U
+
+
+class UtilsTest(unittest.TestCase):
+
+    def test_best_edge(self):
+
+        graph = make_graph()
+        store = U.to_edge_store(graph)
+
+        self.assertIsInstance(store.edge_descriptors, U.EdgeStore)
+
+        for a, neighbours in graph.adjacency_lists.items():
+            for b in neighbours:
+                self.assertEqual(
+                    U.lookup_best_edge(store, a, b), U.lookup_best_edge(graph, a, b)
+                )
+
+        self.assertEqual(U.lookup_best_edge(store, 1, 3), (U.EdgeDescriptor(0, 2.0, 0), True))
+        self.assertEqual(U.lookup_best_edge(store, 3, 4), (U.EdgeDescriptor(1, 1.0, 2), False))
+
+        with self.assertRaises(ValueError):
+            U.lookup_best_edge(store, 1, 2)
+
+    def test_neighbour_weights(self):
+
+        graph = make_graph()
+        compact = U.to_edge_store(U.to_csr_adjacency(graph))
+
+        for reverse in (False, True):
+            weights = U.neighbour_weights(graph, reverse=reverse)
+            compact_weights = U.neighbour_weights(compact, reverse=reverse)
+
+            for node, neighbours in graph.adjacency_lists.items():
+                expected = dict(zip(neighbours, weights(node)))
+                self.assertDictEqual(
+                    dict(zip(compact.adjacency_lists[node], compact_weights(node))), expected
+                )
+
+        self.assertListEqual(U.neighbour_weights(compact)(4), [5.0])
+        self.assertListEqual(U.neighbour_weights(compact, reverse=True)(4), [1.0])
+
+    def test_rank_neighbours_by_weight(self):
+
+        graph = make_graph()
+        compact = U.to_edge_store(U.to_csr_adjacency(graph))
+
+        # weights from node 3: animal (1) 2.0, café (2) 0.25 reversed, bark (4) 1.0
+        self.assertListEqual(U.rank_neighbours_by_weight(graph).adjacency_lists[3], [1, 4, 2])
+        self.assertListEqual(U.rank_neighbours_by_weight(compact).adjacency_lists[3], [1, 4, 2])
+
+    def test_fingerprint(self):
+
+        graph = make_graph()
+        fingerprint = U.graph_fingerprint(graph)
+
+        self.assertEqual(U.graph_fingerprint(make_graph()), fingerprint)
+
+        # same sizes and names, but another weight
+        changed = make_graph()
+        changed.edge_descriptors[(3, 4)] = {U.EdgeDescriptor(1, 2.0, 2)}
+        self.assertNotEqual(U.graph_fingerprint(changed), fingerprint)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_graph_dir(graph, tmp)
+            self.assertEqual(
+                U.graph_fingerprint(load_graph_dir(tmp)), U.graph_fingerprint(load_graph_dir(tmp))
+            )
+
+        # memoized fingerprints do not keep their graph alive
+        key = id(graph)
+        self.assertIn(key, U._fingerprints)
+        del graph
+        self.assertNotIn(key, U._fingerprints)
+
+    def test_lemma_table(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            save_string_map({"dogs": "dog", "café": "café", "drawstring bag": "drawstring bag"}, tmp)
+            table = load_string_map(tmp)
+
+            self.assertEqual(len(table), 3)
+            self.assertEqual(table["dogs"], "dog")
+            self.assertIsNone(table.get("cats"))
+
+            U.set_lemma_table(table)
+            try:
+                # known forms never reach the lemmatizer
+                self.assertEqual(U.normalize_input("Dogs"), "dog")
+                self.assertEqual(U.normalize_conceptnet("/c/en/drawstring_bag/n"), "drawstring bag")
+
+                # repeated forms are memo hits, the table is not searched again
+                hits = U.lemmatize.cache_info().hits
+                self.assertEqual(U.normalize_input("Dogs"), "dog")
+                self.assertEqual(U.lemmatize.cache_info().hits, hits + 1)
+
+                # a new table invalidates the memo
+                U.set_lemma_table({"dogs": "hound"})
+                self.assertEqual(U.normalize_input("Dogs"), "hound")
+            finally:
+                U.set_lemma_table({})
+
+    def test_lazy_imports(self):
+
+        # importing must neither load the NLP libraries nor download anything
+        code = (
+            "import sys, qa_preprocessing; "
+            "assert 'nltk' not in sys.modules and 'spacy' not in sys.modules"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
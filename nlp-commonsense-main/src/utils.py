@@ -4,19 +4,26 @@ structures for representing ConceptNet, normalization functions and a helper to
 pickle.
 """
 
-from dataclasses import dataclass
-from functools import reduce
+from collections.abc import Mapping as MappingABC
+from dataclasses import dataclass, replace
+from functools import lru_cache, reduce
+import hashlib
+from itertools import islice
 import operator
-from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+import os
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple, 
+    Union
+)
+import weakref
 
-import nltk
-from nltk.stem import WordNetLemmatizer
-import joblib
+import numpy as np
 
-nltk.download("wordnet")
-nltk.download('omw-1.4')
+# created on first use by `_get_lemmatizer`, importing this module must not load NLTK
+__lemmatizer = None
 
-__lemmatizer = WordNetLemmatizer()
+# surface form -> lemma, built by `prepare_data.py` for all ConceptNet nodes (see `set_lemma_table`)
+__lemma_table: Mapping[str, str] = {}
 
 
 class EdgeDescriptor(NamedTuple):
@@ -37,6 +44,238 @@ class EdgeDescriptor(NamedTuple):
     row_idx : int
 
 
+@dataclass
+class CSRAdjacency:
+    """Compressed sparse row (CSR) representation of undirected adjacency lists. The neighbours of 
+    node `i` are `indices[indptr[i]:indptr[i + 1]]`, sorted ascending (unless reordered by 
+    `rank_neighbours_by_weight`). Compared to a dict of sets 
+    this needs two flat int32 arrays instead of millions of Python objects.
+
+    Indexing with a node index returns its neighbours as a list of Python ints, so an instance can be 
+    used wherever a `Dict[int, Set[int]]` is iterated (e.g. `search_shortest_path`).
+
+    Attributes
+    ----------
+    indptr:
+        int32 array of length `num_nodes + 1`, row offsets into `indices`
+    indices:
+        int32 array of neighbour indices of all nodes, concatenated
+    """
+
+    indptr : np.ndarray
+    indices : np.ndarray
+
+    @classmethod
+    def from_adjacency_lists(
+        cls, adjacency_lists: Mapping[int, Iterable[int]], num_nodes: int
+    ) -> "CSRAdjacency":
+        """Build a CSR adjacency from a mapping of node index to neighbour indices."""
+
+        degrees = np.zeros(num_nodes, dtype=np.int64)
+        for node, neighbours in adjacency_lists.items():
+            degrees[node] = len(neighbours)
+
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        for node, neighbours in adjacency_lists.items():
+            indices[indptr[node]:indptr[node + 1]] = sorted(neighbours)
+
+        return cls(indptr.astype(np.int32), indices)
+
+    @classmethod
+    def from_edges(cls, starts: np.ndarray, ends: np.ndarray, num_nodes: int) -> "CSRAdjacency":
+        """Build an undirected CSR adjacency from arrays of edge end points. Duplicate edges are 
+        merged, like adding them to a dict of sets."""
+
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        keys = np.unique(np.concatenate([starts * num_nodes + ends, ends * num_nodes + starts]))
+        rows, neighbours = np.divmod(keys, num_nodes)
+
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+
+        return cls(indptr.astype(np.int32), neighbours.astype(np.int32))
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    def __len__(self) -> int:
+        return self.num_nodes
+
+    def __contains__(self, node: int) -> bool:
+        return 0 <= node < self.num_nodes
+
+    def __getitem__(self, node: int) -> List[int]:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def neighbours(self, node: int) -> np.ndarray:
+        """neighbours of `node` as a read-only view into `indices` (no copy)."""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def degree(self, node: int) -> int:
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+
+@dataclass(eq=False)
+class EdgeStore(MappingABC):
+    """Columnar representation of `ConceptNet.edge_descriptors`. Each directed ConceptNet edge is a 
+    row in four parallel arrays, sorted by the pair key `start_idx * num_nodes + end_idx`. Lookups 
+    use binary search on `pair_keys`, so no per-edge Python objects are kept in memory.
+
+    The class behaves like the original `Dict[Tuple[int, int], Set[EdgeDescriptor]]`, i.e. 
+    `(a, b) in store` and `store[(a, b)]` work as before.
+
+    Additionally, the edge a renderer shows for each adjacent pair of nodes is precomputed (see 
+    `compute_best_edges`), so `best_edge` needs a single binary search instead of materializing 
+    descriptor sets for both orientations.
+
+    Attributes
+    ----------
+    pair_keys:
+        int64 pair keys, sorted ascending (one entry per edge, pairs with several edges repeat)
+    label_idx:
+        label index of each edge
+    weight:
+        weight of each edge
+    row_idx:
+        row of each edge in "en_edges.csv"
+    num_nodes:
+        number of nodes in the graph, needed to compute pair keys
+    best_keys:
+        sorted int64 keys of all adjacent (undirected) node pairs, both orientations
+    best_edge:
+        for each entry of `best_keys` the position of the best edge in the columnar arrays
+    best_reversed:
+        for each entry of `best_keys` whether the best edge points in the opposite direction
+    """
+
+    pair_keys : np.ndarray
+    label_idx : np.ndarray
+    weight : np.ndarray
+    row_idx : np.ndarray
+    num_nodes : int
+
+    best_keys : Optional[np.ndarray] = None
+    best_edge : Optional[np.ndarray] = None
+    best_reversed : Optional[np.ndarray] = None
+
+    @classmethod
+    def from_edge_descriptors(
+        cls, edge_descriptors: Mapping[Tuple[int, int], Iterable[EdgeDescriptor]], num_nodes: int
+    ) -> "EdgeStore":
+        """Build a columnar store from a dict of `EdgeDescriptor` sets."""
+
+        starts, ends, labels, weights, rows = [], [], [], [], []
+        for (start_idx, end_idx), edges in edge_descriptors.items():
+            for e in edges:
+                starts.append(start_idx)
+                ends.append(end_idx)
+                labels.append(e.label_idx)
+                weights.append(e.weight)
+                rows.append(e.row_idx)
+
+        return cls.from_arrays(starts, ends, labels, weights, rows, num_nodes)
+
+    @classmethod
+    def from_arrays(
+        cls, starts: np.ndarray, ends: np.ndarray, label_idx: np.ndarray, weight: np.ndarray, 
+        row_idx: np.ndarray, num_nodes: int
+    ) -> "EdgeStore":
+        """Build a columnar store from parallel arrays with one entry per directed edge."""
+
+        keys = np.asarray(starts, dtype=np.int64) * num_nodes + np.asarray(ends, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+
+        store = cls(
+            keys[order],
+            np.asarray(label_idx, dtype=np.int32)[order],
+            np.asarray(weight, dtype=np.float64)[order],
+            np.asarray(row_idx, dtype=np.int64)[order],
+            num_nodes,
+        )
+        store.compute_best_edges()
+
+        return store
+
+    def compute_best_edges(self):
+        """Precompute the best edge and its orientation for every adjacent pair of nodes. This 
+        mirrors the lookup the renderers used to do: edges stored as (a, b) are preferred, only if 
+        there are none, the reversed edges (b, a) are used. Among those, the edge with the highest 
+        weight wins.
+        """
+
+        n = self.num_nodes
+        starts, ends = np.divmod(self.pair_keys, n)
+        num_edges = len(self.pair_keys)
+
+        keys = np.concatenate([self.pair_keys, ends * n + starts])
+        reversed_ = np.concatenate([np.zeros(num_edges, dtype=bool), np.ones(num_edges, dtype=bool)])
+        positions = np.concatenate([np.arange(num_edges), np.arange(num_edges)])
+        weights = np.concatenate([self.weight, self.weight])
+
+        # sort by key, forward edges first, then by descending weight and take the first per key
+        order = np.lexsort((-weights, reversed_, keys))
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+
+        self.best_keys = keys[first]
+        self.best_edge = positions[order][first]
+        self.best_reversed = reversed_[order][first]
+
+    def best_edge_for(self, start_idx: int, end_idx: int) -> Tuple[EdgeDescriptor, bool]:
+        """Best edge between two adjacent nodes and whether it is reversed (i.e. stored as 
+        (end_idx, start_idx)). Raises KeyError if the nodes are not adjacent."""
+
+        if self.best_keys is None:
+            self.compute_best_edges()
+
+        key = start_idx * self.num_nodes + end_idx
+        pos = int(np.searchsorted(self.best_keys, key))
+        if pos == len(self.best_keys) or self.best_keys[pos] != key:
+            raise KeyError((start_idx, end_idx))
+
+        edge = int(self.best_edge[pos])
+        return (
+            EdgeDescriptor(int(self.label_idx[edge]), float(self.weight[edge]), int(self.row_idx[edge])),
+            bool(self.best_reversed[pos]),
+        )
+
+    def _span(self, pair: Tuple[int, int]) -> Tuple[int, int]:
+        key = pair[0] * self.num_nodes + pair[1]
+        lo = int(np.searchsorted(self.pair_keys, key, side="left"))
+        hi = int(np.searchsorted(self.pair_keys, key, side="right"))
+        return lo, hi
+
+    def __contains__(self, pair) -> bool:
+        lo, hi = self._span(pair)
+        return hi > lo
+
+    def __getitem__(self, pair: Tuple[int, int]) -> Set[EdgeDescriptor]:
+        lo, hi = self._span(pair)
+        if hi == lo:
+            raise KeyError(pair)
+
+        return {
+            EdgeDescriptor(int(label), float(weight), int(row))
+            for label, weight, row in zip(
+                self.label_idx[lo:hi], self.weight[lo:hi], self.row_idx[lo:hi]
+            )
+        }
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for key in np.unique(self.pair_keys).tolist():
+            yield divmod(key, self.num_nodes)
+
+    def __len__(self) -> int:
+        return len(np.unique(self.pair_keys))
+
+
 @dataclass
 class ConceptNet:
     """This class contains the filtered and processed representation of the ConceptNet knowledge 
@@ -57,19 +296,215 @@ class ConceptNet:
 
     adjacency_lists:
         contains a list of neighbors for each node (indices are used). graph is represented as 
-        undirected.
+        undirected. Either a dict of sets or a `CSRAdjacency` (see `to_csr_adjacency`).
     edge_descriptors:
-        maps a pair of indices to all direct edges in ConceptNet between this two nodes. edges are described via EdgeDescriptors. Edges are treated as *directed* here, i.e. if an edge is in `adjacency_lists`, but not in `edge_descriptors` it is an edge not originally present in ConceptNet and one must look up the reverse edge in `edge_descriptor`.
+        (a dict or an `EdgeStore`) maps a pair of indices to all direct edges in ConceptNet between this two nodes. edges are described via EdgeDescriptors. Edges are treated as *directed* here, i.e. if an edge is in `adjacency_lists`, but not in `edge_descriptors` it is an edge not originally present in ConceptNet and one must look up the reverse edge in `edge_descriptor`.
     """
 
-    nodes_idx2name : List[str]
-    nodes_name2idx : Dict[str, int]
+    nodes_idx2name : Sequence[str]
+    nodes_name2idx : Mapping[str, int]
 
     labels_idx2name : List[str]
     labels_name2idx : Dict[str, int]
 
-    adjacency_lists : Dict[int, Set[int]]
-    edge_descriptors : Dict[Tuple[int, int], Set[EdgeDescriptor]]
+    adjacency_lists : Union[Dict[int, Set[int]], CSRAdjacency]
+    edge_descriptors : Union[Dict[Tuple[int, int], Set[EdgeDescriptor]], EdgeStore]
+
+def to_csr_adjacency(graph: ConceptNet) -> ConceptNet:
+    """Return a copy of `graph` whose `adjacency_lists` are stored as a `CSRAdjacency`. All other 
+    attributes are shared with `graph`. Graphs that already use CSR are returned unchanged.
+    """
+
+    if isinstance(graph.adjacency_lists, CSRAdjacency):
+        return graph
+
+    csr = CSRAdjacency.from_adjacency_lists(graph.adjacency_lists, len(graph.nodes_idx2name))
+
+    return replace(graph, adjacency_lists=csr)
+
+def to_edge_store(graph: ConceptNet) -> ConceptNet:
+    """Return a copy of `graph` whose `edge_descriptors` are stored as a columnar `EdgeStore`. All 
+    other attributes are shared with `graph`.
+    """
+
+    if isinstance(graph.edge_descriptors, EdgeStore):
+        return graph
+
+    store = EdgeStore.from_edge_descriptors(graph.edge_descriptors, len(graph.nodes_idx2name))
+
+    return replace(graph, edge_descriptors=store)
+
+def lookup_best_edge(graph: ConceptNet, start_idx: int, end_idx: int) -> Tuple[EdgeDescriptor, bool]:
+    """Return the edge used to describe the step from `start_idx` to `end_idx` in a path, and 
+    whether it is reversed (the ConceptNet edge points from `end_idx` to `start_idx`). Edges in 
+    path direction are preferred, among those the one with the highest weight is selected.
+    """
+
+    if isinstance(graph.edge_descriptors, EdgeStore):
+        try:
+            return graph.edge_descriptors.best_edge_for(start_idx, end_idx)
+        except KeyError:
+            pass
+    elif (start_idx, end_idx) in graph.edge_descriptors:
+        return max(graph.edge_descriptors[(start_idx, end_idx)], key=lambda x: x.weight), False
+    elif (end_idx, start_idx) in graph.edge_descriptors:
+        return max(graph.edge_descriptors[(end_idx, start_idx)], key=lambda x: x.weight), True
+
+    raise ValueError(
+        f"Illegal State: edge descriptors missing for edge present in graph ({end_idx}, {start_idx})"
+    )
+
+def path_weights(graph: ConceptNet, path: Sequence[int]) -> List[float]:
+    """weights of the edges `render_path_natural` uses to describe `path`, without rendering it."""
+    return [lookup_best_edge(graph, a, b)[0].weight for a, b in zip(path, path[1:])]
+
+def neighbour_weights(graph: ConceptNet, reverse: bool =False) -> Callable[[int], List[float]]:
+    """Return a function that maps a node to the weights of the best edges (see `lookup_best_edge`)
+    to all of its neighbours, in the order of `graph.adjacency_lists[node]`. For array-backed graphs
+    the weights of all neighbours are looked up with a single vectorized binary search.
+
+    Parameters
+    ----------
+    graph : ConceptNet
+        graph to look up weights in
+    reverse : bool, optional
+        weights of the edges from the neighbours to the node instead, by default False
+    """
+
+    adjacency = graph.adjacency_lists
+    edges = graph.edge_descriptors
+
+    if isinstance(adjacency, CSRAdjacency) and isinstance(edges, EdgeStore):
+        if edges.best_keys is None:
+            edges.compute_best_edges()
+
+        n = edges.num_nodes
+
+        def weights(node: int) -> List[float]:
+            neighbours = adjacency.neighbours(node).astype(np.int64)
+            keys = neighbours * n + node if reverse else node * n + neighbours
+            return edges.weight[edges.best_edge[np.searchsorted(edges.best_keys, keys)]].tolist()
+
+        return weights
+
+    def weights(node: int) -> List[float]:
+        return [
+            lookup_best_edge(graph, *((nb, node) if reverse else (node, nb)))[0].weight
+            for nb in adjacency[node]
+        ]
+
+    return weights
+
+def unit_weights(graph: ConceptNet) -> Callable[[int], List[float]]:
+    """Like `neighbour_weights`, but every edge has weight 1.0, so weighted searches only rank 
+    paths by their number of nodes."""
+
+    adjacency = graph.adjacency_lists
+
+    def weights(node: int) -> List[float]:
+        return [1.0] * len(adjacency[node])
+
+    return weights
+
+def rank_neighbours_by_weight(graph: ConceptNet) -> ConceptNet:
+    """Return a copy of `graph` whose adjacency lists are ordered by descending weight of the best 
+    edge to each neighbour. Searches that cap the number of neighbours per node (see 
+    `find_shortest_path.search_shortest_path`) then follow the strongest edges of hubs first.
+    """
+
+    adjacency = graph.adjacency_lists
+    weights = neighbour_weights(graph)
+
+    if isinstance(adjacency, CSRAdjacency) and isinstance(graph.edge_descriptors, EdgeStore):
+        store = graph.edge_descriptors
+        rows = np.repeat(np.arange(adjacency.num_nodes, dtype=np.int64), np.diff(adjacency.indptr))
+        keys = rows * store.num_nodes + adjacency.indices
+        slot_weights = store.weight[store.best_edge[np.searchsorted(store.best_keys, keys)]]
+
+        # NaN weights are ranked last
+        order = np.lexsort((-np.nan_to_num(slot_weights, nan=-np.inf), rows))
+
+        return replace(graph, adjacency_lists=CSRAdjacency(adjacency.indptr, adjacency.indices[order]))
+
+    ranked = {}
+    for node in (range(len(adjacency)) if isinstance(adjacency, CSRAdjacency) else adjacency):
+        pairs = sorted(zip(adjacency[node], weights(node)), key=lambda x: -np.nan_to_num(x[1], nan=-np.inf))
+        ranked[node] = [nb for nb, _ in pairs]
+
+    return replace(graph, adjacency_lists=ranked)
+
+# results of `ranked_by_weight` by id of the graph (None if the graph is ranked already), entries 
+# are removed when their graph is garbage collected
+_ranked_graphs = {}
+
+def ranked_by_weight(graph: ConceptNet) -> ConceptNet:
+    """`rank_neighbours_by_weight`, memoized per graph object. Graphs whose CSR adjacency is ranked 
+    already (e.g. loaded from a graph directory, see `graph_storage.save_graph_dir`) are returned 
+    as they are, so their memory-mapped arrays are not copied.
+    """
+
+    if id(graph) in _ranked_graphs:
+        ranked = _ranked_graphs[id(graph)]
+        return graph if ranked is None else ranked
+
+    ranked = rank_neighbours_by_weight(graph)
+    adjacency = graph.adjacency_lists
+    if isinstance(adjacency, CSRAdjacency) and np.array_equal(
+        ranked.adjacency_lists.indices, adjacency.indices
+    ):
+        ranked = None
+
+    _ranked_graphs[id(graph)] = ranked
+    weakref.finalize(graph, _ranked_graphs.pop, id(graph), None)
+
+    return graph if ranked is None else ranked
+
+# fingerprints by id of the graph, entries are removed when their graph is garbage collected
+_fingerprints = {}
+
+def graph_fingerprint(graph: ConceptNet) -> str:
+    """Return a short hash that identifies `graph`, e.g. to invalidate caches of search results when 
+    the graph is rebuilt. It is computed from all node names, labels, adjacency lists and edges, 
+    and memoized per graph object (graphs are not expected to change after loading). Equal graphs 
+    with the same representation (dicts or arrays) get the same fingerprint.
+    """
+
+    cached = _fingerprints.get(id(graph))
+    if cached is not None:
+        return cached
+
+    h = hashlib.sha1()
+    num_nodes = len(graph.nodes_idx2name)
+
+    names = iter(graph.nodes_idx2name)
+    for _ in range(0, num_nodes, 2**16):
+        h.update("\n".join(islice(names, 2**16)).encode("utf-8") + b"\n")
+    h.update(repr(list(graph.labels_idx2name)).encode("utf-8"))
+
+    adjacency = graph.adjacency_lists
+    if isinstance(adjacency, CSRAdjacency):
+        h.update(np.ascontiguousarray(adjacency.indptr, dtype=np.int64))
+        h.update(np.ascontiguousarray(adjacency.indices, dtype=np.int32))
+    else:
+        for node in sorted(adjacency):
+            # sets have no meaningful order, ranked lists do (see `rank_neighbours_by_weight`)
+            neighbours = adjacency[node]
+            neighbours = neighbours if isinstance(neighbours, list) else sorted(neighbours)
+            h.update(np.asarray([node, len(neighbours), *neighbours], dtype=np.int64))
+
+    edges = graph.edge_descriptors
+    if not isinstance(edges, EdgeStore):
+        edges = EdgeStore.from_edge_descriptors(edges, num_nodes)
+    h.update(np.ascontiguousarray(edges.pair_keys, dtype=np.int64))
+    h.update(np.ascontiguousarray(edges.label_idx, dtype=np.int32))
+    h.update(np.ascontiguousarray(edges.weight, dtype=np.float64))
+    h.update(np.ascontiguousarray(edges.row_idx, dtype=np.int64))
+
+    fingerprint = h.hexdigest()[:16]
+    _fingerprints[id(graph)] = fingerprint
+    weakref.finalize(graph, _fingerprints.pop, id(graph), None)
+
+    return fingerprint
 
 def removeprefix(s: str, prefix: str) -> str:
     if s.startswith(prefix):
@@ -77,6 +512,70 @@ def removeprefix(s: str, prefix: str) -> str:
     else:
         return s
 
+def removesuffix(s: str, suffix: str) -> str:
+    if suffix and s.endswith(suffix):
+        return s[:-len(suffix)]
+    else:
+        return s
+
+def set_lemma_table(table: Mapping[str, str]):
+    """Install a precomputed mapping from casefolded surface forms to lemmas. Normalization looks up 
+    the table first and only calls the lemmatizer for unknown forms. `load_conceptnet` installs the 
+    table written by `prepare_data.py` automatically."""
+
+    global __lemma_table
+    __lemma_table = table
+    lemmatize.cache_clear()
+
+def download_nltk_data():
+    """Download the NLTK resources needed for lemmatization. This is never done implicitly."""
+
+    import nltk
+
+    nltk.download("wordnet")
+    nltk.download('omw-1.4')
+
+def _get_lemmatizer():
+    global __lemmatizer
+
+    if __lemmatizer is None:
+        import nltk
+        from nltk.stem import WordNetLemmatizer
+
+        try:
+            nltk.data.find("corpora/wordnet")
+        except LookupError:
+            raise LookupError(
+                "WordNet data for lemmatization is missing, run `utils.download_nltk_data()` once"
+            ) from None
+
+        __lemmatizer = WordNetLemmatizer()
+
+    return __lemmatizer
+
+@lru_cache(maxsize=2**18)
+def lemmatize(s: str) -> str:
+    """Lemmatize a casefolded string, using the lemma table before falling back to the WordNet 
+    lemmatizer. Both lookups are behind a bounded memo cache, as a lookup in the memory-mapped 
+    table is a binary search in Python and much slower than a memo hit."""
+
+    lemma = __lemma_table.get(s)
+    if lemma is None:
+        lemma = _get_lemmatizer().lemmatize(s)
+
+    return lemma
+
+def conceptnet_surface_form(s: str) -> str:
+    """The part of `normalize_conceptnet` before lemmatization: strip prefix and POS tag, replace 
+    underscores and casefold."""
+
+    s = removeprefix(s, "/c/en/")
+    s = s.split("/")[0] # remove the optionally added (/n, /v, ...)
+    s = s.replace("_", " ")
+    s = s.casefold()
+
+    return s
+
 def normalize_conceptnet(s: str) -> str:
     """Normalize a ConceptNet node to ensure that matching between example words and nodes in 
     ConceptNet works.
@@ -92,11 +591,8 @@ def normalize_conceptnet(s: str) -> str:
         normalized string
     """
 
-    s = removeprefix(s, "/c/en/")
-    s = s.split("/")[0] # remove the optionally added (/n, /v, ...)
-    s = s.replace("_", " ")
-    s = s.casefold()
-    s = __lemmatizer.lemmatize(s)
+    s = conceptnet_surface_form(s)
+    s = lemmatize(s)
 
     return s
 
@@ -117,16 +613,36 @@ def normalize_input(s: str) -> str:
     # TODO switch to Spacy lemmatization
 
     s = s.casefold()
-    s = __lemmatizer.lemmatize(s)
+    s = lemmatize(s)
 
     return s
 
 def prod(vals: Iterable[float]) -> float:
     return reduce(operator.mul, vals, 1)
 
-def load_conceptnet(load_compressed: bool =False) -> ConceptNet:
+def load_conceptnet(load_compressed: bool =False, csr: bool =False) -> ConceptNet:
+    """Load ConceptNet. If the memory-mapped graph directory written by `prepare_data.py` exists 
+    (see `graph_storage`), it is opened without copying the graph into memory. Otherwise the joblib 
+    pickle is loaded. The lemma table written by `prepare_data.py` is installed if present (see 
+    `set_lemma_table`). If `csr` is set, the adjacency lists and edge descriptors of a pickled graph 
+    are converted to `CSRAdjacency` and `EdgeStore` after loading (graph directories always use 
+    the array-backed representation).
+    """
 
-    if load_compressed:
-        return joblib.load("../data/processed/graph_representation_compressed.joblib")
-    else:
-        return joblib.load("../data/processed/graph_representation.joblib")
+    import graph_storage
+    import joblib
+
+    name = "graph_representation_compressed" if load_compressed else "graph_representation"
+
+    if os.path.isdir("../data/processed/lemma_table"):
+        set_lemma_table(graph_storage.load_string_map("../data/processed/lemma_table"))
+
+    if graph_storage.is_graph_dir(f"../data/processed/{name}"):
+        return graph_storage.load_graph_dir(f"../data/processed/{name}")
+
+    graph = joblib.load(f"../data/processed/{name}.joblib")
+
+    if csr:
+        graph = to_edge_store(to_csr_adjacency(graph))
+
+    return graph